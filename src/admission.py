@@ -0,0 +1,132 @@
+# ==== Libraries ====
+import threading
+from concurrent.futures import Future
+
+from chats import CHATS
+from conf.settings import ADMIT_COMMANDS, ADMIT_USER_RATE, ADMIT_USER_BURST, ADMIT_COMMAND_RATE, ADMIT_COMMAND_BURST
+from metrics import count
+from ratelimit import TokenBucket
+# ===================
+
+# ==== Admission ====
+class Admission:
+    """ ADMISSION = ADMISSION(COMMANDS, USER_RATE, USER_BURST, COMMAND_RATE, COMMAND_BURST; NOTICE_INTERVAL)
+
+        Admission control of the restricted commands: a call is admitted if its user is in the
+        access list of the chat (see CHATS.ALLOWED) and, for the expensive COMMANDS only, there
+        are tokens in both the bucket of the user (USER_RATE calls per second, over all these
+        commands) and the bucket of the command in that chat (COMMAND_RATE calls per second).
+        The other commands (e.g. the ones storing purchases) are never throttled. Rejected
+        calls are counted in the metrics of the command, by reason. Buckets are only created
+        for allowed users, so a flood of unknown ones costs no memory.
+    """
+
+    def __init__(self, commands, user_rate, user_burst, command_rate, command_burst, notice_interval=10.0):
+        self.commands      = frozenset(commands)
+        self.user_rate     = user_rate
+        self.user_burst    = user_burst
+        self.command_rate  = command_rate
+        self.command_burst = command_burst
+
+        self._users    = {}     # User id ~> TokenBucket
+        self._commands = {}     # (Command, chat id) ~> TokenBucket
+        self._notices  = {}     # Chat id ~> TokenBucket of the "too many requests" notices
+        self._notice   = (1/notice_interval, 1)
+        self._lock     = threading.Lock()
+
+    def _bucket(self, buckets, key, rate, burst):
+        bucket = buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = buckets.setdefault(key, TokenBucket(rate, burst))
+
+        return bucket
+
+    def admit(self, name, chat_id, user_id):
+        """ WAIT = ADMISSION.ADMIT(NAME, CHAT_ID, USER_ID)
+
+            Checks whether USER_ID may run the command NAME in the chat CHAT_ID right now,
+            taking a token of each of its buckets if so (and none otherwise). Returns 0 if the call is admitted,
+            None if the user is not allowed in the chat, or else how many seconds to WAIT
+            until it would be.
+        """
+        if not CHATS.allowed(chat_id, user_id):
+            count(name, 'unauthorized')
+            return None
+
+        if name not in self.commands:
+            return 0
+
+        user    = self._bucket(self._users, user_id, self.user_rate, self.user_burst)
+        command = self._bucket(self._commands, (name, chat_id), self.command_rate, self.command_burst)
+
+        # Both buckets are checked before taking from either, so a rejected call costs no token
+        with self._lock:
+            waits = (user.delay(), command.delay())
+            if not any(waits):
+                user.take()
+                command.take()
+                return 0
+
+        count(name, 'throttled_user' if waits[0] else 'throttled_command')
+        return max(waits)
+
+    def notify(self, chat_id):
+        """ OK = ADMISSION.NOTIFY(CHAT_ID)
+
+            Whether the chat CHAT_ID may be told that a call was throttled (at most once every
+            NOTICE_INTERVAL seconds, so a flood of calls does not become a flood of replies).
+        """
+        return self._bucket(self._notices, chat_id, *self._notice).take()
+# --
+
+ADMISSION = Admission(ADMIT_COMMANDS, ADMIT_USER_RATE, ADMIT_USER_BURST, ADMIT_COMMAND_RATE, ADMIT_COMMAND_BURST)
+# --
+# ===================
+
+# ==== Single Flight ====
+class SingleFlight:
+    """ FLIGHTS = SINGLEFLIGHT()
+
+        Collapses identical calls in flight: while the computation of a KEY runs, the other
+        calls with the same KEY wait for it and share its result (or its exception) instead of
+        computing it again. Nothing is kept once the computation ends.
+    """
+
+    def __init__(self):
+        self._flights = {}  # Key ~> Future of its result
+        self._lock    = threading.Lock()
+
+    def do(self, key, func, name=None):
+        """ RESULT = FLIGHTS.DO(KEY, FUNC; NAME)
+
+            Returns the RESULT of FUNC(), or of the call of the same KEY already in flight
+            (which is counted as a 'collapsed' event of the handler NAME, if given).
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Future()
+
+        if not leader:
+            if name is not None:
+                count(name, 'collapsed')
+            return flight.result()
+
+        try:
+            result = func()
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+# --
+
+FLIGHTS = SingleFlight()
+# --
+# ===================
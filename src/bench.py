@@ -0,0 +1,393 @@
+# ==== Libraries ====
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from collections import OrderedDict
+from datetime import datetime
+from time import perf_counter
+
+# The handlers only need these to be set; no request ever reaches Telegram
+os.environ.setdefault("TELEGRAM_TOKEN", "0:offline-benchmark")
+os.environ.setdefault("GROUP_ID", "-1000")
+os.environ.setdefault("MINHO_ID", "1001")
+os.environ.setdefault("MARIANA_ID", "1002")
+os.environ.setdefault("RENDER_PROCESSES", "0")     # Renders in-process, so they are measured
+for limit in ("OUTBOX_RATE", "OUTBOX_CHAT_RATE", "OUTBOX_GROUP_RATE"):
+    os.environ.setdefault(limit, "0")               # The fake bot has no flood limits
+
+import commands
+from chats import CHATS
+from conf.settings import MINHO_ID, GROUP_ID, TABLE_PAGE_ROWS
+from ledger import append_purchases, ledger_path
+# ===================
+
+# ==== Global Variables ====
+# A chat of its own for the streams that need a small month (the others fill the household one)
+RENDER_CHAT = -2000
+# ==========================
+
+# ==== Fake Telegram objects ====
+class FakePhotoSize:
+    def __init__(self, file_id):
+        self.file_id = file_id
+# --
+
+class FakeMessage:
+    def __init__(self, chat_id, text=None, photo=None):
+        self.chat_id = chat_id
+        self.text    = text
+        self.photo   = [FakePhotoSize(photo)] if photo is not None else []
+# --
+
+class FakeBot:
+    """ BOT = FAKEBOT()
+
+        Stands for telegram.Bot: every message is recorded in BOT.SENT instead of being sent.
+    """
+
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(('message', chat_id, text))
+        return FakeMessage(chat_id, text=text)
+
+    def send_photo(self, chat_id, photo, **kwargs):
+        if hasattr(photo, 'read'):
+            photo.read()    # Reading the file is part of what an upload costs
+            file_id = "file-{0}".format(len(self.sent))
+        else:
+            file_id = photo
+
+        self.sent.append(('photo', chat_id, kwargs.get('caption')))
+        return FakeMessage(chat_id, photo=file_id)
+
+    sendPhoto = send_photo
+# --
+
+class FakeUser:
+    def __init__(self, id):
+        self.id = id
+# --
+
+class FakeChat:
+    def __init__(self, id):
+        self.id = id
+# --
+
+class FakeUpdate:
+    def __init__(self, text, chat_id=GROUP_ID, user_id=MINHO_ID):
+        self.effective_chat = FakeChat(chat_id)
+        self.effective_user = FakeUser(user_id)
+        self.message        = FakeMessage(chat_id, text=text)
+        self.effective_message = self.message
+# --
+
+class FakeContext:
+    def __init__(self, bot, args):
+        self.bot  = bot
+        self.args = args
+        self.job_queue = None
+# --
+# ===================
+
+# ==== Command streams ====
+def stream_compra(n):
+    # N purchases, spread over a few categories
+    categories = ("Food", "Casa", "Pets", "Transporte")
+    for i in range(n):
+        yield commands.compra, "/compra item{0} {1:.2f} {2}".format(i, 1+(i % 97)*0.5, categories[i % 4])
+# --
+
+def stream_compra_bulk(n, lines=50):
+    # N messages with LINES purchases each (a supermarket trip)
+    categories = ("Food", "Casa", "Pets", "Transporte")
+    for i in range(n):
+        yield commands.compra, "/compra\n" + "\n".join("item {0} {1} {2:.2f} {3}".format(i, j, 1+(j % 97)*0.5, categories[j % 4])
+                                                     for j in range(lines))
+# --
+
+def stream_list_compras(n, rows=5000):
+    # A month with ROWS purchases listed N times; every 10th call follows a new purchase
+    #   (so both the cached and the freshly rendered paths are measured). Such a long month
+    #   is listed as text pages: see STREAM_LIST_COMPRAS_PNG for the table image
+    today = datetime.today().strftime("%d/%m/%Y")
+    append_purchases(ledger_path(), [("seed{0}".format(i), "{0:.2f}".format(i % 50), "Food", today) for i in range(rows)])
+
+    for i in range(n):
+        if i % 10 == 0:
+            commands.add_purchase(CHATS.get(GROUP_ID), "extra{0}".format(i), "1.00", "Casa")
+        yield commands.list_compras, "/list_compras"
+# --
+
+def stream_list_compras_png(n, rows=10):
+    # Same as STREAM_LIST_COMPRAS for a month short enough to be rendered as a table image, in
+    #   the RENDER_CHAT; new purchases stop before the month would be listed as text pages
+    chat = CHATS.get(RENDER_CHAT)
+    commands.add_purchases(chat, [("seed{0}".format(i), "{0:.2f}".format(1+i), "Food") for i in range(rows)])
+
+    for i in range(n):
+        if i % 10 == 0 and rows + i//10 < TABLE_PAGE_ROWS:
+            commands.add_purchase(chat, "extra{0}".format(i), "1.00", "Casa")
+        yield commands.list_compras, "/list_compras"
+# --
+
+def stream_busca(n):
+    # N searches, each one right after the purchase it should find (so the purchases added
+    #   live, not only the ones read from the store, are searched)
+    for i in range(n):
+        yield commands.compra, "/compra Café{0} {1:.2f} Food".format(i, 1+(i % 97)*0.5)
+        yield commands.busca, "/busca cafe{0}".format(i)
+# --
+
+def stream_falta(n, size=2000):
+    # Adds SIZE items in batches of 50, lists them N times and removes everything in batches
+    names = ["item{0}".format(i) for i in range(size)]
+    for i in range(0, size, 50):
+        yield commands.falta, "/falta " + " ".join(names[i:i+50])
+    for _ in range(n):
+        yield commands.falta, "/falta"
+    for i in range(0, size, 50):
+        yield commands.falta_remove, "/falta_remove " + " ".join(names[i:i+50])
+# --
+
+def stream_misc(n):
+    # The cheap commands
+    for i in range(n):
+        yield commands.start, "/start"
+        yield commands.agua, "/agua"
+        yield commands.agua, "/agua " + ("no" if i % 2 else "yes")
+        yield commands.foto, "/foto"
+# --
+
+STREAMS = OrderedDict([
+    ('compra',           (stream_compra,           10000)),
+    ('compra_bulk',      (stream_compra_bulk,      200)),
+    ('list_compras',     (stream_list_compras,     30)),
+    ('list_compras_png', (stream_list_compras_png, 30)),
+    ('busca',            (stream_busca,            500)),
+    ('falta',            (stream_falta,            200)),
+    ('misc',             (stream_misc,             500)),
+])
+
+# The streams sent to another chat than the household group
+STREAM_CHATS = {'list_compras_png': RENDER_CHAT}
+# ===================
+
+# ==== Functions ====
+def setup_workdir():
+    """ FOLDER = SETUP_WORKDIR()
+
+        Creates a temporary FOLDER with the layout the bot expects (data/, tmp/, res/dogs/),
+        where MINHO_ID may also use the RENDER_CHAT, and makes it the working directory.
+    """
+    folder = tempfile.mkdtemp(prefix="corgibench_")
+    for sub in ("data", "tmp", os.path.join("res", "dogs")):
+        os.makedirs(os.path.join(folder, sub))
+
+    with open(os.path.join(folder, "data", "acl.json"), "w") as f:
+        json.dump({str(RENDER_CHAT): [MINHO_ID]}, f)
+
+    for i in range(8):
+        with open(os.path.join(folder, "res", "dogs", "dog{0}.jpg".format(i)), "wb") as f:
+            f.write(os.urandom(64*1024))
+
+    os.chdir(folder)
+    return folder
+# --
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered)-1, int(q*len(ordered)))] if ordered else 0.0
+# --
+
+def run_stream(name, n, alloc_samples):
+    """ RESULTS = RUN_STREAM(NAME, N, ALLOC_SAMPLES)
+
+        Replays the stream NAME (with size N) against the real handlers and returns, for each
+        handler, its latency percentiles, how many calls raised, and the peak memory allocated
+        by a call. The first ALLOC_SAMPLES calls of each handler are traced with tracemalloc
+        (after the timed pass, so tracing does not skew the timings).
+        Unless the outbox is in sync mode, the replies are sent by its workers and the latencies
+        do not include them; the outbox is drained after each pass.
+    """
+    generator, _ = STREAMS[name]
+    chat_id = STREAM_CHATS.get(name, GROUP_ID)
+    bot = FakeBot()
+
+    calls = [(handler, text) for handler, text in generator(n)]
+    timings, traced, errors = OrderedDict(), OrderedDict(), OrderedDict()
+
+    for handler, text in calls:
+        context = FakeContext(bot, text.split()[1:])
+        t = perf_counter()
+        try:
+            handler(FakeUpdate(text, chat_id), context)
+        except Exception:
+            errors[handler.__name__] = errors.get(handler.__name__, 0) + 1
+        timings.setdefault(handler.__name__, []).append(perf_counter()-t)
+    commands.OUTBOX.drain()
+
+    for handler, text in calls:
+        samples = traced.setdefault(handler.__name__, [])
+        if len(samples) >= alloc_samples:
+            continue
+
+        # Tracing restarts for every call, so the peak is the one of that call only
+        tracemalloc.start()
+        try:
+            handler(FakeUpdate(text, chat_id), FakeContext(bot, text.split()[1:]))
+        except Exception:
+            pass
+        samples.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    commands.OUTBOX.drain()
+
+    results = OrderedDict()
+    for handler, values in timings.items():
+        results[handler] = OrderedDict([
+            ('calls',     len(values)),
+            ('errors',    errors.get(handler, 0)),
+            ('mean_ms',   1e3*sum(values)/len(values)),
+            ('p50_ms',    1e3*percentile(values, .50)),
+            ('p95_ms',    1e3*percentile(values, .95)),
+            ('p99_ms',    1e3*percentile(values, .99)),
+            ('peak_alloc_kib', max(traced.get(handler, [0]))/1024),
+        ])
+
+    return results
+# --
+
+def compare(results, baseline, threshold):
+    """ REGRESSIONS = COMPARE(RESULTS, BASELINE, THRESHOLD)
+
+        Prints the change of every measure against BASELINE and returns how many latencies
+        (p50/p95) got worse by more than THRESHOLD (a fraction).
+    """
+    regressions = 0
+    for stream, handlers in results['streams'].items():
+        for handler, measures in handlers.items():
+            old = baseline.get('streams', {}).get(stream, {}).get(handler)
+            if old is None:
+                continue
+
+            for key in ('p50_ms', 'p95_ms', 'peak_alloc_kib'):
+                if not old.get(key):
+                    continue
+                change = measures[key]/old[key]-1
+                flag   = ""
+                if key != 'peak_alloc_kib' and change > threshold:
+                    flag = "  <-- REGRESSION"
+                    regressions += 1
+                print("{0:<14} {1:<14} {2:<15} {3:>10.2f} -> {4:>10.2f} ({5:+.1%}){6}".format(
+                        stream, handler, key, old[key], measures[key], change, flag))
+
+    return regressions
+# --
+
+def bench_markup(n):
+    """ RESULTS = BENCH_MARKUP(N)
+
+        Times N formattings of the /compra reply (in microseconds per message): with the
+        replace-based escaping the replies used before, escaping the filled markup in one
+        pass (MARKDOWNFY) and with the compiled template (which also escapes the arguments).
+    """
+    def replace_markdownfy(sentence):
+        for ch in ":().!?|-+_=":
+            sentence = sentence.replace(ch, '\\{0}'.format(ch))
+        return sentence
+
+    markup = commands.COMPRA_DONE.markup.replace("{1:.2f}", "{1}")
+    args   = ("Pão de queijo (6 un.)", "12.50", "Food")
+    ways   = OrderedDict([
+        ('replace',    lambda: replace_markdownfy(markup.format(*args))),
+        ('translate',  lambda: commands.markdownfy(markup.format(*args))),
+        ('template',   lambda: commands.COMPRA_DONE.format(args[0], 12.5, args[2])),
+    ])
+
+    results = OrderedDict()
+    for name, way in ways.items():
+        t = perf_counter()
+        for _ in range(n):
+            way()
+        results[name + "_us"] = 1e6*(perf_counter()-t)/n
+
+    return results
+# --
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+# --
+# ===================
+
+# ===== MAIN =====
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replays synthetic command streams against the bot handlers, offline.")
+    parser.add_argument("streams", nargs="*", default=list(STREAMS), help="streams to run: " + ", ".join(STREAMS))
+    parser.add_argument("-n", type=int, default=None, help="size of every stream (default: per stream)")
+    parser.add_argument("--alloc-samples", type=int, default=50, help="calls per handler traced for allocations")
+    parser.add_argument("--save", metavar="FILE", help="saves the results (e.g. as a baseline) in FILE")
+    parser.add_argument("--compare", metavar="FILE", help="compares the results with a baseline FILE")
+    parser.add_argument("--threshold", type=float, default=0.2, help="latency increase flagged as regression (0.2 = 20%%)")
+    parser.add_argument("--keep", action="store_true", help="keeps the temporary data folder")
+    parser.add_argument("--sync", action="store_true", help="sends the replies inside the handlers (bypassing the outbox queue)")
+    parser.add_argument("--markup", type=int, default=0, metavar="N", help="also times N formattings of a reply (per message)")
+    args = parser.parse_args(argv)
+
+    # Paths given by the user are relative to where the benchmark was started
+    save     = os.path.abspath(args.save) if args.save else None
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    folder   = setup_workdir()
+    commands.OUTBOX.sync = args.sync
+
+    results = OrderedDict([('commit', git_commit()), ('date', datetime.now().isoformat()),
+                           ('outbox', "sync" if args.sync else "queue"), ('streams', OrderedDict())])
+    try:
+        for name in args.streams:
+            n = args.n if args.n is not None else STREAMS[name][1]
+            results['streams'][name] = run_stream(name, n, args.alloc_samples)
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+            print("== {0} (n={1}, peak RSS so far {2:.1f} MiB) ==".format(name, n, rss))
+            for handler, m in results['streams'][name].items():
+                print("  {0:<14} {1:>6} calls {2:>4} errors  mean {3:8.2f}ms  p50 {4:8.2f}ms  p95 {5:8.2f}ms  p99 {6:8.2f}ms  peak alloc {7:9.1f}KiB".format(
+                        handler, m['calls'], m['errors'], m['mean_ms'], m['p50_ms'], m['p95_ms'], m['p99_ms'], m['peak_alloc_kib']))
+
+        if args.markup:
+            results['markup'] = bench_markup(args.markup)
+            print("== markup (n={0}) ==".format(args.markup))
+            print("  " + "  ".join("{0} {1:.2f}".format(key, value) for key, value in results['markup'].items()))
+
+        results['peak_rss_mib'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    finally:
+        CHATS.flush()
+        if not args.keep:
+            os.chdir(tempfile.gettempdir())
+            shutil.rmtree(folder, ignore_errors=True)
+
+    if save:
+        with open(save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if baseline:
+        with open(baseline) as f:
+            return 1 if compare(results, json.load(f), args.threshold) else 0
+
+    return 0
+# --
+
+# ===================
+if __name__ == '__main__':
+    sys.exit(main())
+# ===================
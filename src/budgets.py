@@ -0,0 +1,74 @@
+# ==== Libraries ====
+import json
+import threading
+import traceback
+
+from fileio import FileCache, atomic_write
+# ===================
+
+# ==== Budgets ====
+class Budgets(FileCache):
+    """ BUDGETS = BUDGETS(PATH)
+
+        The monthly budget of each purchase category, saved as JSON in PATH
+            {"CATEGORY": LIMIT, ...}
+    """
+
+    _CACHE = '_limits'
+
+    def __init__(self, path):
+        self.path = path
+
+        self._limits = None
+        self._lock   = threading.Lock()
+
+    def _load(self):
+        # Must be called with the lock held
+        if self._limits is None:
+            try:
+                with open(self.path, "r") as f:
+                    self._limits = {type: float(limit) for type, limit in json.load(f).items()}
+            except FileNotFoundError:
+                self._limits = {}
+            except (ValueError, TypeError, AttributeError):    # Broken file: the budgets are lost
+                traceback.print_exc()
+                self._limits = {}
+
+        return self._limits
+
+    def items(self):
+        """ LIST = BUDGETS.ITEMS()
+
+            Returns the (CATEGORY, LIMIT) budgets, sorted by category.
+        """
+        with self._lock:
+            return sorted(self._load().items())
+
+    def set(self, type, limit):
+        """ BUDGETS.SET(TYPE, LIMIT)
+
+            Changes (and saves) the monthly budget of the category TYPE; a LIMIT of 0 (or
+            None) removes it.
+        """
+        with self._lock:
+            limits = self._load()
+            if limit:
+                limits[type] = float(limit)
+            else:
+                limits.pop(type, None)
+
+            atomic_write(self.path, json.dumps(limits, indent=1, sort_keys=True).encode("utf-8"))
+
+    def crossed(self, before, after):
+        """ LIST = BUDGETS.CROSSED(BEFORE, AFTER)
+
+            Compares the totals by category (dicts of TYPE ~> TOTAL) BEFORE and AFTER some
+            purchases, returning the (TYPE, TOTAL, LIMIT) of the categories that went over
+            their budget with them.
+        """
+        with self._lock:
+            limits = self._load()
+            return [(type, total, limits[type]) for type, total in sorted(after.items())
+                    if type in limits and before.get(type, 0.0) <= limits[type] < total]
+# --
+# ===================
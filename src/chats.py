@@ -0,0 +1,205 @@
+# ==== Libraries ====
+import json
+import os
+import threading
+
+from budgets import Budgets
+from conf.settings import GROUP_ID, MARIANA_ID, MINHO_ID
+from ledger import DATA_DIR
+from missing import MissingItems
+from purchases import get_store
+from search import SearchIndex
+from state import StateStore
+# ===================
+
+# ==== Global Variables ====
+CHATS_DIR = os.path.join(DATA_DIR, "chats")
+ACL_FILE  = os.path.join(DATA_DIR, "acl.json")
+
+# The original household: the group and the private chats of its members share the main data
+#   folder, and any of them (or the group itself) may use the restricted commands
+HOUSEHOLD = frozenset([GROUP_ID, MARIANA_ID, MINHO_ID])
+
+# The state of a chat before it is ever changed: there is water (AGUA 1), a refil costs
+#   AGUA_PRICE (as of 11/08/2020, R$4.50) and the daily AGUA_REMINDER is on
+STATE_DEFAULTS = {'agua': 1, 'agua_price': 4.50, 'agua_reminder': True}
+
+# The parts of a chat kept in a warm-restart snapshot (see SNAPSHOT.PY)
+SNAPSHOT_PARTS = ('state', 'budgets', 'missing', 'search', 'store')
+# ==========================
+
+# ==== Functions ====
+def load_acl(path=ACL_FILE):
+    """ ACL = LOAD_ACL(PATH)
+
+        Reads the access list of every chat from the JSON file in PATH, in the form
+            {"CHAT_ID": [USER_ID, ...], ...}
+        and returns it as a dict of CHAT_ID ~> frozenset of USER_IDs (the original household
+        is always included).
+    """
+    acl = {chat_id: HOUSEHOLD for chat_id in HOUSEHOLD}
+    try:
+        with open(path, "r") as f:
+            for chat_id, users in json.load(f).items():
+                acl[int(chat_id)] = frozenset(int(user) for user in users)
+
+    except FileNotFoundError:
+        pass
+
+    return acl
+# --
+
+def migrate_agua(folder, state):
+    """ MIGRATE_AGUA(FOLDER, STATE)
+
+        Moves the AGUA status of the old 'agua_status' file of FOLDER into the STATE of the
+        chat, if it was not there yet (an empty or broken file is ignored).
+    """
+    path = os.path.join(folder, "agua_status")
+    if not os.path.exists(path) or 'agua' in state:
+        return
+
+    try:
+        with open(path, "r") as f:
+            state.set(agua=int(f.read()))
+    except ValueError:
+        pass
+
+    os.remove(path)
+# --
+
+def chat_folder(chat_id):
+    """ FOLDER = CHAT_FOLDER(CHAT_ID)
+
+        Returns the data FOLDER of a chat: the main one for the original household, otherwise
+        'data/chats/CHAT_ID'.
+    """
+    return DATA_DIR if chat_id in HOUSEHOLD else os.path.join(CHATS_DIR, str(chat_id))
+# --
+# ===================
+
+# ==== Chats ====
+class Chat:
+    """ CHAT = CHAT(CHAT_ID)
+
+        The data of a chat (a household): its purchases STORE (and their SEARCH index), its list
+        of MISSING itens, its BUDGETS and its STATE (e.g. the AGUA status, see STATE_DEFAULTS),
+        all kept inside its own data FOLDER. CHAT.LOCK serializes the changes to that chat
+        only, so chats never wait for each other.
+    """
+
+    def __init__(self, chat_id):
+        self.id      = GROUP_ID if chat_id in HOUSEHOLD else chat_id
+        self.folder  = chat_folder(chat_id)
+        self.lock    = threading.RLock()
+        self.missing = MissingItems(os.path.join(self.folder, "falta_itens"))
+        self.budgets = Budgets(os.path.join(self.folder, "budgets.json"))
+        self.search  = SearchIndex(os.path.join(self.folder, "search_index.json"))
+        self.state   = StateStore(os.path.join(self.folder, "state.json"), STATE_DEFAULTS)
+
+    @property
+    def store(self):
+        return get_store(self.folder)
+# --
+
+class Chats:
+    """ CHATS = CHATS(ACL_PATH)
+
+        Registry of the chats served by the bot, with the access list read from ACL_PATH.
+    """
+
+    def __init__(self, acl_path=ACL_FILE):
+        self.acl_path = acl_path
+        self.acl      = None
+
+        self._chats = {}        # Folder ~> Chat (the household chats share one)
+        self._guard = threading.Lock()
+
+    def load(self):
+        """ CHATS.LOAD()
+
+            (Re)reads the access list.
+        """
+        self.acl = load_acl(self.acl_path)
+
+    def allowed(self, chat_id, user_id):
+        """ OK = CHATS.ALLOWED(CHAT_ID, USER_ID)
+
+            Whether USER_ID may use the restricted commands in the chat CHAT_ID.
+        """
+        if self.acl is None:
+            self.load()
+
+        return user_id in self.acl.get(chat_id, ())
+
+    def get(self, chat_id):
+        """ CHAT = CHATS.GET(CHAT_ID)
+
+            Returns the CHAT of CHAT_ID, creating its data folder on first use.
+        """
+        folder = chat_folder(chat_id)
+        chat   = self._chats.get(folder)
+        if chat is None:
+            with self._guard:
+                chat = self._chats.get(folder)
+                if chat is None:
+                    os.makedirs(folder, exist_ok=True)
+                    chat = self._chats[folder] = Chat(chat_id)
+                    migrate_agua(folder, chat.state)
+
+        return chat
+
+    def known(self):
+        """ LIST = CHATS.KNOWN()
+
+            Returns every CHAT with a data folder: the household one and those in CHATS_DIR.
+        """
+        chat_ids = [GROUP_ID]
+        if os.path.isdir(CHATS_DIR):
+            chat_ids += [int(name) for name in sorted(os.listdir(CHATS_DIR)) if name.lstrip("-").isdigit()]
+
+        return [self.get(chat_id) for chat_id in chat_ids]
+
+    def flush(self):
+        """ CHATS.FLUSH()
+
+            Writes the pending changes of every chat.
+        """
+        with self._guard:
+            chats = list(self._chats.values())
+
+        for chat in chats:
+            chat.missing.flush()
+            chat.store.flush()
+            chat.search.flush()
+
+    def snapshot(self):
+        """ DATA = CHATS.SNAPSHOT()
+
+            Returns the in-memory data of every chat used so far (see CHAT), to warm them up
+            after a restart (see RESTORE).
+        """
+        with self._guard:
+            chats = list(self._chats.values())
+
+        return [(chat.id, {part: getattr(chat, part).snapshot() for part in SNAPSHOT_PARTS}) for chat in chats]
+
+    def restore(self, data):
+        """ CHATS.RESTORE(DATA)
+
+            Warms up the chats with a SNAPSHOT (each part checks whether it is still valid).
+            The chats whose data folder no longer exists are skipped.
+        """
+        for chat_id, parts in data:
+            if not os.path.isdir(chat_folder(chat_id)):
+                continue
+
+            chat = self.get(chat_id)
+            for part, part_data in parts.items():
+                if part_data is not None:
+                    getattr(chat, part).restore(part_data)
+# --
+
+CHATS = Chats()
+# --
+# ===================
@@ -1,122 +1,375 @@
 # ==== Libraries ====
 import telegram
-from conf.settings import GROUP_ID, MARIANA_ID, MINHO_ID
 
 from functools import wraps
 from datetime import datetime
-import os
-import six
-
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
+import csv
+import io
+import math
+import re
+
+from admission import ADMISSION, FLIGHTS
+from chats import CHATS
+from purchases import group_totals
+from markup import Template, markdownfy
+from metrics import count, stats_text
+from outbox import OUTBOX, CAPTION_LIMIT
+from photos import DOGS
+from reminders import REMINDERS, parse_reminder
+from conf.settings import ADMIN_IDS, TABLE_MODE, TABLE_PAGE_ROWS
+from render import compras_png, report_png, text_table
+from report import monthly_totals, parse_period, trends
 # ===================
 
 # ==== Global Variables ====
-LIST_OF_ADMINS = [GROUP_ID, MARIANA_ID, MINHO_ID]
-
+MAX_CSV_SIZE = 1024*1024    # Largest CSV document of purchases accepted (in bytes)
+THROTTLED    = "Too many requests :T Please, try again in {0}s."   # Plain text (also a button answer)
+PAGE_STALE   = "This list is out of date, please send /list_compras again."    # Button answer
+MONTH_FORMAT = re.compile(r"^\d{4}-\d{2}$")   # Of the months carried by the buttons ('YYYY-MM')
 # ==========================
 
+# ==== Reply Templates ====
+# The replies in the MARKDOWN_V2 format, compiled once (their {fields} are escaped, see TEMPLATE)
+USAGE_COMPRA    = Template("Something went wrong :(\nPlease, see if you are using the command correctly:\n"
+						   "\t `/compra [name] [price] [category]`")
+COMPRA_DONE     = Template("Thank you!\nThe purchase *{0}* with value *R$ {1:.2f}* was stored within the *{2}* category.\n\n"
+						   "Enter /list_compras to see all shoppings on this month.")
+BULK_ERROR      = Template("Something went wrong :(\nI could not understand the line(s) {0}, so nothing was stored.\n"
+						   "Please, send one purchase per line:\n\t `[name] [price] [category]`")
+BULK_DONE       = Template("Thank you!\nI stored *{0}* purchases:\n")
+BULK_FOOTER     = markdownfy("\n\nEnter /list_compras to see all shoppings on this month.")
+TOTAL_LINE      = Template("*{0}*: R${1:.2f}")
+TOTAL_SUM       = Template("*Total*: R$ {0:.2f}")
+TOTALS_TITLE    = markdownfy("*= Total Expenses =*\n")
+BUDGET_ALERT    = Template("*Budget alert!*\nThe *{0}* expenses of this month reached *R$ {1:.2f}*, over the budget of *R$ {2:.2f}* :O")
+NO_SHOPPINGS    = markdownfy("There are still no shoppings on this month :3")
+LIST_TITLE      = Template("*These are your shoppings until today ({0})*\n\n")
+PAGE_TITLE      = Template("*These are your shoppings of {0}/{1}*\n\n")
+PAGE_NUMBER     = Template("\nPage {0}/{1}\n\n")
+USAGE_BUSCA     = Template("Something went wrong :(\nPlease, see if you are using the command correctly:\n\t `/busca [terms]`")
+BUSCA_TITLE     = markdownfy("*= Shoppings found =*\n")
+BUSCA_LINE      = Template("{0}: *{1}* ({2}), R${3:.2f}")
+BUDGETS_TITLE   = markdownfy("*= Budgets of this month =*\n")
+BUDGET_LINE     = Template("*{0}*: R${1:.2f} of R${2:.2f}")
+USAGE_ORCAMENTO = Template("Something went wrong :(\nPlease, see if you are using the command correctly:\n"
+						   "\t `/orcamento [category] [value]`")
+BUDGET_SET      = Template("Okay!\nThe budget of *{0}* is now *R$ {1:.2f}* per month.")
+BUDGET_REMOVED  = Template("Okay!\nI removed the budget of *{0}*.")
+USAGE_RELATORIO = Template("Something went wrong :(\nPlease, see if you are using the command correctly:\n"
+						   "\t `/relatorio [from] [to] [category]` (e.g. `/relatorio 01/2024 06/2024 Food`)")
+REPORT_TITLE    = Template("*Report of {0}expenses from {1}/{2} to {3}/{4}*\n\n")
+REPORT_TRENDS   = Template("*= Trends =*\n*Total*: R$ {0:.2f}\n*Monthly mean*: R$ {1:.2f}\n*Last month*: R$ {2:.2f}")
+REPORT_SLOPE    = Template("\n*Trend*: {0:+.2f} R$ per month")
+REPORT_CHANGE   = Template(" ({0:+.0%} from the month before)")
+NO_REPORT       = markdownfy("There are no shoppings in this period :3")
+CATEGORY_TITLE  = markdownfy("\n\n*= By category =*\n")
+AGUA_YES        = Template("There is still water at home :3")
+AGUA_NO         = Template("There is *NO* water at home :(")
+AGUA_DONE       = Template("Okay!\nI stopped the daily reminders and registered a purchase with value *R$ {0:.2f}* inside the *Food* category.")
+AGUA_PRICE      = Template("Okay!\nFrom now on, the water costs *R$ {0:.2f}*.")
+AGUA_REMINDER   = Template("Okay!\nThe daily reminder is now *{0}*.")
+USAGE_AGUA      = Template("Something went wrong :(\nPlease, see if you are using the command correctly:\n"
+						   "\t `/agua preco [value]` or `/agua lembrete [on|off]`")
+FALTA_TITLE     = markdownfy("*These are the itens missing in the house:*\n")
+FALTA_LINE      = Template("- {0}")
+FALTA_NONE      = Template("Everything you sent is already on the list of missing itens :)")
+FALTA_ADDED     = Template("Okay.\nI added *{0}* to the list of missing itens :)")
+FALTA_ADDED_ALL = Template("Okay.\nI added these itens to the list of missing itens :)")
+FALTA_NOT_FOUND = Template("Sorry, the item *{0}* is not on the list :T")
+FALTA_REMOVED   = Template("Okay.\nI removed *{0}* from the list of missing itens :)")
+FALTA_REMOVED_ALL = Template("Okay.\nI removed these itens from the list of missing itens :)")
+USAGE_LEMBRETE  = Template("Something went wrong :(\nPlease, see if you are using the command correctly:\n"
+						   "\t `/lembrete [HH:MM] [text]`\n"
+						   "\t `/lembrete [DD/MM/YYYY] [HH:MM] [text]`\n"
+						   "\t `/lembrete daily [HH:MM] [text]`\n"
+						   "\t `/lembrete cron [min] [hour] [day] [month] [weekday] [text]`")
+# =========================
+
 # ==== Wrappers ====
 def restricted(func):
 	""" @RESTRICTED(func)
 
 		A wrapper to restrict the access of a command (or any other function) to the users
-		and groups listed in the LIST_OF_ADMINS global variable.
+		listed in the access list of the chat (see CHATS), and the expensive commands to their
+		rate limits. The wrapped function gets an ADMIT(UPDATE, CONTEXT) attribute, which the
+		worker pools call before queueing the command (see OFFLOAD and ADMISSION), so rejected
+		calls cost no work. Rejections are counted in the metrics of the command (see /stats),
+		not printed; a throttled call is told when to try again (see THROTTLED).
 	"""
+	name = func.__name__
+
+	def admit(update, context):
+		wait = ADMISSION.admit(name, update.effective_chat.id, update.effective_user.id)
+		if wait:
+			throttled(update, context, wait)
+		return wait == 0
+
 	@wraps(func)
 	def wrapped(update, context, *args, **kwargs):
-		user_id = update.effective_user.id
-		if user_id not in LIST_OF_ADMINS:
-			print("Unauthorized access denied for {}.".format(user_id))
+		# (the access list may have changed since the call was admitted)
+		if not CHATS.allowed(update.effective_chat.id, update.effective_user.id):
+			count(name, 'unauthorized')
 			return
 		return func(update, context, *args, **kwargs)
+
+	wrapped.admit = admit
 	return wrapped
 # --
 
-# ===================
-
-# ==== Functions ====
-def markdownfy(sentence):
-	""" S_MV2 = MARKDOWNFY(S)
+def admin_only(func):
+	""" @ADMIN_ONLY(func)
 
-		Receives a string 'S' and converts it to a form that can be parsed within the
-		MARKDOWN_V2 format. The function returns the new string 'S_MV2' with special
-		characters in proper Markdown sintax.
+		A wrapper to restrict a command to the operators of the bot (the ADMIN_IDS setting),
+		whatever the chat, e.g. for the metrics that cover every chat. Like RESTRICTED, it
+		gives the wrapped function an ADMIT(UPDATE, CONTEXT) attribute and counts the rejections.
 	"""
-	for ch in ":().!?|-+_=":
-		sentence = sentence.replace(ch, '\{0}'.format(ch))
+	name = func.__name__
+
+	def admit(update, context):
+		if update.effective_user.id in ADMIN_IDS:
+			return True
+		count(name, 'unauthorized')
+		return False
+
+	@wraps(func)
+	def wrapped(update, context, *args, **kwargs):
+		if not admit(update, context):
+			return
+		return func(update, context, *args, **kwargs)
 
-	return sentence
+	wrapped.admit = admit
+	return wrapped
 # --
 
-def getFiles(folder):
-	""" FILES = GETFILES(FOLDER)
+def throttled(update, context, wait):
+	""" THROTTLED(UPDATE,CONTEXT,WAIT)
+
+		Tells the chat of a throttled call to try again in WAIT seconds (at most once in a
+		while, see ADMISSION.NOTIFY), and answers its button, if it came from one.
+	"""
+	text = THROTTLED.format(math.ceil(wait))
+	if update.callback_query is not None:
+		query = update.callback_query
+		OUTBOX.call(context.bot, update.effective_chat.id, lambda bot, chat_id: query.answer(text=text))
+	elif ADMISSION.notify(update.effective_chat.id):
+		OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id, text=text)
+# --
+
+# ===================
+
+# ==== Functions ====
+def totals_text(costs):
+	""" S_MV2 = TOTALS_TEXT(COSTS)
 
-		Returns a list of strings 'FILES' containing the name of all files within a folder
-		given by the relative path 'FOLDER'.
+		Lists the (TYPE, TOTAL) COSTS by category and their sum, in the MARKDOWN_V2 format.
 	"""
-	return [f for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f))]
+	return ("\n".join([TOTAL_LINE.format(type, cost) for type, cost in costs]) + "\n\n" +
+			TOTAL_SUM.format(sum(cost for _, cost in costs)))
 # --
 
-def add_purchase(name, cost, type):
-	""" ADD_PURCHASE(NAME,COST,TYPE)
+def add_purchase(chat, name, cost, type):
+	""" CROSSED = ADD_PURCHASE(CHAT,NAME,COST,TYPE)
 
-		Enters a new entry in a COMPRAS data file. The new entry is added to the file indicated
-		by the current year and month. Such file is created if still unexistent.
+		Enters a new entry in a COMPRAS data file of the CHAT. The new entry is appended to the file
+		indicated by the current year and month. Such file is created if still unexistent.
 		The new entry is in the form
 			data = {'NAME', 'COST', 'TYPE', 'DATE'}
 		in which 'DATE' is the current day in DD/MM/YYYY format.
+		Returns the budgets CROSSED by the purchase (see ALERT_BUDGETS).
+	"""
+	return add_purchases(chat, [(name, cost, type)])[1]
+# --
+
+def add_purchases(chat, rows):
+	""" DATED_ROWS, CROSSED = ADD_PURCHASES(CHAT,ROWS)
+
+		Same as ADD_PURCHASE for several (NAME, COST, TYPE) ROWS at once, which are all stored
+		with a single write. Returns the DATED_ROWS as they were stored, and the (TYPE, TOTAL, LIMIT)
+		budgets CROSSED by them.
 	"""
 
 	# Auxiliary variables
-	today    = datetime.today().strftime("%d/%m/%Y")
-	filename = "data/compras_"+datetime.today().strftime("%Y-%m")+".csv"
+	today = datetime.today().strftime("%d/%m/%Y")
+	month = datetime.today().strftime("%Y-%m")
+	dated_rows = [(name, cost, type, today) for name, cost, type in rows]
+	crossed = []
 
-	# Creates the dataframe for this new purchase
-	data = {'name': name, 'cost': cost, 'type':type, 'date': today}
-	new_compra_df = pd.DataFrame([data])
+	# Stores the new entries (appended to the file of the month, or inserted in the database),
+	#   comparing the running totals of the month before and after them if there are budgets
+	with chat.lock:
+		check  = chat.budgets.items()
+		before = dict(chat.store.totals(month)) if check else None
+
+		chat.store.add(dated_rows)
+		chat.search.add(chat.store, dated_rows)
+
+		if check:
+			crossed = chat.budgets.crossed(before, dict(chat.store.totals(month)))
+
+	return dated_rows, crossed
+# --
+
+def alert_budgets(bot, chat, crossed):
+	""" ALERT_BUDGETS(BOT,CHAT,CROSSED)
+
+		Alerts the CHAT of every category whose budget was CROSSED (see ADD_PURCHASES).
+	"""
+	for type, total, limit in crossed:
+		OUTBOX.send_message(bot, chat_id=chat.id,
+							text=BUDGET_ALERT.format(type, total, limit), parse_mode=telegram.ParseMode.MARKDOWN_V2)
+# --
+
+def compras_page(store, month, page):
+	""" TEXT, MARKUP = COMPRAS_PAGE(STORE, MONTH, PAGE)
+
+		Creates a PAGE (counted from 0) of the purchases of a 'YYYY-MM' MONTH listed as text
+		(see TEXT_TABLE), with the totals of the month: returns its MarkdownV2 TEXT and the
+		inline keyboard MARKUP to turn the pages (None if there is only one).
+	"""
+	table, pages = text_table(store.month(month), page)
+	page  = min(max(page, 0), pages-1)
+	costs = store.totals(month)
+
+	# Creates the message (the table is escaped by TEXT_TABLE itself)
+	text = (PAGE_TITLE.format(month[5:], month[:4]) + table +
+			PAGE_NUMBER.format(page+1, pages) + TOTALS_TITLE + totals_text(costs))
+
+	# The buttons carry the month and the page they lead to
+	buttons = []
+	if page > 0:
+		buttons.append(telegram.InlineKeyboardButton("◀", callback_data="compras {0} {1}".format(month, page-1)))
+	if page < pages-1:
+		buttons.append(telegram.InlineKeyboardButton("▶", callback_data="compras {0} {1}".format(month, page+1)))
+
+	return text, (telegram.InlineKeyboardMarkup([buttons]) if buttons else None)
+# --
+
+def compras_replies(store, month, today):
+	""" REPLIES = COMPRAS_REPLIES(STORE, MONTH, TODAY)
+
+		Creates the REPLIES (see SEND_REPLIES) of LIST_COMPRAS for a 'YYYY-MM' MONTH: a table
+		image of its purchases with the totals of the month, or its first page as text.
+	"""
+
+	# Retrieves the category-based expenses of the month
+	costs = store.totals(month)
+	if not costs:	# If there are no purchases yet
+		return [(None, NO_SHOPPINGS, None)]
+
+	# Long months are paged as text, since a single image would be too large to be read
+	if TABLE_MODE == 'text' or store.count(month) > TABLE_PAGE_ROWS:
+		text, markup = compras_page(store, month, 0)
+		return [(None, text, markup)]
+
+	# Renders the table visualization (or reuses it, if no purchase was added since)
+	table_png = compras_png(store, month)
+
+	# Creates the response messages
+	response_message1 = LIST_TITLE.format(today)
+	response_message2 = TOTALS_TITLE + totals_text(costs)
+
+	return photo_replies(table_png, response_message1, response_message2)
+# --
+
+def report_replies(store, months, type):
+	""" REPLIES = REPORT_REPLIES(STORE, MONTHS, TYPE)
+
+		Creates the REPLIES (see SEND_REPLIES) of RELATORIO for the 'YYYY-MM' MONTHS and the
+		category TYPE (None for all of them): a chart of the monthly expenses, with their trends.
+	"""
+
+	# The months before the first purchase of the chat are left out of the trends
+	known  = store.months()
+	months = [month for month in months if known and month >= known[0]]
+
+	categories, matrix = monthly_totals(store, months, type)
+	if not months or not matrix.any():	# If there are no purchases in the period
+		return [(None, NO_REPORT, None)]
+
+	# Renders the chart (or reuses it, if the numbers did not change since)
+	report = trends(matrix)
+	chart  = report_png(months, categories, matrix)
 
-	# Stores this purchase in the data
-	try:	# If the file exists
-		compras_df = pd.read_csv(filename)									# Opens the current file
-		compras_df = compras_df.append(new_compra_df, ignore_index=True)	# Appends the new entry to the dataframe
-		compras_df.to_csv(filename, index=False)							# Re-writes the dataframe to the file
+	# Creates the response messages
+	change  = "" if report['change'] is None else REPORT_CHANGE.format(report['change'])
+	response_message1 = REPORT_TITLE.format(type+" " if type else "", months[0][5:], months[0][:4], months[-1][5:], months[-1][:4])
+	response_message2 = (REPORT_TRENDS.format(report['total'], report['mean'], report['last']) + change +
+						 REPORT_SLOPE.format(report['slope']) +
+						 ("" if type else CATEGORY_TITLE +
+							"\n".join([TOTAL_LINE.format(category, total)
+									   for category, total in zip(categories, report['by_category']) if total])))
 
-	except FileNotFoundError: # If the file does not exists
-		new_compra_df.to_csv(filename, index=False) 						# Creates a new file with only the new entry
+	return photo_replies(chart, response_message1, response_message2)
 # --
 
-def render_table(data, col_width=3.0, row_height=0.625, font_size=14, header_color='#40466e', row_colors=['#f1f1f2', 'w'],
-					edge_color='w', bbox=[0, 0, 1, 1], header_columns=0, ax=None, **kwargs):
-	""" AX = RENDER_TABLE(DATA; *args, **kwargs)
+def photo_replies(photo, caption, text):
+	""" REPLIES = PHOTO_REPLIES(PHOTO, CAPTION, TEXT)
 
-		Plots a Pandas DataFrame in a Matplotlib figure using the table annotations.
+		The REPLIES (see SEND_REPLIES) sending the image in the path PHOTO with both CAPTION
+		and TEXT as its caption, or with the TEXT apart if the caption would be too long.
 	"""
+	if len(caption+text) <= CAPTION_LIMIT:
+		return [(photo, caption+text, None)]
 
-	# Resizes the table to fill the entire space and remove the figure axis (if None)
-	if ax is None:
-		size = (np.array(data.shape[::-1]) + np.array([0, 1])) * np.array([col_width, row_height])
-		fig, ax = plt.subplots(figsize=size)
-		ax.axis('off')
-
-	# Annotates the table inside the plot
-	mpl_table = ax.table(cellText=data.values, bbox=bbox, colLabels=list(map(lambda x : x.capitalize(), data.columns)), **kwargs)
-
-	# Customize fonts
-	mpl_table.auto_set_font_size(False)
-	mpl_table.set_fontsize(font_size)
-
-	# Customize the cells face and edge colors
-	for k, cell in  six.iteritems(mpl_table._cells):
-		cell.set_edgecolor(edge_color)
-		if k[0] == 0 or k[1] < header_columns:
-			cell.set_text_props(weight='bold', color='w')
-			cell.set_facecolor(header_color)
+	return [(photo, caption, None), (None, text, None)]
+# --
+
+def send_replies(bot, chat_id, replies):
+	""" SEND_REPLIES(BOT, CHAT_ID, REPLIES)
+
+		Sends the REPLIES to the chat CHAT_ID, in order. Each reply is a (PHOTO, TEXT, MARKUP)
+		tuple in the MARKDOWN_V2 format: a text message with the inline keyboard MARKUP (if not
+		None) or, if PHOTO is the path of an image, that image with TEXT as its caption.
+		Replies are plain data, so the ones of a single computation can go to several callers.
+	"""
+	for photo, text, markup in replies:
+		if photo is None:
+			OUTBOX.send_message(bot, chat_id=chat_id, text=text,
+								parse_mode=telegram.ParseMode.MARKDOWN_V2, reply_markup=markup)
 		else:
-			cell.set_facecolor(row_colors[k[0]%len(row_colors) ])
+			OUTBOX.send_photo(bot, chat_id, photo, caption=text, parse_mode=telegram.ParseMode.MARKDOWN_V2)
+# --
+
+def parse_price(text):
+	""" PRICE = PARSE_PRICE(TEXT)
+
+		Reads a PRICE written with a decimal point or a decimal comma (e.g. '4.50' or '4,50').
+		Raises a ValueError if TEXT is not a finite number (so 'nan' and 'inf' are refused).
+	"""
+	price = float(text.replace(",", "."))
+	if not math.isfinite(price):
+		raise ValueError("not a finite price: "+text)
 
-	return ax
+	return price
+# --
+
+def parse_purchases(lines):
+	""" ROWS, ERRORS = PARSE_PURCHASES(LINES)
+
+		Parses LINES of purchases, each one a list of fields in the form
+			[name ...] [price] [category]
+		(the name may have several words). Returns the purchase ROWS (NAME, COST, TYPE) in the
+		standard form of the data files, and the numbers of the lines with ERRORS. Empty lines
+		are skipped.
+	"""
+	rows, errors = [], []
+
+	for number, fields in enumerate(lines, 1):
+		fields = [" ".join(field.split()) for field in fields if field.strip()]
+		if not fields:
+			continue
+
+		try:
+			assert(len(fields) >= 3)
+			cost = parse_price(fields[-2])
+
+		except (AssertionError, ValueError):
+			errors.append(number)
+			continue
+
+		rows.append((" ".join(fields[:-2]), "{0:.2f}".format(cost), fields[-1].capitalize()))
+
+	return rows, errors
 # --
 
 # ===================
@@ -130,7 +383,7 @@ def start(update, context):
 	"""
 
 	# Sends the message to the chat
-	context.bot.send_message(chat_id=update.effective_chat.id, text="CARAMURU 2000 A LENDA")
+	OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id, text="CARAMURU 2000 A LENDA")
 # --
 
 # Command: /foto
@@ -140,12 +393,8 @@ def foto(update, context):
 		Sends a random picture of a dog from the '/res/dogs/' folder.
 	"""
 
-	# Retrives all the image file names and sample a random index
-	allFiles = getFiles("res/dogs/")
-	idx = np.random.randint(0, len(allFiles))
-
-	# Sends the image to the chat
-	context.bot.sendPhoto(chat_id=update.effective_chat.id, photo=open("res/dogs/"+allFiles[idx], 'rb'))
+	# Samples a picture from the catalog and sends it to the chat (uploaded only the first time)
+	OUTBOX.call(context.bot, update.effective_chat.id, DOGS.send)
 # --
 
 # For any unrecognized command
@@ -156,7 +405,7 @@ def unknown(update, context):
 	"""
 
 	# Sends the message to the chat
-	context.bot.send_message(chat_id=update.effective_chat.id, text="Unknown command :(")
+	OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id, text="Unknown command :(")
 # --
 
 # Command: /compra [args]
@@ -168,43 +417,117 @@ def compra(update, context):
 			/compra [name] [price] [category]
 		where [name] is a short description of the purchase (no spaces), [price] is the cost of
 		the purchase/service, and [category] is a label to group several different purchases.
+		Several purchases can be registered at once with one per line (see COMPRA_BULK).
 	"""
 
+	# Several lines: bulk mode
+	if "\n" in update.effective_message.text.strip():
+		lines = [line.split() for line in update.effective_message.text.strip().split("\n")]
+		compra_bulk(update, context, [lines[0][1:]]+lines[1:])
+		return
+
 	# Retrives the arguments
 	args = context.args
 
-	# %%% Checks if command arguments are okay %%%
+	# %%% Checks if command arguments are okay (in the standard form of the data) %%%
 	try:
 		assert(len(args) == 3)
-		float(args[1])
+		rows, errors = parse_purchases([args])
+		assert(not errors)
+
+	except AssertionError:
+		# Sends the response message
+		OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id,
+									text=USAGE_COMPRA.format(), parse_mode=telegram.ParseMode.MARKDOWN_V2)
+		return
+	# %%%%%%%%%%%%%%%%%%%%%%
+
+	# Creates the dataframe for this new purchase
+	name, cost, type = rows[0]
+	chat = CHATS.get(update.effective_chat.id)
+	crossed = add_purchase(chat, name, cost, type)
 
-	except:
+	# Creates the response message
+	response_message = COMPRA_DONE.format(name, float(cost), type)
+
+	# Sends the message to the chat (and the alerts of the budgets it went over)
+	OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id,
+								text=response_message, parse_mode=telegram.ParseMode.MARKDOWN_V2)
+	alert_budgets(context.bot, chat, crossed)
+# --
+
+# Registers many purchases at once (/compra with several lines, or a CSV document)
+def compra_bulk(update, context, lines):
+	""" COMPRA_BULK(UPDATE,CONTEXT,LINES)
+
+		Registers the purchases of all LINES (lists of fields, see PARSE_PURCHASES) with a single
+		write, answering with one summary of the subtotals by category. The purchases come from
+		a message in the form
+			/compra [name] [price] [category]
+			[name] [price] [category]
+			...
+		or from a CSV document with the columns name, price and category (see COMPRA_CSV). If any
+		line is not valid, nothing is registered.
+	"""
+	rows, errors = parse_purchases(lines)
+
+	# %%% Checks if all the lines are okay %%%
+	if errors or not rows:
 		# Creates the response message
-		response_message = ("Something went wrong :(\n"+
-							"Please, see if you are using the command correctly:\n"+
-							"\t `/compra [name] [price] [category]`").format(*args)
+		response_message = BULK_ERROR.format(", ".join(map(str, errors[:10])) + (" ..." if len(errors) > 10 else ""))
 
 		# Sends the response message
-		context.bot.send_message(chat_id=update.effective_chat.id,
-									text=markdownfy(response_message), parse_mode=telegram.ParseMode.MARKDOWN_V2)
+		OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id,
+									text=response_message, parse_mode=telegram.ParseMode.MARKDOWN_V2)
 		return
 	# %%%%%%%%%%%%%%%%%%%%%%
 
-	# Formats some of the arguments to have a standard form on the data
-	args[1] = "{0:.2f}".format(float(args[1]))
-	args[2] = args[2].capitalize()
-
-	# Creates the dataframe for this new purchase
-	add_purchase(*args)
+	# Stores every purchase with one write
+	chat = CHATS.get(update.effective_chat.id)
+	dated_rows, crossed = add_purchases(chat, rows)
+	costs = group_totals(dated_rows)
 
 	# Creates the response message
-	response_message = ("Thank you!\n"+
-						"The purchase *{0}* with value *R$ {1}* was stored within the *{2}* category.\n\n"+
-						"Enter /list_compras to see all shoppings on this month.").format(*args)
+	response_message = BULK_DONE.format(len(dated_rows)) + totals_text(costs) + BULK_FOOTER
 
-	# Sends the message to the chat
-	context.bot.send_message(chat_id=update.effective_chat.id,
-								text=markdownfy(response_message), parse_mode=telegram.ParseMode.MARKDOWN_V2)
+	# Sends the message to the chat (and the alerts of the budgets it went over)
+	OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id,
+								text=response_message, parse_mode=telegram.ParseMode.MARKDOWN_V2)
+	alert_budgets(context.bot, chat, crossed)
+# --
+
+# Document: a CSV file with the caption /compra
+@restricted
+def compra_csv(update, context):
+	""" COMPRA_CSV(UPDATE,CONTEXT)
+
+		Registers the purchases of a CSV document sent with the caption `/compra`. Each row is
+		in the form
+			[name],[price],[category]
+		and a first row with the column names is skipped.
+	"""
+
+	# Auxiliary variables
+	document = update.message.document
+
+	# Only CSV documents sent with the command are purchases
+	if(not (update.message.caption or "").startswith("/compra") or not (document.file_name or "").lower().endswith(".csv")):
+		return
+
+	if(document.file_size and document.file_size > MAX_CSV_SIZE):
+		OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id, text="Sorry, this file is too big :T")
+		return
+
+	# Downloads the document into memory and reads its rows
+	buffer = io.BytesIO()
+	context.bot.get_file(document.file_id).download(out=buffer)
+	lines = list(csv.reader(io.StringIO(buffer.getvalue().decode("utf-8-sig", errors="replace"))))
+
+	# Skips the header, if any
+	if(lines and len(lines[0]) >= 3 and lines[0][-2].strip().lower() in ("cost", "price", "preco", "preço", "valor")):
+		lines[0] = []
+
+	compra_bulk(update, context, lines)
 # --
 
 # Command: /list_compras
@@ -213,43 +536,176 @@ def list_compras(update, context):
 	""" LIST_COMPRAS(UPDATE,CONTEXT)
 
 		Lists all the purchases done within the current month. This function will retrieve the
-		dataframe from the appropriate COMPRAS data file and generate an image visualizing the
-		entire table. Also the total expenses of the month are given.
+		purchases from the store of the chat (see GET_STORE) and generate an image visualizing
+		the entire table. Also the total expenses of the month are given. Months with more than
+		TABLE_PAGE_ROWS purchases are listed as text pages instead (see LIST_COMPRAS_PAGE).
 	"""
 
 	# Auxiliary variables
-	today    = datetime.today().strftime("%d/%m/%Y")
-	filename = "data/compras_"+datetime.today().strftime("%Y-%m")+".csv"
+	today   = datetime.today().strftime("%d/%m/%Y")
+	month   = datetime.today().strftime("%Y-%m")
+	chat_id = update.effective_chat.id
+	store   = CHATS.get(chat_id).store
+
+	# Requests of the same listing in flight (e.g. a spammed command) share a single
+	#   computation, and each of them gets its replies
+	replies = FLIGHTS.do(("list_compras", chat_id, today), lambda: compras_replies(store, month, today), "list_compras")
+	send_replies(context.bot, chat_id, replies)
+# --
+
+# Button of a page of /list_compras
+@restricted
+def list_compras_page(update, context):
+	""" LIST_COMPRAS_PAGE(UPDATE,CONTEXT)
+
+		Turns the page of a month listed by LIST_COMPRAS, editing its message to show the
+		page asked by the pressed button. Only that page is rendered. Buttons of a page that
+		no longer exists (or with a malformed month) are answered with a notice.
+	"""
+	query = update.callback_query
+	store = CHATS.get(update.effective_chat.id).store
+
+	# Retrieves the month and page from the button, which may be from an old message
+	try:
+		_, month, page = query.data.split()
+		page = int(page)
+		assert(MONTH_FORMAT.match(month) and 0 <= page < max(1, -(-store.count(month)//TABLE_PAGE_ROWS)))
+
+	except (AssertionError, ValueError):
+		OUTBOX.call(context.bot, update.effective_chat.id, lambda bot, chat_id: query.answer(text=PAGE_STALE))
+		return
+
+	OUTBOX.call(context.bot, update.effective_chat.id, lambda bot, chat_id: query.answer())
+
+	text, markup = compras_page(store, month, page)
+	OUTBOX.call(context.bot, update.effective_chat.id,
+				lambda bot, chat_id: query.edit_message_text(text=text, parse_mode=telegram.ParseMode.MARKDOWN_V2,
+															 reply_markup=markup))
+# --
+
+# Command: /busca [terms]
+@restricted
+def busca(update, context):
+	""" BUSCA(UPDATE,CONTEXT)
+
+		Searches the purchases of every month of the chat by their names and categories, in
+		the following way:
+			/busca [terms] ~> Lists the purchases best matching [terms] (words may be
+							  incomplete), with their dates and prices.
+		The search uses the index of the chat (see SEARCHINDEX), so no data file is read.
+	"""
+
+	# Retrives the arguments
+	chat    = CHATS.get(update.effective_chat.id)
+	matches = chat.search.query(chat.store, " ".join(context.args)) if context.args else []
+
+	if(len(context.args) == 0):
+		response_message = USAGE_BUSCA.format()
+
+	elif(len(matches) == 0):
+		OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id, text="I found no shoppings like that :3")
+		return
+
+	else:
+		# Creates the response message (the best match first)
+		response_message = (BUSCA_TITLE +
+							"\n".join([BUSCA_LINE.format(date, name, type, cost) for name, cost, type, date in matches]))
+
+	# Sends the message to the chat
+	OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id,
+								text=response_message, parse_mode=telegram.ParseMode.MARKDOWN_V2)
+# --
 
-	# List the purchases and prints the total expenses
-	try:	# If the file exists
-		# Loads the dataframe and calculates the category-based expenses
-		compras_df = pd.read_csv(filename)
-		costs_df = compras_df.groupby(["type"]).sum().reset_index()
+# Command: /orcamento [args]
+@restricted
+def orcamento(update, context):
+	""" ORCAMENTO(UPDATE,CONTEXT)
+
+		Consults the monthly budgets of the chat, along with the expenses of the current month.
+		The function can also be used to change a budget in the following way:
+			/orcamento [category] [value] ~> Sets the monthly budget of [category] to [value].
+											 The chat is alerted as soon as a purchase goes over it.
+			/orcamento [category] 0 ~> Removes the budget of [category].
+	"""
 
-		# Rendes and save the dataframe visualization
-		render_table(compras_df)
-		plt.savefig('tmp/compras.png', transparent=True, bbox_inches='tight')
+	# Retrives the arguments
+	args = context.args
+	chat = CHATS.get(update.effective_chat.id)
 
-		# Creates the response messages
-		response_message1 = ("*These are your shoppings until today ("+today+")*\n\n")
-		response_message2 = ("*= Total Expenses =*\n" +
-							 "\n".join(["*{0}*: R${1:.2f}".format(r['type'], r['cost']) for i,r in costs_df.iterrows()]) +
-							 "\n\n*Total*: R$ {0:.2f}".format(costs_df.cost.sum()))
+	# ===== `/orcamento` =====
+	if(len(args) == 0):
+		budgets = chat.budgets.items()
+
+		if(len(budgets) == 0):
+			# Sends a message to the chat
+			OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id, text="There are no budgets yet :3")
+			return
+
+		# Creates the response message (with the running totals of the month)
+		costs = dict(chat.store.totals(datetime.today().strftime("%Y-%m")))
+		response_message = (BUDGETS_TITLE +
+							"\n".join([BUDGET_LINE.format(type, costs.get(type, 0.0), limit) for type, limit in budgets]))
 
 		# Sends the message to the chat
-		context.bot.send_message(chat_id=update.effective_chat.id,
-									text=markdownfy(response_message1), parse_mode=telegram.ParseMode.MARKDOWN_V2)
+		OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id,
+									text=response_message, parse_mode=telegram.ParseMode.MARKDOWN_V2)
 
-		context.bot.sendPhoto(chat_id=update.effective_chat.id, photo=open("tmp/compras.png", 'rb'))
+	# ===== `/orcamento [category] [value]` =====
+	else:
+		try:
+			assert(len(args) == 2)
+			limit = parse_price(args[1])
+			assert(limit >= 0)
+
+		except (AssertionError, ValueError):
+			# Sends the response message
+			OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id,
+										text=USAGE_ORCAMENTO.format(), parse_mode=telegram.ParseMode.MARKDOWN_V2)
+			return
+
+		# Changes the budget (categories are stored capitalized, as in /compra)
+		chat.budgets.set(args[0].capitalize(), limit)
 
-		context.bot.send_message(chat_id=update.effective_chat.id,
-									text=markdownfy(response_message2), parse_mode=telegram.ParseMode.MARKDOWN_V2)
+		# Creates the confirmation message accordingly
+		if(limit):
+			response_message = BUDGET_SET.format(args[0].capitalize(), limit)
+		else:
+			response_message = BUDGET_REMOVED.format(args[0].capitalize())
 
-	except FileNotFoundError: # If the file does not exist
 		# Sends the message to the chat
-		context.bot.send_message(chat_id=update.effective_chat.id, text="There are still no shoppings on this month :3")
+		OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id,
+									text=response_message, parse_mode=telegram.ParseMode.MARKDOWN_V2)
+# --
 
+# Command: /relatorio [args]
+@restricted
+def relatorio(update, context):
+	""" RELATORIO(UPDATE,CONTEXT)
+
+		Reports the expenses of a period of months, with their trends and a chart of the
+		monthly expenses by category. The function can be used in the following way:
+			/relatorio ~> Reports the expenses from January until the current month.
+			/relatorio [from] [to] [category] ~> Reports the months from [from] to [to] (in the
+												 MM/YYYY format), only of [category] if given.
+		All the arguments are optional. The totals of each month come from its running totals,
+		so the purchases of the months that did not change are never read again.
+	"""
+
+	# Retrives the arguments
+	store = CHATS.get(update.effective_chat.id).store
+	try:
+		months, type = parse_period(context.args, datetime.today())
+
+	except ValueError:
+		# Sends the response message
+		OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id,
+									text=USAGE_RELATORIO.format(), parse_mode=telegram.ParseMode.MARKDOWN_V2)
+		return
+
+	# Requests of the same report in flight share a single computation (see LIST_COMPRAS)
+	chat_id = update.effective_chat.id
+	replies = FLIGHTS.do(("relatorio", chat_id, tuple(months), type), lambda: report_replies(store, months, type), "relatorio")
+	send_replies(context.bot, chat_id, replies)
 # --
 
 # Command: /agua [args]
@@ -263,58 +719,78 @@ def agua(update, context):
 								 that reminds the chat that one should order more water.
 			/agua [1|yes|sim] ~> Changes the current status to 1 (there is water), disabling the daily reminder,
 								 and also registers a purchase of Água with the proper cost.
+			/agua preco [value] ~> Changes the cost of the water registered by `/agua yes`.
+			/agua lembrete [on|off] ~> Turns the daily reminder on or off.
 
-		(as of 11/08/2020: drinking water at my house costs R$4.50)
+		The status, the cost (R$4.50 by default) and the reminder switch are kept in the STATE of
+		the chat, so no file is read to answer.
 	"""
 
 	# Retrives the arguments
 	args = context.args
+	chat = CHATS.get(update.effective_chat.id)
 
 	# Checks how to respond to the command
 	# ===== `/agua` =====
 	if(len(args) == 0):
-		try:    # If the file exists, opens and checks for the current status
-			with open("data/agua_status", "r") as f:
-				status = int(f.read())
-
-		except FileNotFoundError:   # If the file does not exist, just outputs a default 1 (there is water)
-			status = 1
-
 		# Creates the appropriate response message
-		if(status):
-			response_message = "There is still water at home :3"
+		if(chat.state.get('agua')):
+			response_message = AGUA_YES.format()
 		else:
-			response_message = "There is *NO* water at home :("
+			response_message = AGUA_NO.format()
 
 		# Sends the message to the chat
-		context.bot.send_message(chat_id=update.effective_chat.id,
-									text=markdownfy(response_message), parse_mode=telegram.ParseMode.MARKDOWN_V2)
+		OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id,
+									text=response_message, parse_mode=telegram.ParseMode.MARKDOWN_V2)
 
 	# ===== `/agua [no/yes]` =====
 	elif(len(args) == 1):
 		if(args[0].lower() in ["no", "nao", "não", "0", "nope"]):
-			# Opens the status file and writes the new status
-			with open("data/agua_status", "w") as f:
-				f.write('0')
+			# Writes the new status
+			chat.state.set(agua=0)
 
 			# Sends the confirmation message to the chat
-			context.bot.send_message(chat_id=update.effective_chat.id, text="Okay.\nI'll set a daily reminder for you :)")
+			if(chat.state.get('agua_reminder')):
+				OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id, text="Okay.\nI'll set a daily reminder for you :)")
+			else:
+				OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id, text="Okay.\nI registered that there is no water :(")
 
 		elif(args[0].lower() in ["yes", "sim", "1", "yep"]):
-			# Opens the status file and writes the new status
-			with open("data/agua_status", "w") as f:
-				f.write('1')
-
-			# Adds a new purchase of water to the data file
-			add_purchase("Água", "4.50", "Food")
+			# Writes the new status and adds a new purchase of water to the data file
+			with chat.lock:
+				price = chat.state.get('agua_price')
+				chat.state.set(agua=1)
+				crossed = add_purchase(chat, "Água", "{0:.2f}".format(price), "Food")
 
 			# Creates the response message
-			response_message = "Okay!\nI stopped the daily reminders and registered a purchase with value *R$ 4.50* inside the *Food* category."
+			response_message = AGUA_DONE.format(price)
 
 			# Sends the confirmation message to the chat
-			context.bot.send_message(chat_id=update.effective_chat.id,
-										text=markdownfy(response_message), parse_mode=telegram.ParseMode.MARKDOWN_V2)
+			OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id,
+										text=response_message, parse_mode=telegram.ParseMode.MARKDOWN_V2)
+			alert_budgets(context.bot, chat, crossed)
+
+	# ===== `/agua preco [value]` and `/agua lembrete [on/off]` =====
+	elif(len(args) == 2):
+		try:
+			if(args[0].lower() in ["preco", "preço", "price"]):
+				price = parse_price(args[1])
+				assert(price > 0)
+				chat.state.set(agua_price=price)
+				response_message = AGUA_PRICE.format(price)
 
+			else:
+				assert(args[0].lower() in ["lembrete", "reminder"] and args[1].lower() in ["on", "off"])
+				chat.state.set(agua_reminder=(args[1].lower() == "on"))
+				response_message = AGUA_REMINDER.format(args[1].lower())
+
+		except (AssertionError, ValueError):
+			# Creates the response message
+			response_message = USAGE_AGUA.format()
+
+		# Sends the message to the chat
+		OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id,
+									text=response_message, parse_mode=telegram.ParseMode.MARKDOWN_V2)
 # --
 
 # Command: /falta [args]
@@ -331,42 +807,41 @@ def falta(update, context):
 
 	# Retrives the arguments
 	args = context.args
+	missing = CHATS.get(update.effective_chat.id).missing
 
 	# ===== `/falta` =====
 	if(len(args) == 0):
-		try:
-			# Opens the file containing the list (the last element is a blank space, and thus is removed)
-			with open("data/falta_itens", "r") as f:
-				itens = f.read().split('\n')[:-1]
+		itens = missing.items()
 
-			# Creates the response message
-			response_message = ("*These are the itens missing in the house:*\n" +
-								"\n".join(["- "+it for it in itens]))
+		if(len(itens) == 0):
+			# Sends a message to the chat
+			OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id, text="There is nothing missing in the house :3")
+			return
 
-			# Sends the list of itens to the chat
-			context.bot.send_message(chat_id=update.effective_chat.id,
-										text=markdownfy(response_message), parse_mode=telegram.ParseMode.MARKDOWN_V2)
+		# Creates the response message
+		response_message = (FALTA_TITLE +
+							"\n".join([FALTA_LINE.format(it) for it in itens]))
 
-		except FileNotFoundError:
-			# Sends a message to the chat
-			context.bot.send_message(chat_id=update.effective_chat.id, text="There is nothing missing in the house :3")
+		# Sends the list of itens to the chat
+		OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id,
+									text=response_message, parse_mode=telegram.ParseMode.MARKDOWN_V2)
 
 	# ===== `/falta [ITEM1] ... [ITEMN]` =====
 	elif(len(args) > 0):
-		# Appends the new itens to the file contataining the lists
-		with open("data/falta_itens", "a") as f:
-			f.write("\n".join(args))
-			f.write("\n")
+		# Adds the new itens to the list (names already there are skipped)
+		added = missing.add(args)
 
 		# Creates the confirmation message accordingly
-		if(len(args) == 1):
-			response_message = "Okay.\nI added *{0}* to the list of missing itens :)".format(args[0])
+		if(len(added) == 0):
+			response_message = FALTA_NONE.format()
+		elif(len(added) == 1):
+			response_message = FALTA_ADDED.format(added[0])
 		else:
-			response_message = "Okay.\nI added these itens to the list of missing itens :)"
+			response_message = FALTA_ADDED_ALL.format()
 
 		# Sends the message to the chat
-		context.bot.send_message(chat_id=update.effective_chat.id,
-									text=markdownfy(response_message), parse_mode=telegram.ParseMode.MARKDOWN_V2)
+		OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id,
+									text=response_message, parse_mode=telegram.ParseMode.MARKDOWN_V2)
 
 # --
 
@@ -384,52 +859,133 @@ def falta_remove(update, context):
 
 	# Retrives the arguments
 	args = context.args
+	missing = CHATS.get(update.effective_chat.id).missing
 
-	try:
-		# ===== `/falta_remove ALL` =====
-		if(args[0] == "ALL"):
-			# Creates a new empty file
-			with open("data/falta_itens", "w") as f:
-				f.write("")
+	# ===== `/falta_remove` =====
+	if(len(args) == 0 or len(missing) == 0):
+		# Sends the message to the chat
+		OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id, text="There is nothing missing in the house :3")
 
-			# Sends the message to the chat
-			context.bot.send_message(chat_id=update.effective_chat.id, text="Okay!\nI cleared the list of missing itens :)")
+	# ===== `/falta_remove ALL` =====
+	elif(args[0] == "ALL"):
+		# Empties the list
+		missing.clear()
 
-		# ===== `/falta_remove [ITEM] ... [ITEMN]` =====
+		# Sends the message to the chat
+		OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id, text="Okay!\nI cleared the list of missing itens :)")
+
+	# ===== `/falta_remove [ITEM] ... [ITEMN]` =====
+	else:
+		# Removes the itens from the list (names are matched ignoring case and accents)
+		removed, not_found = missing.remove(args)
+
+		# Creates the confirmation message accordingly
+		if(len(removed) == 0):
+			response_message = FALTA_NOT_FOUND.format(not_found[0])
+		elif(len(args) == 1):
+			response_message = FALTA_REMOVED.format(removed[0])
 		else:
-			# Retrieves the list of itens from the file
-			with open("data/falta_itens", "r+") as f:
-				itens = f.read().split('\n')[:-1]
-
-			# Searches and removes an individual item, or create a new list without the
-			#  itens in the argument
-			if(len(args) == 1):
-				itens.remove(args[0])
-			else:
-				itens = [e for e in itens if e not in args]
+			response_message = FALTA_REMOVED_ALL.format()
 
-			# Saves the updated list to the file
-			with open("data/falta_itens", "w") as f:
-				f.write("\n".join(itens))
-				f.write("\n")
+		# Sends the message to the chat
+		OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id,
+									text=response_message, parse_mode=telegram.ParseMode.MARKDOWN_V2)
+# --
 
-			# Creates the confirmation message accordingly
-			if(len(args) == 1):
-				response_message = "Okay.\nI removed *{0}* from the list of missing itens :)".format(args[0])
-			else:
-				response_message = "Okay.\nI removed these itens from the list of missing itens :)"
+# Command: /stats
+@admin_only
+def stats(update, context):
+	""" STATS(UPDATE,CONTEXT)
 
-			# Sends the message to the chat
-			context.bot.send_message(chat_id=update.effective_chat.id,
-										text=markdownfy(response_message), parse_mode=telegram.ParseMode.MARKDOWN_V2)
+		Shows the operators (see ADMIN_ONLY) how many times each command and job ran, in every
+		chat, how many of them failed, and their latency percentiles (p50/p95/p99), along with
+		the time spent on disk I/O, pandas, numpy, matplotlib and Telegram API calls (the
+		replies sent by the outbox included).
+	"""
 
-	except ValueError:  # In case the argument is not on the list
-		# Sends the message to the chat
-		context.bot.send_message(chat_id=update.effective_chat.id, text=markdownfy("Sorry, the item *{0}* is not on the list :T".format(args[0])),
-									parse_mode=telegram.ParseMode.MARKDOWN_V2)
+	# Creates the table (inside a code block, MARKDOWN_V2 only needs '`' and '\' escaped)
+	table = stats_text().replace('\\', '\\\\').replace('`', '\\`')
 
-	except FileNotFoundError:   # In case the file has not been created yet
-		# Sends the message to the chat
-		context.bot.send_message(chat_id=update.effective_chat.id, text="There is nothing missing in the house :3")
+	# Sends the message to the chat
+	OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id,
+								text="```\n"+table+"\n```", parse_mode=telegram.ParseMode.MARKDOWN_V2)
+# --
+
+# Command: /lembrete [args]
+@restricted
+def lembrete(update, context):
+	""" LEMBRETE(UPDATE,CONTEXT)
+
+		Consults the reminders of the chat, or schedules a new one in the following ways:
+			/lembrete [HH:MM] [TEXT] ~> Reminds [TEXT] once, at the next [HH:MM].
+			/lembrete [DD/MM/YYYY] [HH:MM] [TEXT] ~> Reminds [TEXT] once, on that day (the year is optional).
+			/lembrete daily [HH:MM] [TEXT] ~> Reminds [TEXT] every day at [HH:MM].
+			/lembrete cron [MIN] [HOUR] [DAY] [MONTH] [WEEKDAY] [TEXT] ~> Reminds [TEXT] following a cron spec,
+								e.g. `/lembrete cron 0 9 * * 1 Trash day` (every monday at 9:00).
+	"""
+
+	# Retrives the arguments
+	args = context.args
+	chat_id = update.effective_chat.id
+
+	# ===== `/lembrete` =====
+	if(len(args) == 0):
+		entries = REMINDERS.of_chat(chat_id)
+
+		if(len(entries) == 0):
+			# Sends a message to the chat
+			OUTBOX.send_message(context.bot, chat_id=chat_id, text="There are no reminders yet :3")
+			return
+
+		# Creates the response message (the reminder texts are sent as they are)
+		response_message = ("These are the reminders of this chat:\n" +
+							"\n".join(["#{0} {1} ({2}) - {3}".format(id, when.strftime("%d/%m/%Y %H:%M"), cron or "once", text)
+									   for id, text, cron, when in entries]))
+
+		# Sends the list of reminders to the chat
+		OUTBOX.send_message(context.bot, chat_id=chat_id, text=response_message)
+
+	# ===== `/lembrete [WHEN] [TEXT]` =====
+	else:
+		try:
+			when, cron, text = parse_reminder(args, datetime.now())
+
+		except (ValueError, IndexError):
+			# Sends the response message
+			OUTBOX.send_message(context.bot, chat_id=chat_id,
+									text=USAGE_LEMBRETE.format(), parse_mode=telegram.ParseMode.MARKDOWN_V2)
+			return
+
+		# Schedules the reminder
+		id = REMINDERS.add(chat_id, text, when, cron)
+
+		# Sends the confirmation message to the chat
+		OUTBOX.send_message(context.bot, chat_id=chat_id,
+								text="Okay!\nI'll remind you on {0} (reminder #{1}) :)".format(when.strftime("%d/%m/%Y at %H:%M"), id))
+# --
+
+# Command: /lembrete_remove [ID]
+@restricted
+def lembrete_remove(update, context):
+	""" LEMBRETE_REMOVE(UPDATE,CONTEXT)
+
+		Removes a reminder of the chat, given its number (as listed by `/lembrete`):
+			/lembrete_remove [ID]
+	"""
+
+	# Retrives the arguments
+	args = context.args
+
+	# Removes the reminder (only those of this chat)
+	try:
+		removed = REMINDERS.remove(update.effective_chat.id, int(args[0].lstrip("#")))
+	except (ValueError, IndexError):
+		removed = False
+
+	# Sends the message to the chat
+	if(removed):
+		OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id, text="Okay!\nI removed the reminder :)")
+	else:
+		OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id, text="Sorry, there is no such reminder :T")
 # --
 # ===================
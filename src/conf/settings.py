@@ -12,4 +12,92 @@ TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 GROUP_ID       = int(os.getenv("GROUP_ID"))
 MINHO_ID       = int(os.getenv("MINHO_ID"))
 MARIANA_ID     = int(os.getenv("MARIANA_ID"))
+
+# Operators of the bot (comma-separated user ids), the only ones who see its metrics (/stats)
+ADMIN_IDS      = frozenset(int(id) for id in os.getenv("ADMIN_IDS", str(MINHO_ID)).split(",") if id.strip())
+# ===============
+
+# == STORAGE ==
+# Where purchases are kept: 'csv' (one COMPRAS file per month) or 'sqlite' (single database)
+PURCHASE_BACKEND = os.getenv("PURCHASE_BACKEND", "csv").lower()
+PURCHASE_DB      = os.getenv("PURCHASE_DB", "data/compras.db")
+# ===============
+
+# == STARTUP ==
+# Imports pandas/matplotlib in background after the bot starts (otherwise on first use)
+WARM_UP_IMPORTS  = os.getenv("WARM_UP_IMPORTS", "1") != "0"
+# ===============
+
+# == EXECUTION ==
+# Handlers run off the dispatcher thread: cheap commands in the 'light' thread pool, the
+# rendering ones in the 'heavy' pool, whose CPU-bound work goes to RENDER_PROCESSES processes.
+# QUEUE is the number of calls of one handler that may be pending; TIMEOUT is in seconds.
+LIGHT_WORKERS    = int(os.getenv("LIGHT_WORKERS", "4"))
+LIGHT_QUEUE      = int(os.getenv("LIGHT_QUEUE", "16"))
+LIGHT_TIMEOUT    = float(os.getenv("LIGHT_TIMEOUT", "30"))
+HEAVY_WORKERS    = int(os.getenv("HEAVY_WORKERS", "2"))
+HEAVY_QUEUE      = int(os.getenv("HEAVY_QUEUE", "4"))
+HEAVY_TIMEOUT    = float(os.getenv("HEAVY_TIMEOUT", "60"))
+RENDER_PROCESSES = int(os.getenv("RENDER_PROCESSES", "1"))
+# ===============
+
+# == ADMISSION ==
+# The expensive restricted commands in ADMIT_COMMANDS (comma-separated) are admitted, before
+# being queued, within token buckets: ADMIT_USER_RATE calls per second of each user, over all
+# of them, and ADMIT_COMMAND_RATE per second of each command in a chat, with bursts of up to
+# BURST calls (a rate <= 0 disables that limit). The other commands are never throttled.
+ADMIT_COMMANDS      = frozenset(name.strip() for name in os.getenv("ADMIT_COMMANDS", "list_compras,relatorio,busca").split(",")
+                                if name.strip())
+ADMIT_USER_RATE     = float(os.getenv("ADMIT_USER_RATE", "1"))
+ADMIT_USER_BURST    = int(os.getenv("ADMIT_USER_BURST", "8"))
+ADMIT_COMMAND_RATE  = float(os.getenv("ADMIT_COMMAND_RATE", "0.5"))
+ADMIT_COMMAND_BURST = int(os.getenv("ADMIT_COMMAND_BURST", "4"))
+# ===============
+
+# == METRICS ==
+# Prometheus text file with the handler metrics, rewritten every METRICS_INTERVAL seconds
+METRICS_FILE     = os.getenv("METRICS_FILE", "tmp/metrics.prom")
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "60"))
+# ===============
+
+# == SNAPSHOT ==
+# The in-memory state is saved in a single warm-restart snapshot every SNAPSHOT_INTERVAL
+# seconds (and at shutdown), and loaded from it at startup
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "300"))
+# ===============
+
+# == SERVING ==
+# How updates are received: 'polling' (default) or 'webhook'. In webhook mode the bot serves
+# plain HTTP on WEBHOOK_LISTEN:WEBHOOK_PORT/WEBHOOK_PATH, behind a proxy that terminates TLS
+# for the public WEBHOOK_URL. At most UPDATE_QUEUE_SIZE updates wait for the dispatcher
+# (the updates beyond them are refused, and Telegram sends them again later).
+SERVE_MODE           = os.getenv("SERVE_MODE", "polling").lower()
+WEBHOOK_LISTEN       = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT         = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH         = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_URL          = os.getenv("WEBHOOK_URL")
+UPDATE_QUEUE_SIZE    = int(os.getenv("UPDATE_QUEUE_SIZE", "256"))
+
+# Bot API server (e.g. a local fake one, see FAKE_BOTAPI.PY)
+TELEGRAM_API_URL     = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+# ===============
+
+# == OUTBOX ==
+# Replies are queued and sent by OUTBOX_WORKERS threads, within Telegram's flood limits:
+# OUTBOX_RATE messages per second overall, OUTBOX_CHAT_RATE per second in a private chat
+# and OUTBOX_GROUP_RATE per second in a group, with bursts of up to OUTBOX_BURST messages
+# per chat (a rate <= 0 disables that limit). Failed sends are retried OUTBOX_RETRIES times.
+OUTBOX_RATE       = float(os.getenv("OUTBOX_RATE", "25"))
+OUTBOX_CHAT_RATE  = float(os.getenv("OUTBOX_CHAT_RATE", "1"))
+OUTBOX_GROUP_RATE = float(os.getenv("OUTBOX_GROUP_RATE", str(20/60)))
+OUTBOX_BURST      = int(os.getenv("OUTBOX_BURST", "3"))
+OUTBOX_WORKERS    = int(os.getenv("OUTBOX_WORKERS", "4"))
+OUTBOX_RETRIES    = int(os.getenv("OUTBOX_RETRIES", "3"))
+# ===============
+
+# == TABLES ==
+# Months with more than TABLE_PAGE_ROWS purchases are listed as text pages of that many rows
+# (with buttons to turn them) instead of one table image; TABLE_MODE 'text' always does so.
+TABLE_MODE      = os.getenv("TABLE_MODE", "image").lower()
+TABLE_PAGE_ROWS = int(os.getenv("TABLE_PAGE_ROWS", "20"))
 # ===============
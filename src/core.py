@@ -1,112 +1,154 @@
 # ==== Libraries ====
-import telegram
-from telegram.ext import CommandHandler, Filters, MessageHandler, Updater, Job
-from conf.settings import TELEGRAM_TOKEN, GROUP_ID, MARIANA_ID, MINHO_ID
+from startup import STARTUP
+
+with STARTUP.phase("config"):
+    from conf.settings import (TELEGRAM_TOKEN, GROUP_ID, WARM_UP_IMPORTS,
+                               LIGHT_WORKERS, HEAVY_WORKERS, METRICS_FILE, METRICS_INTERVAL,
+                               SNAPSHOT_INTERVAL, SERVE_MODE, TELEGRAM_API_URL)
+
+with STARTUP.phase("imports"):
+    import telegram
+    from telegram.ext import CallbackQueryHandler, CommandHandler, Filters, MessageHandler
+    from telegram.utils.request import Request
+
+    from commands import *
+    from jobs import *
+    from jobstore import JobStore
+    from lazy import start_warm_up
+    from chats import CHATS
+    from metrics import instrument, section, write_prometheus
+    from outbox import OUTBOX
+    from pools import heavy, light, shutdown as shutdown_pools
+    from reminders import REMINDERS
+    from serving import build_updater, start_updater
+    from snapshot import load_snapshot, save_snapshot
 
-from commands import *
-from jobs import *
-
-from time import time
 from datetime import datetime, timedelta, time
-
-import pickle
 # ===================
 
 # ==== Global Variables ====
-LIST_OF_ADMINS = [GROUP_ID, MARIANA_ID, MINHO_ID]
-
-JOBS_PICKLE = 'tmp/job_tuples.pickle'
-JOB_DATA  = ('callback', 'interval', 'repeat', 'context', 'days', 'name', 'tzinfo')
-JOB_STATE = ('_remove', '_enabled')
+JOB_STORE = JobStore()
 # ==========================
 
 # ==== Functions ====
 # Loads previously saved Jobs to continue their pooling
 def load_jobs(jq):
-    with open(JOBS_PICKLE, 'rb') as fp:
-        while True:
-            try:
-                next_t, data, state = pickle.load(fp)
-            except EOFError:
-                break  # loaded all jobs
-
-            # New object with the same data
-            job = Job(**{var: val for var, val in zip(JOB_DATA, data)})
-
-            # Restore the state it had
-            for var, val in zip(JOB_STATE, state):
-                attribute = getattr(job, var)
-                getattr(attribute, 'set' if val else 'clear')()
-
-            job.job_queue = jq
-            jq._put(job, next_t-time())
+    JOB_STORE.load(jq)
 # --
 
-# Saves Jobs that are still running (to keep tracking of the intervals)
+# Saves the Jobs that changed since the last call (to keep tracking of the intervals)
 def save_jobs(jq):
-    with jq._queue.mutex:
-        if jq:
-            job_tuples = jq._queue.queue
-        else:
-            job_tuples = []
-
-        with open(JOBS_PICKLE, 'wb') as fp:
-            for next_t, job in job_tuples:
-                # This job is always created at the start
-                if job.name in ['save_jobs_job', 'agua_reminder']:
-                    continue
-
-                # Threading primitives are not pickleable
-                data  = tuple(getattr(job, var) for var in JOB_DATA)
-                state = tuple(getattr(job, var).is_set() for var in JOB_STATE)
-
-                # Pickle the job
-                pickle.dump((next_t, data, state), fp)
+    JOB_STORE.flush(jq)
 # --
 
 # Wrapper to save all Jobs within a context
 def save_jobs_job(context):
     save_jobs(context.job_queue)
 # --
+
+# Writes the handler metrics for Prometheus
+def write_metrics_job(context):
+    write_prometheus(METRICS_FILE)
+# --
+
+# Saves the warm-restart snapshot of the in-memory state
+def save_snapshot_job(context):
+    save_snapshot()
+# --
+
+# Registers a command handler, timed (see METRICS) and running inside a worker POOL
+def add_command(dispatcher, name, callback, pool, **kwargs):
+    dispatcher.add_handler(CommandHandler(name, pool(instrument(callback, name)), **kwargs))
+# --
+
+# Telegram API requests, timed as the 'telegram' section of the running handler
+class TimedRequest(Request):
+    def post(self, *args, **kwargs):
+        with section('telegram'):
+            return super().post(*args, **kwargs)
+
+    def retrieve(self, *args, **kwargs):
+        with section('telegram'):
+            return super().retrieve(*args, **kwargs)
+# --
 # ===================
 
 # ===== MAIN =====
 def main():
     # Creates the updater to get the Bot token and the dispatcher
     #   who will handle the commands and messages received
-    updater = Updater(token=TELEGRAM_TOKEN, use_context=True)
-    dispatcher = updater.dispatcher
+    with STARTUP.phase("updater"):
+        #   (the connection pool must fit the worker pools, the dispatcher and the updater)
+        bot = telegram.Bot(token=TELEGRAM_TOKEN, base_url=TELEGRAM_API_URL,
+                           request=TimedRequest(con_pool_size=LIGHT_WORKERS+HEAVY_WORKERS+8))
+        updater = build_updater(bot)
+        dispatcher = updater.dispatcher
 
-    # Creates the JobQueue handler
-    jobs = updater.job_queue
+        # Creates the JobQueue handler
+        jobs = updater.job_queue
 
     # Add listeners/handlers for specific commands
-    dispatcher.add_handler(CommandHandler('start',          start))
-    dispatcher.add_handler(CommandHandler('foto',           foto))
-    dispatcher.add_handler(CommandHandler('compra',         compra, pass_args=True))
-    dispatcher.add_handler(CommandHandler('list_compras',   list_compras))
-    dispatcher.add_handler(CommandHandler('agua',           agua, pass_args=True))
-    dispatcher.add_handler(CommandHandler('falta',          falta, pass_args=True))
-    dispatcher.add_handler(CommandHandler('falta_remove',   falta_remove, pass_args=True))
-
-    dispatcher.add_handler(MessageHandler(Filters.command, unknown))
+    with STARTUP.phase("handlers"):
+        #   (each one runs in a 'light' or 'heavy' worker pool, never in the dispatcher)
+        add_command(dispatcher, 'start',          start,          light)
+        add_command(dispatcher, 'foto',           foto,           light)
+        add_command(dispatcher, 'compra',         compra,         light, pass_args=True)
+        add_command(dispatcher, 'list_compras',   list_compras,   heavy)
+        add_command(dispatcher, 'orcamento',      orcamento,      light, pass_args=True)
+        add_command(dispatcher, 'relatorio',      relatorio,      heavy, pass_args=True)
+        add_command(dispatcher, 'busca',          busca,          light, pass_args=True)
+        add_command(dispatcher, 'agua',           agua,           light, pass_args=True)
+        add_command(dispatcher, 'falta',          falta,          light, pass_args=True)
+        add_command(dispatcher, 'falta_remove',   falta_remove,   light, pass_args=True)
+        add_command(dispatcher, 'lembrete',       lembrete,       light, pass_args=True)
+        add_command(dispatcher, 'lembrete_remove', lembrete_remove, light, pass_args=True)
+        add_command(dispatcher, 'stats',          stats,          light)
+
+        dispatcher.add_handler(CallbackQueryHandler(light(instrument(list_compras_page)), pattern=r"^compras "))
+        dispatcher.add_handler(MessageHandler(Filters.document & Filters.caption, light(instrument(compra_csv))))
+        dispatcher.add_handler(MessageHandler(Filters.command, light(instrument(unknown))))
+
+    # Loads the access list of the chats, and warms up their data from the last snapshot
+    #   (what it lacks, like the household list of missing itens, is read from the files)
+    with STARTUP.phase("load_state"):
+        CHATS.load()
+        load_snapshot()
+        CHATS.get(GROUP_ID).missing.load()
 
     # Add jobs to the JobQueue
-    jobs.run_repeating(save_jobs_job, timedelta(minutes=1))
-    jobs.run_daily(agua_reminder, time(hour=10, minute=0, second=0))
-
-    # This checks if no Jobs pickle has still been created
-    try:
-        load_jobs(jobs)
-    except FileNotFoundError:
-        pass # First run
-
-    # Start the updater and put it in idle mode
-    updater.start_polling()
+    with STARTUP.phase("load_jobs"):
+        jobs.run_repeating(instrument(save_jobs_job), timedelta(minutes=1))
+        jobs.run_repeating(instrument(write_metrics_job), METRICS_INTERVAL)
+        jobs.run_repeating(instrument(save_snapshot_job), SNAPSHOT_INTERVAL)
+        jobs.run_daily(instrument(agua_reminder), time(hour=10, minute=0, second=0))
+
+        # The reminders of the chats (a single job, armed for the next one due)
+        REMINDERS.start(jobs)
+
+        # This checks if no Jobs pickle has still been created
+        try:
+            load_jobs(jobs)
+        except FileNotFoundError:
+            pass # First run
+
+    # Start the updater (polling or webhook) and reports how long it took to be ready
+    with STARTUP.phase("start_"+SERVE_MODE):
+        start_updater(updater)
+    print(STARTUP.report())
+
+    # Loads the heavy libraries in background, before the first command needs them
+    if WARM_UP_IMPORTS:
+        start_warm_up()
+
+    # Put the updater in idle mode
     updater.idle()
 
-    # Save current running Jobs if the process is stopped
-    save_jobs(jobs)
+    # Wait for the running handlers and their replies, then save current running Jobs if the process is stopped
+    shutdown_pools()
+    OUTBOX.close()
+    save_snapshot()     # (writes the pending changes of the chats first)
+    JOB_STORE.close(jobs)
+    REMINDERS.close()
 # --
 
 # ===================
@@ -0,0 +1,228 @@
+# ==== Libraries ====
+import argparse
+import json
+import sys
+from collections import deque
+from time import perf_counter, time
+
+from tornado import gen, httpclient, ioloop, locks, web
+# ===================
+
+# ==== Fake Bot API ====
+class FakeBotAPI:
+    """ API = FAKEBOTAPI()
+
+        The state of a minimal, local stand-in for the Telegram Bot API: the updates waiting
+        for getUpdates, the registered webhook, and the time each injected command took to get
+        its first reply from the bot.
+    """
+
+    def __init__(self):
+        self.updates   = deque()
+        self.update_id = 0
+        self.msg_id    = 0
+        self.webhook   = None
+        self.arrived   = locks.Condition()
+        self.pending   = {}         # Chat id ~> deque of (injection time, future)
+        self.latencies = []
+
+    def next_message(self, chat_id, **fields):
+        self.msg_id += 1
+        message = {'message_id': self.msg_id, 'date': int(time()),
+                   'chat': {'id': chat_id, 'type': 'group' if chat_id < 0 else 'private'}}
+        message.update(fields)
+
+        return message
+
+    def inject(self, text, chat_id, user_id):
+        """ FUTURE = API.INJECT(TEXT, CHAT_ID, USER_ID)
+
+            Delivers a message TEXT from USER_ID in CHAT_ID to the bot (by webhook if one is set,
+            otherwise through getUpdates). The FUTURE resolves with the latency (in seconds) once
+            the bot replies in that chat.
+        """
+        self.update_id += 1
+        command = text.split()[0] if text.startswith('/') else None
+        message = self.next_message(chat_id, text=text,
+                                    **{'from': {'id': user_id, 'is_bot': False, 'first_name': 'Fake'}})
+        if command:
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+
+        update = {'update_id': self.update_id, 'message': message}
+        future = gen.Future()
+        self.pending.setdefault(chat_id, deque()).append((perf_counter(), future))
+
+        if self.webhook:
+            httpclient.AsyncHTTPClient().fetch(self.webhook, method='POST', body=json.dumps(update),
+                                               headers={'Content-Type': 'application/json'}, raise_error=False)
+        else:
+            self.updates.append(update)
+            self.arrived.notify_all()
+
+        return future
+
+    def replied(self, chat_id):
+        # The first reply to a chat answers its oldest injected command
+        waiting = self.pending.get(chat_id)
+        if waiting:
+            t, future = waiting.popleft()
+            self.latencies.append(perf_counter()-t)
+            if not future.done():
+                future.set_result(self.latencies[-1])
+# --
+
+class MethodHandler(web.RequestHandler):
+    """ Answers the Bot API methods used by the bot: /bot<TOKEN>/<METHOD> """
+
+    def initialize(self, api):
+        self.api = api
+
+    def params(self):
+        if self.request.headers.get('Content-Type', '').startswith('application/json') and self.request.body:
+            return json.loads(self.request.body)
+        return {key: self.get_argument(key) for key in self.request.arguments}
+
+    def reply(self, result):
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps({'ok': True, 'result': result}))
+
+    async def post(self, token, method):
+        api, params = self.api, self.params()
+
+        if method == 'getMe':
+            self.reply({'id': int(token.split(':')[0]) if token.split(':')[0].isdigit() else 1,
+                        'is_bot': True, 'first_name': 'CorgiButler', 'username': 'corgibutler_bot'})
+
+        elif method == 'getMyCommands':
+            self.reply([])
+
+        elif method == 'setWebhook':
+            api.webhook = params.get('url') or None
+            self.reply(True)
+
+        elif method == 'deleteWebhook':
+            api.webhook = None
+            self.reply(True)
+
+        elif method == 'getUpdates':
+            offset = int(params.get('offset') or 0)
+            while api.updates and api.updates[0]['update_id'] < offset:
+                api.updates.popleft()
+
+            if not api.updates:
+                await api.arrived.wait(timeout=ioloop.IOLoop.current().time() + float(params.get('timeout') or 0))
+            self.reply(list(api.updates))
+
+        elif method in ('sendMessage', 'sendPhoto'):
+            chat_id = int(params.get('chat_id'))
+            if method == 'sendPhoto':
+                message = api.next_message(chat_id, caption=params.get('caption'),
+                                           photo=[{'file_id': 'fake-{0}'.format(api.msg_id), 'file_unique_id': 'u{0}'.format(api.msg_id),
+                                                   'width': 1, 'height': 1}])
+            else:
+                message = api.next_message(chat_id, text=params.get('text'))
+
+            api.replied(chat_id)
+            self.reply(message)
+
+        else:   # Any other method simply succeeds
+            self.reply(True)
+
+    get = post
+# --
+
+class InjectHandler(web.RequestHandler):
+    """ POST /inject {"text", "chat_id", "user_id"} ~> {"latency": seconds} once the bot replies """
+
+    def initialize(self, api):
+        self.api = api
+
+    async def post(self):
+        body = json.loads(self.request.body)
+        latency = await gen.with_timeout(ioloop.IOLoop.current().time() + 60,
+                                         self.api.inject(body['text'], int(body['chat_id']), int(body['user_id'])))
+        self.write({'latency': latency})
+# --
+
+class StatsHandler(web.RequestHandler):
+    """ GET /stats ~> number of replies and their latency percentiles """
+
+    def initialize(self, api):
+        self.api = api
+
+    def get(self):
+        self.write(summary(self.api.latencies))
+# --
+# ===================
+
+# ==== Functions ====
+def summary(latencies):
+    """ STATS = SUMMARY(LATENCIES)
+
+        Returns a dict with the count and the p50/p95/p99 (in ms) of LATENCIES (in seconds).
+    """
+    ordered = sorted(latencies)
+    pick = lambda q: 1e3*ordered[min(len(ordered)-1, int(q*len(ordered)))] if ordered else 0.0
+
+    return {'count': len(ordered), 'p50_ms': pick(.5), 'p95_ms': pick(.95), 'p99_ms': pick(.99)}
+# --
+
+def serve(port):
+    """ SERVE(PORT)
+
+        Runs the fake Bot API on 127.0.0.1:PORT until interrupted.
+    """
+    api = FakeBotAPI()
+    app = web.Application([
+        (r"/bot([^/]+)/(\w+)", MethodHandler, {'api': api}),
+        (r"/inject",           InjectHandler, {'api': api}),
+        (r"/stats",            StatsHandler,  {'api': api}),
+    ])
+    app.listen(port, address="127.0.0.1")
+
+    print("Fake Bot API on http://127.0.0.1:{0}/bot (set TELEGRAM_API_URL to it)".format(port))
+    ioloop.IOLoop.current().start()
+# --
+
+def drive(url, n, text, chat_id, user_id):
+    """ DRIVE(URL, N, TEXT, CHAT_ID, USER_ID)
+
+        Sends the command TEXT N times, one after the other, through the fake Bot API at URL
+        and prints the latency percentiles from injection to the bot's first reply.
+    """
+    client  = httpclient.HTTPClient()
+    latencies = []
+
+    for _ in range(n):
+        body = json.dumps({'text': text, 'chat_id': chat_id, 'user_id': user_id})
+        response = client.fetch(url.rstrip('/')+"/inject", method='POST', body=body, request_timeout=90)
+        latencies.append(json.loads(response.body)['latency'])
+
+    print(json.dumps(dict(summary(latencies), command=text)))
+# --
+# ===================
+
+# ===================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local fake Telegram Bot API, to measure the bot end to end.")
+    sub = parser.add_subparsers(dest="mode")
+
+    serve_args = sub.add_parser("serve", help="runs the fake server")
+    serve_args.add_argument("--port", type=int, default=8081)
+
+    drive_args = sub.add_parser("drive", help="sends commands through a running fake server")
+    drive_args.add_argument("--url", default="http://127.0.0.1:8081")
+    drive_args.add_argument("-n", type=int, default=100)
+    drive_args.add_argument("--text", default="/start")
+    drive_args.add_argument("--chat", type=int, required=True, help="chat id (e.g. MINHO_ID, a private chat)")
+    drive_args.add_argument("--user", type=int, required=True, help="user id (e.g. MINHO_ID)")
+
+    args = parser.parse_args()
+    if args.mode == "serve":
+        serve(args.port)
+    elif args.mode == "drive":
+        drive(args.url, args.n, args.text, args.chat, args.user)
+    else:
+        parser.print_help()
+        sys.exit(1)
+# ===================
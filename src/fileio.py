@@ -0,0 +1,239 @@
+# ==== Libraries ====
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:     # Non-POSIX systems only get the in-process locks
+    fcntl = None
+
+import metrics
+# ===================
+
+# ==== Global Variables ====
+_LOCKS = {}
+_LOCKS_GUARD = threading.Lock()
+# ==========================
+
+# ==== Functions ====
+def path_lock(path):
+    """ LOCK = PATH_LOCK(PATH)
+
+        Returns the re-entrant lock associated with the file in PATH. Every thread of the
+        process that writes to PATH must hold this lock, so handlers never interleave writes.
+    """
+    key = os.path.abspath(path)
+
+    with _LOCKS_GUARD:
+        lock = _LOCKS.get(key)
+        if lock is None:
+            lock = _LOCKS[key] = threading.RLock()
+
+    return lock
+# --
+
+def file_version(path):
+    """ VERSION = FILE_VERSION(PATH)
+
+        Returns a VERSION token of the file in PATH (its modification time and size), which
+        changes whenever the file is written or replaced (None if there is no such file).
+    """
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+
+    except FileNotFoundError:
+        return None
+# --
+
+def fsync_dir(path):
+    """ FSYNC_DIR(PATH)
+
+        Flushes the directory entry of the file in PATH, so a newly created or renamed file
+        survives a crash. Silently ignored on systems that cannot open directories.
+    """
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+# --
+
+def _write_all(fd, data):
+    # os.write may write less than asked for, so it loops until everything is out
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+# --
+
+def _repair_tail(fd):
+    # A crash in the middle of an append leaves a torn last line (without the '\n').
+    #  That record was never acknowledged, so it is dropped before appending again.
+    size = os.fstat(fd).st_size
+    if size == 0 or os.pread(fd, 1, size-1) == b"\n":
+        return
+
+    end = size
+    while end > 0:
+        start = max(0, end-4096)
+        chunk = os.pread(fd, end-start, start)
+        idx   = chunk.rfind(b"\n")
+        if idx >= 0:
+            os.ftruncate(fd, start+idx+1)
+            return
+        end = start
+
+    os.ftruncate(fd, 0)
+# --
+
+def durable_append(path, data, header=b""):
+    """ DURABLE_APPEND(PATH, DATA; HEADER)
+
+        Appends the bytes in DATA to the file in PATH with a single write and fsyncs it before
+        returning. The file is created (starting with HEADER) if still unexistent. Writers are
+        serialized by the PATH_LOCK of the file and, across processes, by an exclusive flock.
+    """
+    with path_lock(path), metrics.section('io'):
+        created = not os.path.exists(path)
+        fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+
+            _repair_tail(fd)
+            if os.fstat(fd).st_size == 0:
+                data = header + data
+
+            _write_all(fd, data)
+            os.fsync(fd)
+
+        finally:
+            os.close(fd)    # Also releases the flock
+
+        if created:
+            fsync_dir(path)
+# --
+
+def atomic_write(path, data):
+    """ ATOMIC_WRITE(PATH, DATA)
+
+        Replaces the content of the file in PATH by the bytes in DATA. The data is written to
+        a temporary file in the same folder and renamed over PATH, so readers (and crashes)
+        only ever see the old or the new content.
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+
+    with path_lock(path), metrics.section('io'):
+        fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".tmp_"+os.path.basename(path))
+
+        try:
+            try:
+                _write_all(fd, data)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+            os.replace(tmp_path, path)
+
+        except BaseException:   # Never leaves half-written temporary files behind
+            os.unlink(tmp_path)
+            raise
+
+        fsync_dir(path)
+# --
+
+# ===================
+
+# ==== Mixins ====
+class FileCache:
+    """ Mixin of the objects that read a file once and keep its content in memory (under their
+        _LOCK), so a restart can be warmed up with a snapshot of that content instead of reading
+        the file again. The attribute named _CACHE_FILE holds the path of the file, and the one
+        named _CACHE its content (None while not read); _DUMP and _TAKE convert the content to
+        and from a snapshot.
+    """
+
+    _CACHE_FILE = 'path'
+    _CACHE      = None
+
+    def _dump(self, content):
+        # A copy of the CONTENT in memory to be snapshotted (None if it should not be)
+        return dict(content)
+
+    def _take(self, content):
+        # The content in memory for the CONTENT of a snapshot
+        return content
+
+    def _snapshot_cache(self):
+        # Must be called with the lock held
+        content = getattr(self, self._CACHE)
+        data    = None if content is None else self._dump(content)
+        return None if data is None else (file_version(getattr(self, self._CACHE_FILE)), data)
+
+    def _restore_cache(self, data):
+        # Must be called with the lock held
+        version, content = data
+        if getattr(self, self._CACHE) is None and version == file_version(getattr(self, self._CACHE_FILE)):
+            setattr(self, self._CACHE, self._take(content))
+
+    def snapshot(self):
+        """ DATA = OBJ.SNAPSHOT()
+
+            Returns the DATA to warm up the object after a restart (see RESTORE), or None if its
+            file was never read.
+        """
+        with self._lock:
+            return self._snapshot_cache()
+
+    def restore(self, data):
+        """ OBJ.RESTORE(DATA)
+
+            Takes the content of a SNAPSHOT instead of reading the file, unless the file changed
+            since the snapshot (or it was already read).
+        """
+        with self._lock:
+            self._restore_cache(data)
+# --
+
+class WriteBehind:
+    """ Mixin of the objects whose changes are saved DELAY seconds after they happen, so several
+        changes in a row are written together. A change calls _SCHEDULE_FLUSH, and the FLUSH
+        of the object calls _FLUSH_DUE to learn whether a save was pending (cancelling it).
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+
+        self._timer      = None
+        self._timer_lock = threading.Lock()
+
+    def _schedule_flush(self):
+        with self._timer_lock:
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush_due(self):
+        with self._timer_lock:
+            timer, self._timer = self._timer, None
+
+        if timer is None:
+            return False
+
+        timer.cancel()
+        return True
+
+    def _pending(self):
+        # Whether there are changes still to be saved
+        return self._timer is not None
+# --
+# ===================
@@ -1,33 +1,30 @@
 # ==== Libraries ====
 import telegram
-from conf.settings import GROUP_ID
 
-from commands import markdownfy
+from chats import CHATS
+from markup import markdownfy
+from outbox import OUTBOX
 # ===================
 
+# ==== Global Variables ====
+AGUA_MESSAGE = markdownfy("There is *NO* water at home :(\n"+
+                          "Remember to buy a new refil and then send me `/agua yes` to register the purchase :)")
+# ==========================
+
 # ===== Jobs =====
 def agua_reminder(context):
     """ AGUA_REMINDER(CONTEXT)
 
-        This is a daily job that checks the AGUA status in the house and send a notification in
-        case there is no water still in the morning.
+        This is a daily job that checks the AGUA status of every chat and send a notification to
+        those in which there is no water still in the morning (all of them in a single pass),
+        unless they turned the reminder off. The status comes from the STATE kept in memory.
     """
 
-    try:
-        # Retrieves the current status
-        with open("data/agua_status", "r") as f:
-            status = int(f.read())
-
-    except FileNotFoundError:   # If the file does not exists, the Job does nothing
-        status = 1
-
-    # If there is no water, the job sends a notification to the chat
-    if not status:
-        message = ("There is *NO* water at home :(\n"+
-                    "Remember to buy a new refil and then send me `/agua yes` to register the purchase :)")
-
-        context.bot.send_message(chat_id=GROUP_ID,
-                                 text=markdownfy(message), parse_mode=telegram.ParseMode.MARKDOWN_V2)
+    # If there is no water, the job sends a notification to the chat (the outbox spaces them out)
+    for chat in CHATS.known():
+        if not chat.state.get('agua') and chat.state.get('agua_reminder'):
+            OUTBOX.send_message(context.bot, chat_id=chat.id,
+                                text=AGUA_MESSAGE, parse_mode=telegram.ParseMode.MARKDOWN_V2)
 
 
 # ================
@@ -0,0 +1,233 @@
+# ==== Libraries ====
+import base64
+import binascii
+import os
+import pickle
+import threading
+import uuid
+from time import perf_counter, time
+
+from telegram.ext import Job
+
+from fileio import atomic_write, durable_append
+from metrics import observe
+# ===================
+
+# ==== Global Variables ====
+JOBS_PICKLE   = 'tmp/job_tuples.pickle'     # Legacy format (only read, to migrate old installs)
+JOBS_SNAPSHOT = 'tmp/jobs.snapshot'
+JOBS_JOURNAL  = 'tmp/jobs.journal'
+
+JOB_DATA  = ('callback', 'interval', 'repeat', 'context', 'days', 'name', 'tzinfo')
+JOB_STATE = ('_remove', '_enabled')
+
+# These jobs are always created at the start
+SKIP_JOBS = ('save_jobs_job', 'write_metrics_job', 'save_snapshot_job', 'agua_reminder', 'reminders_job')
+# ==========================
+
+# ==== Functions ====
+def _encode(record):
+    # One record per line, so a torn last line (crash mid-append) is detected and dropped
+    return base64.b64encode(pickle.dumps(record)) + b"\n"
+# --
+
+def _read_records(path):
+    # Decodes the records of a file, skipping any line that is incomplete or corrupted
+    with open(path, 'rb') as fp:
+        for line in fp:
+            try:
+                yield pickle.loads(base64.b64decode(line.rstrip(b"\n"), validate=True))
+            except (binascii.Error, pickle.UnpicklingError, EOFError, ValueError):
+                continue
+# --
+
+def _read_legacy(path):
+    # The old format: a sequence of pickled (next_t, data, state) tuples
+    with open(path, 'rb') as fp:
+        while True:
+            try:
+                yield pickle.load(fp)
+            except EOFError:
+                break   # loaded all jobs
+# --
+
+def job_key(job):
+    """ KEY = JOB_KEY(JOB)
+
+        Returns the persistent KEY that identifies JOB in the job store, assigning a new one
+        the first time the JOB is seen.
+    """
+    key = getattr(job, '_store_key', None)
+    if key is None:
+        key = job._store_key = uuid.uuid4().hex
+
+    return key
+# --
+
+def schedule_job(jq, job, next_t):
+    """ SCHEDULE_JOB(JQ, JOB, NEXT_T)
+
+        Puts an already built JOB in the JobQueue JQ to run at the timestamp NEXT_T. The
+        private JobQueue._put is used when available (keeping the days/tzinfo of daily jobs);
+        otherwise the JOB is re-created through the public run_once/run_repeating API.
+    """
+    delay = max(0.0, next_t-time())
+
+    put = getattr(jq, '_put', None)
+    if put is not None:
+        try:
+            job.job_queue = jq
+            put(job, delay)
+            return job
+        except TypeError:   # Signature changed in this version of the library
+            pass
+
+    if job.repeat:
+        new_job = jq.run_repeating(job.callback, job.interval, first=delay, context=job.context, name=job.name)
+    else:
+        new_job = jq.run_once(job.callback, delay, context=job.context, name=job.name)
+
+    new_job.enabled = job.enabled
+    new_job._store_key = job_key(job)
+
+    return new_job
+# --
+# ===================
+
+# ==== Job Store ====
+class JobStore:
+    """ STORE = JOBSTORE(SNAPSHOT, JOURNAL)
+
+        Persists the Jobs of a JobQueue across restarts. Each FLUSH appends to the JOURNAL only
+        the jobs that changed (or were removed) since the previous flush; the journal is folded
+        into the SNAPSHOT (written atomically) once it grows larger than the snapshot itself.
+
+        Both files start with a generation record. A journal whose generation does not match
+        the snapshot is left over from an interrupted compaction and is ignored.
+    """
+
+    def __init__(self, snapshot=JOBS_SNAPSHOT, journal=JOBS_JOURNAL, legacy=JOBS_PICKLE, min_compact=64):
+        self.snapshot    = snapshot
+        self.journal     = journal
+        self.legacy      = legacy
+        self.min_compact = min_compact
+
+        self._flushed    = {}   # Key ~> (next_t, data, state) as it is on disk
+        self._generation = 0
+        self._journaled  = 0    # Number of records in the current journal
+        self._lock       = threading.Lock()
+
+    def _read(self):
+        # Returns the persisted records (key ~> record), replaying the journal over the snapshot
+        records = {}
+
+        if os.path.exists(self.snapshot):
+            entries = _read_records(self.snapshot)
+            header  = next(entries, None)
+            self._generation = header[1] if header and header[0] == 'gen' else 0
+            records.update((key, record) for key, *record in entries)
+
+            if os.path.exists(self.journal):
+                entries = _read_records(self.journal)
+                if next(entries, None) == ('gen', self._generation):
+                    for op, key, *record in entries:
+                        self._journaled += 1
+                        if op == 'put':
+                            records[key] = tuple(record)
+                        else:
+                            records.pop(key, None)
+
+        elif os.path.exists(self.legacy):
+            records.update((uuid.uuid4().hex, tuple(record)) for record in _read_legacy(self.legacy))
+
+        else:
+            raise FileNotFoundError(self.snapshot)
+
+        return {key: tuple(record) for key, record in records.items()}
+
+    def load(self, jq):
+        """ STORE.LOAD(JQ)
+
+            Restores the persisted jobs in the JobQueue JQ, with the state they had. Raises
+            FileNotFoundError if nothing was ever persisted.
+        """
+        with self._lock:
+            records = self._read()
+
+            for key, (next_t, data, state) in records.items():
+                # New object with the same data
+                job = Job(**{var: val for var, val in zip(JOB_DATA, data)})
+                job._store_key = key
+
+                # Restore the state it had
+                for var, val in zip(JOB_STATE, state):
+                    attribute = getattr(job, var)
+                    getattr(attribute, 'set' if val else 'clear')()
+
+                schedule_job(jq, job, next_t)
+
+            self._flushed = records
+
+    def _collect(self, jq):
+        # Copies the queue while holding its mutex (no I/O or pickling happens meanwhile)
+        with jq._queue.mutex:
+            t = perf_counter()
+            job_tuples = list(jq._queue.queue)
+            held = perf_counter()-t
+
+        observe('save_jobs.mutex', held)
+
+        current = {}
+        for next_t, job in job_tuples:
+            if job.name in SKIP_JOBS:
+                continue
+
+            # Threading primitives are not pickleable
+            data  = tuple(getattr(job, var) for var in JOB_DATA)
+            state = tuple(getattr(job, var).is_set() for var in JOB_STATE)
+            current[job_key(job)] = (next_t, data, state)
+
+        return current
+
+    def flush(self, jq):
+        """ STORE.FLUSH(JQ)
+
+            Journals the jobs of the JobQueue JQ that changed since the last flush.
+        """
+        current = self._collect(jq)
+
+        with self._lock:
+            changes  = [('put', key)+record for key, record in current.items() if self._flushed.get(key) != record]
+            changes += [('del', key) for key in self._flushed.keys()-current.keys()]
+
+            if changes:
+                durable_append(self.journal, b"".join(map(_encode, changes)),
+                               header=_encode(('gen', self._generation)))
+                self._journaled += len(changes)
+
+            self._flushed = current
+
+            if self._journaled > max(self.min_compact, len(current)) or not os.path.exists(self.snapshot):
+                self._compact()
+
+    def _compact(self):
+        # Writes the flushed jobs as a new snapshot generation, then starts a new journal
+        generation = self._generation+1
+        records = [_encode(('gen', generation))] + [_encode((key,)+record) for key, record in self._flushed.items()]
+
+        atomic_write(self.snapshot, b"".join(records))
+        atomic_write(self.journal, _encode(('gen', generation)))
+
+        self._generation = generation
+        self._journaled  = 0
+
+    def close(self, jq):
+        """ STORE.CLOSE(JQ)
+
+            Flushes the jobs of JQ and compacts the journal (used when the bot stops).
+        """
+        self.flush(jq)
+        with self._lock:
+            self._compact()
+# --
+# ===================
@@ -0,0 +1,72 @@
+# ==== Libraries ====
+import importlib
+import threading
+# ===================
+
+# ==== Global Variables ====
+_REGISTRY = []
+# ==========================
+
+# ==== Lazy Modules ====
+class LazyModule:
+    """ MODULE = LAZYMODULE(NAME; BEFORE)
+
+        A stand-in for the module NAME that only imports it when one of its attributes is
+        first used. BEFORE, if given, is called right before the import (e.g. to choose the
+        Matplotlib backend).
+    """
+
+    def __init__(self, name, before=None):
+        self.__dict__.update(_name=name, _before=before, _module=None, _lock=threading.Lock())
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            with self._lock:
+                if self._module is None:
+                    if self._before is not None:
+                        self._before()
+                    self._module = importlib.import_module(self._name)
+                module = self._module
+
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        return "<lazy module '{0}' ({1})>".format(self._name, "loaded" if self._module else "not loaded")
+# --
+
+def lazy_import(name, before=None):
+    """ MODULE = LAZY_IMPORT(NAME; BEFORE)
+
+        Returns a LAZYMODULE for NAME, registered to be loaded by WARM_UP.
+    """
+    module = LazyModule(name, before)
+    _REGISTRY.append(module)
+
+    return module
+# --
+
+def warm_up():
+    """ WARM_UP()
+
+        Imports every module registered by LAZY_IMPORT that is still not loaded.
+    """
+    for module in _REGISTRY:
+        module._load()
+# --
+
+def start_warm_up():
+    """ THREAD = START_WARM_UP()
+
+        Runs WARM_UP in a background (daemon) THREAD, so the first heavy command does not pay
+        for the imports while the bot is already answering the cheap ones.
+    """
+    thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    thread.start()
+
+    return thread
+# --
+# ===================
@@ -0,0 +1,60 @@
+# ==== Libraries ====
+import csv
+import io
+import os
+from datetime import datetime
+
+from fileio import durable_append
+# ===================
+
+# ==== Global Variables ====
+DATA_DIR = "data"
+COLUMNS  = ('name', 'cost', 'type', 'date')
+HEADER   = (",".join(COLUMNS)+"\n").encode("utf-8")
+# ==========================
+
+# ==== Functions ====
+def ledger_path(month=None, folder=DATA_DIR):
+    """ PATH = LEDGER_PATH(MONTH; FOLDER)
+
+        Returns the PATH of the COMPRAS data file of a given MONTH (a datetime or a 'YYYY-MM'
+        string) inside FOLDER. The current month is used if MONTH is None.
+    """
+    if month is None:
+        month = datetime.today()
+    if isinstance(month, datetime):
+        month = month.strftime("%Y-%m")
+
+    return os.path.join(folder, "compras_"+month+".csv")
+# --
+
+def totals_path(month, folder=DATA_DIR):
+    """ PATH = TOTALS_PATH(MONTH; FOLDER)
+
+        Returns the PATH of the file with the running totals of the 'YYYY-MM' MONTH, next to
+        its COMPRAS data file in FOLDER.
+    """
+    return os.path.join(folder, "totals_"+month+".json")
+# --
+
+def encode_rows(rows):
+    """ DATA = ENCODE_ROWS(ROWS)
+
+        Encodes an iterable of ROWS (tuples in the COLUMNS order) as CSV lines, quoting the
+        fields exactly as pandas does, so the result can be appended to a COMPRAS data file.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+
+    return buffer.getvalue().encode("utf-8")
+# --
+
+def append_purchases(path, rows):
+    """ APPEND_PURCHASES(PATH, ROWS)
+
+        Appends the purchase ROWS (tuples in the COLUMNS order) to the COMPRAS data file in
+        PATH with one durable write, writing the CSV header first if the file is new.
+    """
+    durable_append(path, encode_rows(rows), header=HEADER)
+# --
+# ===================
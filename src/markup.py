@@ -0,0 +1,78 @@
+# ==== Libraries ====
+from string import Formatter
+# ===================
+
+# ==== Global Variables ====
+# Every character with a meaning in MarkdownV2 (any of them may be escaped with a backslash)
+SPECIAL = "\\_*[]()~`>#+-=|{}.!"
+
+_ESCAPE = str.maketrans({ch: "\\"+ch for ch in SPECIAL})
+
+# The markup written in the replies themselves only uses *bold* and `code`
+_MARKUP = str.maketrans({ch: "\\"+ch for ch in SPECIAL if ch not in "*`"})
+# ==========================
+
+# ==== Functions ====
+def escape(text):
+    """ S_MV2 = ESCAPE(TEXT)
+
+        Escapes every MarkdownV2 special character of TEXT (in a single pass), so untrusted
+        text (e.g. the name of an item) is shown as it is.
+    """
+    return text.translate(_ESCAPE)
+# --
+
+def markdownfy(sentence):
+    """ S_MV2 = MARKDOWNFY(S)
+
+        Receives a string 'S' written with *bold* and `code` markup and converts it to a form
+        that can be parsed within the MARKDOWN_V2 format, escaping (in a single pass) every
+        other special character. Only for trusted text: see TEMPLATE for replies with
+        arguments.
+    """
+    return sentence.translate(_MARKUP)
+# --
+# ===================
+
+# ==== Templates ====
+class Template:
+    """ TEMPLATE = TEMPLATE(MARKUP)
+
+        A reply in the MARKDOWN_V2 format, compiled once: MARKUP is trusted text with *bold*
+        and `code` markup (see MARKDOWNFY) and {fields} as in str.format. TEMPLATE.FORMAT fills
+        the fields, escaping their values (see ESCAPE) after formatting them, so arguments
+        never change the markup.
+    """
+    __slots__ = ('markup', '_parts')
+
+    def __init__(self, markup):
+        self.markup = markup
+        self._parts = []    # (escaped literal text, field or None, format spec)
+
+        auto = 0
+        for literal, field, spec, conversion in Formatter().parse(markup):
+            if field is not None:
+                if conversion or "." in field or "[" in field:
+                    raise ValueError("template fields are plain names or positions: {0!r}".format(markup))
+                if field == "":
+                    field, auto = auto, auto+1
+                elif field.isdigit():
+                    field = int(field)
+
+            self._parts.append((markdownfy(literal), field, spec or ""))
+
+    def format(self, *args, **kwargs):
+        """ S_MV2 = TEMPLATE.FORMAT(*ARGS, **KWARGS)
+
+            Returns the reply with its fields filled with ARGS (by position) and KWARGS.
+        """
+        out = []
+        for literal, field, spec in self._parts:
+            out.append(literal)
+            if field is not None:
+                value = args[field] if isinstance(field, int) else kwargs[field]
+                out.append(format(value, spec).translate(_ESCAPE))
+
+        return "".join(out)
+# --
+# ===================
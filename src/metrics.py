@@ -0,0 +1,280 @@
+# ==== Libraries ====
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+
+import fileio
+# ===================
+
+# ==== Global Variables ====
+SECTIONS = ('io', 'pandas', 'numpy', 'matplotlib', 'telegram')
+
+# Upper bounds (in seconds) of the histogram buckets: 10us up to ~1min, 50% apart
+BUCKETS = tuple(0.00001 * 1.5**i for i in range(39))
+
+_HANDLERS = OrderedDict()   # Name ~> HandlerStats
+_GUARD    = threading.Lock()
+_LOCAL    = threading.local()
+# ==========================
+
+# ==== Histograms ====
+class Histogram:
+    """ HIST = HISTOGRAM()
+
+        Fixed-size latency histogram (the BUCKETS bounds), from which quantiles are estimated
+        by interpolating inside the bucket that holds them.
+    """
+
+    def __init__(self):
+        self.counts = [0]*(len(BUCKETS)+1)      # The last bucket is +Inf
+        self.count  = 0
+        self.sum    = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum   += seconds
+
+    def quantile(self, q):
+        """ SECONDS = HIST.QUANTILE(Q)
+
+            Estimates the Q-quantile (0 <= Q <= 1) of the observed values.
+        """
+        if self.count == 0:
+            return 0.0
+
+        rank, seen = q*self.count, 0
+        for idx, count in enumerate(self.counts):
+            if count and seen+count >= rank:
+                lower = BUCKETS[idx-1] if idx > 0 else 0.0
+                upper = BUCKETS[idx] if idx < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper-lower) * (rank-seen)/count
+            seen += count
+
+        return BUCKETS[-1]
+# --
+
+class HandlerStats:
+    """ STATS = HANDLERSTATS(NAME)
+
+        Calls, errors and latency histograms of a handler (or job) NAME: the 'total' histogram
+        holds the whole call, and one histogram per SECTIONS entry the time spent in it. Other
+        events of the handler (e.g. calls rejected before being queued) are counted apart.
+    """
+
+    def __init__(self, name):
+        self.name      = name
+        self.calls     = 0
+        self.errors    = 0
+        self.latencies = OrderedDict((sec, Histogram()) for sec in ('total',)+SECTIONS)
+        self.events    = OrderedDict()  # Event ~> count
+        self.lock      = threading.Lock()
+
+    def record(self, total, sections, failed):
+        with self.lock:
+            self.calls  += 1
+            self.errors += int(failed)
+            self.latencies['total'].observe(total)
+            for sec in SECTIONS:
+                if sec in sections:
+                    self.latencies[sec].observe(sections[sec])
+
+    def count(self, event):
+        with self.lock:
+            self.events[event] = self.events.get(event, 0) + 1
+
+    def charge(self, kind, seconds):
+        with self.lock:
+            self.latencies[kind].observe(seconds)
+# --
+# ===================
+
+# ==== Functions ====
+def stats_for(name):
+    """ STATS = STATS_FOR(NAME)
+
+        Returns the HandlerStats of NAME, creating it on first use.
+    """
+    with _GUARD:
+        stats = _HANDLERS.get(name)
+        if stats is None:
+            stats = _HANDLERS[name] = HandlerStats(name)
+
+    return stats
+# --
+
+def instrument(func, name=None):
+    """ WRAPPED = INSTRUMENT(FUNC; NAME)
+
+        Wraps a handler or job callback FUNC so every call is counted and timed under NAME
+        (the function name by default), including the time its SECTION blocks take. It must
+        be applied inside any wrapper that moves the call to another thread (see POOLS).
+    """
+    stats = stats_for(name or func.__name__)
+
+    @wraps(func)
+    def wrapped(*args, **kwargs):
+        stack = _LOCAL.__dict__.setdefault('stack', [])
+        stack.append({'_name': stats.name})
+
+        t, failed = perf_counter(), False
+        try:
+            return func(*args, **kwargs)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            stats.record(perf_counter()-t, stack.pop(), failed)
+
+    return wrapped
+# --
+
+@contextmanager
+def section(kind):
+    """ with SECTION(KIND): ...
+
+        Adds the time spent inside the block to the KIND section ('io', 'pandas', 'numpy',
+        'matplotlib' or 'telegram') of the handler running in this thread. Nested sections of the same
+        KIND are only counted once; outside handlers the block is not timed.
+    """
+    stack = getattr(_LOCAL, 'stack', None)
+    if not stack or kind in stack[-1].get('_open', ()):
+        yield
+        return
+
+    current = stack[-1]
+    current.setdefault('_open', set()).add(kind)
+    t = perf_counter()
+    try:
+        yield
+    finally:
+        current['_open'].discard(kind)
+        current[kind] = current.get(kind, 0.0) + perf_counter()-t
+# --
+
+def observe(name, seconds):
+    """ OBSERVE(NAME, SECONDS)
+
+        Records a standalone measure (e.g. how long a lock was held) as a call of NAME.
+    """
+    stats_for(name).record(seconds, {}, False)
+# --
+
+def current():
+    """ NAME = CURRENT()
+
+        Returns the NAME of the handler (or job) running in this thread, or None.
+    """
+    stack = getattr(_LOCAL, 'stack', None)
+    return stack[-1]['_name'] if stack else None
+# --
+
+def charge(name, kind, seconds):
+    """ CHARGE(NAME, KIND, SECONDS)
+
+        Adds SECONDS to the KIND section of the handler NAME after its call returned, e.g. the
+        time the outbox took to send its replies. Each charge is observed on its own, so the
+        histogram of that section counts them instead of the calls.
+    """
+    stats_for(name).charge(kind, seconds)
+# --
+
+def count(name, event):
+    """ COUNT(NAME, EVENT)
+
+        Counts an EVENT of the handler NAME other than a call, e.g. a call rejected by the
+        access list ('unauthorized') or by a rate limit ('throttled_user').
+    """
+    stats_for(name).count(event)
+# --
+
+def _snapshot():
+    with _GUARD:
+        handlers = list(_HANDLERS.values())
+
+    snapshot = []
+    for stats in handlers:
+        with stats.lock:
+            snapshot.append((stats.name, stats.calls, stats.errors,
+                             OrderedDict((sec, (list(h.counts), h.count, h.sum, h.quantile(.5), h.quantile(.95), h.quantile(.99)))
+                                         for sec, h in stats.latencies.items()),
+                             OrderedDict(stats.events)))
+
+    return snapshot
+# --
+
+def stats_text():
+    """ TEXT = STATS_TEXT()
+
+        Returns a plain-text TEXT table with the calls, errors and latency quantiles of every
+        handler and job, followed by the mean time per call spent in each section.
+    """
+    lines = ["{0:<16} {1:>6} {2:>4} {3:>8} {4:>8} {5:>8}".format("handler", "calls", "err", "p50 ms", "p95 ms", "p99 ms")]
+    split, events = [], []
+
+    for name, calls, errors, latencies, counts in _snapshot():
+        _, _, _, p50, p95, p99 = latencies['total']
+        lines.append("{0:<16} {1:>6} {2:>4} {3:>8.1f} {4:>8.1f} {5:>8.1f}".format(name[:16], calls, errors, 1e3*p50, 1e3*p95, 1e3*p99))
+
+        means = ["{0} {1:.1f}".format(sec, 1e3*total/calls)
+                 for sec, (_, count, total, *_) in latencies.items() if sec != 'total' and count]
+        if calls and means:
+            split.append("{0:<16} ".format(name[:16]) + ", ".join(means))
+        if counts:
+            events.append("{0:<16} ".format(name[:16]) + ", ".join("{0} {1}".format(*item) for item in counts.items()))
+
+    if split:
+        lines += ["", "mean ms per call by section:"] + split
+    if events:
+        lines += ["", "events:"] + events
+
+    return "\n".join(lines)
+# --
+
+def prometheus_text(prefix="corgibutler"):
+    """ TEXT = PROMETHEUS_TEXT(PREFIX)
+
+        Returns the metrics in the Prometheus text exposition format.
+    """
+    snapshot = _snapshot()
+
+    # Every metric family is written as one group, as the format requires
+    lines = ["# TYPE {0}_handler_calls_total counter".format(prefix)]
+    lines += ['{0}_handler_calls_total{{handler="{1}"}} {2}'.format(prefix, name, calls)
+              for name, calls, _, _, _ in snapshot]
+
+    lines.append("# TYPE {0}_handler_errors_total counter".format(prefix))
+    lines += ['{0}_handler_errors_total{{handler="{1}"}} {2}'.format(prefix, name, errors)
+              for name, _, errors, _, _ in snapshot]
+
+    lines.append("# TYPE {0}_handler_events_total counter".format(prefix))
+    lines += ['{0}_handler_events_total{{handler="{1}",event="{2}"}} {3}'.format(prefix, name, event, n)
+              for name, _, _, _, counts in snapshot for event, n in counts.items()]
+
+    lines.append("# TYPE {0}_handler_seconds histogram".format(prefix))
+    for name, _, _, latencies, _ in snapshot:
+        for sec, (counts, count, total, *_) in latencies.items():
+            labels = 'handler="{0}",section="{1}"'.format(name, sec)
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS+(float('inf'),), counts):
+                cumulative += bucket
+                le = "+Inf" if bound == float('inf') else "{0:.6g}".format(bound)
+                lines.append('{0}_handler_seconds_bucket{{{1},le="{2}"}} {3}'.format(prefix, labels, le, cumulative))
+            lines.append('{0}_handler_seconds_sum{{{1}}} {2:.6f}'.format(prefix, labels, total))
+            lines.append('{0}_handler_seconds_count{{{1}}} {2}'.format(prefix, labels, count))
+
+    return "\n".join(lines)+"\n"
+# --
+
+def write_prometheus(path):
+    """ WRITE_PROMETHEUS(PATH)
+
+        Atomically (re)writes the file in PATH with PROMETHEUS_TEXT, e.g. for the textfile
+        collector of the node exporter.
+    """
+    fileio.atomic_write(path, prometheus_text().encode("utf-8"))
+# --
+# ===================
@@ -0,0 +1,141 @@
+# ==== Libraries ====
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from fileio import FileCache, WriteBehind, atomic_write
+# ===================
+
+# ==== Global Variables ====
+FALTA_ITENS = "data/falta_itens"
+# ==========================
+
+# ==== Functions ====
+def normalize(name):
+    """ KEY = NORMALIZE(NAME)
+
+        Returns the KEY used to compare item names: accents are stripped and the case is
+        folded, so "Café", "cafe" and "CAFÉ" are all the same item.
+    """
+    decomposed = unicodedata.normalize("NFKD", name.strip())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+# --
+# ===================
+
+# ==== Missing Items ====
+class MissingItems(FileCache, WriteBehind):
+    """ ITEMS = MISSINGITEMS(PATH; DELAY)
+
+        The list of missing itens of the house, kept in memory as an ordered set (insertion
+        order, no repeated names, O(1) add/remove/membership). The list is read from PATH the
+        first time it is used; changes are written back DELAY seconds later (several changes
+        in a row are saved together), always replacing the file atomically.
+    """
+
+    _CACHE = '_items'
+
+    def __init__(self, path=FALTA_ITENS, delay=1.0):
+        WriteBehind.__init__(self, delay)
+        self.path = path
+
+        self._items = None      # Normalized name ~> name as first entered
+        self._lock  = threading.RLock()
+
+    def load(self):
+        """ ITEMS.LOAD()
+
+            Reads the list from the file (only the first time it is called).
+        """
+        with self._lock:
+            if self._items is None:
+                self._items = OrderedDict()
+                try:
+                    with open(self.path, "r") as f:
+                        for line in f.read().split('\n'):
+                            if line.strip():
+                                self._items.setdefault(normalize(line), line)
+                except FileNotFoundError:
+                    pass
+
+            return self._items
+
+    def __contains__(self, name):
+        return normalize(name) in self.load()
+
+    def __len__(self):
+        return len(self.load())
+
+    def items(self):
+        """ NAMES = ITEMS.ITEMS()
+
+            Returns the list of missing item NAMES, in the order they were added.
+        """
+        with self._lock:
+            return list(self.load().values())
+
+    def add(self, names):
+        """ ADDED = ITEMS.ADD(NAMES)
+
+            Adds the NAMES that are not on the list yet, returning the ones that were ADDED.
+        """
+        added = []
+        with self._lock:
+            items = self.load()
+            for name in names:
+                key = normalize(name)
+                if key and key not in items:
+                    items[key] = name
+                    added.append(name)
+
+            if added:
+                self._schedule_flush()
+
+        return added
+
+    def remove(self, names):
+        """ REMOVED, NOT_FOUND = ITEMS.REMOVE(NAMES)
+
+            Removes the NAMES from the list, returning the ones REMOVED and the ones NOT_FOUND.
+        """
+        removed, not_found = [], []
+        with self._lock:
+            items = self.load()
+            for name in names:
+                if items.pop(normalize(name), None) is None:
+                    not_found.append(name)
+                else:
+                    removed.append(name)
+
+            if removed:
+                self._schedule_flush()
+
+        return removed, not_found
+
+    def clear(self):
+        """ ITEMS.CLEAR()
+
+            Empties the list.
+        """
+        with self._lock:
+            self.load().clear()
+            self._schedule_flush()
+
+    def _dump(self, items):
+        # Changes still to be written would be lost if the file changed meanwhile
+        return None if self._pending() else list(items.items())
+
+    def _take(self, items):
+        return OrderedDict(items)
+
+    def flush(self):
+        """ ITEMS.FLUSH()
+
+            Writes the pending changes (if any) to the file right away.
+        """
+        with self._lock:
+            if not self._flush_due():   # Nothing changed since the last write
+                return
+
+            atomic_write(self.path, "".join(name+"\n" for name in self._items.values()).encode("utf-8"))
+# --
+# ===================
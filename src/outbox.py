@@ -0,0 +1,276 @@
+# ==== Libraries ====
+import io
+import threading
+import traceback
+from collections import OrderedDict, deque
+from time import monotonic
+
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from conf.settings import (OUTBOX_RATE, OUTBOX_CHAT_RATE, OUTBOX_GROUP_RATE, OUTBOX_BURST,
+                           OUTBOX_WORKERS, OUTBOX_RETRIES)
+import metrics
+from metrics import charge, current, instrument, observe
+from ratelimit import TokenBucket
+# ===================
+
+# ==== Global Variables ====
+MESSAGE_LIMIT = 4096    # Characters of a text message
+CAPTION_LIMIT = 1024    # Characters of a photo caption
+
+PHOTO_FAILED  = "Sorry, I could not send the picture :("
+# ==========================
+
+# ==== Functions ====
+def upload_photo(bot, chat_id, data, **kwargs):
+    """ MESSAGE = UPLOAD_PHOTO(BOT, CHAT_ID, DATA, **KWARGS)
+
+        Uploads the picture DATA (bytes) to the chat CHAT_ID (KWARGS as in BOT.SEND_PHOTO).
+    """
+    return bot.send_photo(chat_id=chat_id, photo=io.BytesIO(data), **kwargs)
+# --
+# ===================
+
+# ==== Outbox ====
+class Outgoing:
+    """ ITEM = OUTGOING(BOT, CHAT_ID; TEXT, KWARGS, CALL, FALLBACK)
+
+        A reply waiting in the outbox: either a TEXT message (sent with KWARGS) or a CALL(BOT,
+        CHAT_ID) that does the sending itself (e.g. pictures), with a FALLBACK reply (or None)
+        sent instead if it fails for good. It keeps the name of the handler that queued it,
+        which is charged with the time taken to send it.
+    """
+    __slots__ = ('bot', 'chat_id', 'text', 'kwargs', 'call', 'fallback', 'attempts', 'queued_at', 'handler')
+
+    def __init__(self, bot, chat_id, text=None, kwargs=None, call=None, fallback=None):
+        self.bot       = bot
+        self.chat_id   = chat_id
+        self.text      = text
+        self.kwargs    = kwargs or {}
+        self.call      = call
+        self.fallback  = fallback
+        self.attempts  = 0
+        self.queued_at = monotonic()
+        self.handler   = current()
+# --
+
+class Outbox:
+    """ OUTBOX = OUTBOX(RATE, CHAT_RATE, GROUP_RATE, BURST, WORKERS, RETRIES)
+
+        Queue of the replies of the bot, so handlers return as soon as their replies are queued.
+        WORKERS threads send them in order within each chat, taking turns between chats, and
+        never faster than the token buckets allow: RATE messages per second overall, and
+        CHAT_RATE (private chats) or GROUP_RATE (groups) per second in each chat, with bursts
+        of BURST messages. Text messages queued in a row for a chat are sent as one (up to
+        MESSAGE_LIMIT characters). A send refused with RetryAfter waits as long as Telegram
+        asks; network errors are retried RETRIES times, with a growing pause.
+
+        With OUTBOX.SYNC set, replies are sent right away in the calling thread instead.
+    """
+
+    def __init__(self, rate=OUTBOX_RATE, chat_rate=OUTBOX_CHAT_RATE, group_rate=OUTBOX_GROUP_RATE,
+                 burst=OUTBOX_BURST, workers=OUTBOX_WORKERS, retries=OUTBOX_RETRIES):
+        self.sync       = False
+        self.chat_rate  = chat_rate
+        self.group_rate = group_rate
+        self.burst      = burst
+        self.workers    = workers
+        self.retries    = retries
+
+        self._global     = TokenBucket(rate)
+        self._buckets    = {}               # Chat id ~> TokenBucket
+        self._queues     = OrderedDict()    # Chat id ~> deque of Outgoing (chats in turn order)
+        self._busy       = set()            # Chats with a reply being sent
+        self._not_before = {}               # Chat id ~> time it may be sent to again
+        self._threads    = []
+        self._closed     = False
+        self._cond       = threading.Condition()
+
+        self._send = instrument(self._send, "outbox")
+
+    def send_message(self, bot, chat_id, text, **kwargs):
+        """ OUTBOX.SEND_MESSAGE(BOT, CHAT_ID, TEXT, **KWARGS)
+
+            Queues a text message (KWARGS as in BOT.SEND_MESSAGE, e.g. PARSE_MODE).
+        """
+        self.put(Outgoing(bot, chat_id, text=text, kwargs=kwargs))
+
+    def send_photo(self, bot, chat_id, path, **kwargs):
+        """ OUTBOX.SEND_PHOTO(BOT, CHAT_ID, PATH, **KWARGS)
+
+            Queues the upload of the picture in PATH (KWARGS as in BOT.SEND_PHOTO, e.g. CAPTION).
+            The picture is read right away, since its file may be gone (e.g. dropped by the
+            render cache) by the time it is sent. If it cannot be sent, its CAPTION is sent as
+            a text message (with the same PARSE_MODE) or, without one, PHOTO_FAILED.
+        """
+        if kwargs.get('caption'):
+            fallback = Outgoing(bot, chat_id, text=kwargs['caption'],
+                                kwargs={key: kwargs[key] for key in ('parse_mode',) if key in kwargs})
+        else:
+            fallback = Outgoing(bot, chat_id, text=PHOTO_FAILED)
+
+        try:
+            with metrics.section('io'), open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            traceback.print_exc()
+            self.put(fallback)
+            return
+
+        self.put(Outgoing(bot, chat_id, call=lambda bot, chat_id: upload_photo(bot, chat_id, data, **kwargs),
+                          fallback=fallback))
+
+    def call(self, bot, chat_id, func):
+        """ OUTBOX.CALL(BOT, CHAT_ID, FUNC)
+
+            Queues FUNC(BOT, CHAT_ID), a function that sends something to the chat CHAT_ID.
+        """
+        self.put(Outgoing(bot, chat_id, call=func))
+
+    def put(self, item):
+        if self.sync:
+            self._deliver(item)
+            return
+
+        with self._cond:
+            self._queues.setdefault(item.chat_id, deque()).append(item)
+            if not self._threads:
+                self._start()
+            self._cond.notify()
+
+    def drain(self, timeout=None):
+        """ EMPTY = OUTBOX.DRAIN(TIMEOUT)
+
+            Waits (up to TIMEOUT seconds) until every queued reply was sent, returning whether
+            the outbox is EMPTY.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queues and not self._busy, timeout)
+
+    def close(self, timeout=10):
+        """ OUTBOX.CLOSE(TIMEOUT)
+
+            Sends what is still queued (waiting up to TIMEOUT seconds) and stops the workers.
+        """
+        self.drain(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _start(self):
+        # Must be called with the lock held
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name="outbox_{0}".format(i), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _bucket(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            rate   = self.group_rate if chat_id < 0 else self.chat_rate
+            bucket = self._buckets[chat_id] = TokenBucket(rate, self.burst)
+
+        return bucket
+
+    def _next(self):
+        # Blocks until some chat may be sent to, returning its next item (None once closed)
+        with self._cond:
+            while True:
+                now, wait = monotonic(), None
+
+                for chat_id, queue in self._queues.items():
+                    if chat_id in self._busy:
+                        continue
+
+                    bucket = self._bucket(chat_id)
+                    delay  = max(self._not_before.get(chat_id, 0)-now, bucket.delay(now=now), self._global.delay(now=now))
+                    if delay <= 0:
+                        bucket.take(now=now)
+                        self._global.take(now=now)
+                        self._not_before.pop(chat_id, None)
+                        self._busy.add(chat_id)
+
+                        item = self._coalesce(queue)
+                        if queue:
+                            self._queues.move_to_end(chat_id)
+                        else:
+                            del self._queues[chat_id]
+                        return item
+
+                    wait = delay if wait is None else min(wait, delay)
+
+                if self._closed and not self._queues:
+                    return None
+                self._cond.wait(wait)
+
+    def _coalesce(self, queue):
+        # Folds the text messages queued in a row (with the same options) into the first one
+        item = queue.popleft()
+        while (item.call is None and queue and queue[0].call is None and queue[0].bot is item.bot
+               and queue[0].kwargs == item.kwargs and len(item.text)+2+len(queue[0].text) <= MESSAGE_LIMIT):
+            item.text += "\n\n" + queue.popleft().text
+
+        return item
+
+    def _send(self, item):
+        if item.call is not None:
+            return item.call(item.bot, item.chat_id)
+        return item.bot.send_message(chat_id=item.chat_id, text=item.text, **item.kwargs)
+
+    def _deliver(self, item):
+        # Sends ITEM, charging the time to the 'telegram' section of the handler that queued it
+        #   (the 'outbox' handler itself holds the time of every reply)
+        t = monotonic()
+        try:
+            return self._send(item)
+        finally:
+            if item.handler is not None:
+                charge(item.handler, 'telegram', monotonic()-t)
+
+    def _fail(self, item):
+        # ITEM could not be sent: its fallback reply (if any) is queued in its place
+        traceback.print_exc()
+        if item.fallback is not None:
+            self.put(item.fallback)
+
+    def _retry(self, item, delay):
+        # Puts ITEM back at the head of its chat, to be sent again after DELAY seconds
+        with self._cond:
+            self._queues.setdefault(item.chat_id, deque()).appendleft(item)
+            self._not_before[item.chat_id] = monotonic()+delay
+
+    def _work(self):
+        while True:
+            item = self._next()
+            if item is None:
+                return
+
+            observe("outbox.wait", monotonic()-item.queued_at)
+            try:
+                self._deliver(item)
+
+            except RetryAfter as e:     # Flood limit reached: Telegram says how long to wait
+                self._retry(item, e.retry_after)
+
+            except BadRequest:          # Retrying would not help
+                self._fail(item)
+
+            except NetworkError:
+                item.attempts += 1
+                if item.attempts <= self.retries:
+                    self._retry(item, 2**item.attempts)
+                else:
+                    self._fail(item)
+
+            except Exception:
+                self._fail(item)
+
+            finally:
+                with self._cond:
+                    self._busy.discard(item.chat_id)
+                    self._cond.notify_all()
+# --
+
+OUTBOX = Outbox()
+# --
+# ===================
@@ -0,0 +1,155 @@
+# ==== Libraries ====
+import json
+import os
+import random
+import threading
+
+from telegram.error import BadRequest
+
+from fileio import FileCache, atomic_write
+# ===================
+
+# ==== Global Variables ====
+DOGS_DIR = "res/dogs/"
+FILE_IDS = "data/dog_file_ids.json"
+# ==========================
+
+# ==== Photo Catalog ====
+class PhotoCatalog(FileCache):
+    """ CATALOG = PHOTOCATALOG(FOLDER, FILE_IDS)
+
+        An in-memory listing of the pictures inside FOLDER, only re-scanned when the folder
+        itself changes (a file is added, removed or renamed). The Telegram file_id returned
+        after a picture is first uploaded is kept in the JSON file FILE_IDS, so later sends of
+        the same picture reference it instead of uploading its bytes again.
+    """
+
+    _CACHE_FILE = 'file_ids'
+    _CACHE      = '_ids'
+
+    def __init__(self, folder=DOGS_DIR, file_ids=FILE_IDS):
+        self.folder   = folder
+        self.file_ids = file_ids
+
+        self._mtime   = None
+        self._files   = ()
+        self._sizes   = {}      # Name ~> size, to notice a picture replaced by another one
+        self._ids     = None    # Name ~> {'file_id', 'size'}
+        self._lock    = threading.Lock()
+
+    def files(self):
+        """ FILES = CATALOG.FILES()
+
+            Returns a tuple with the name of all files within the folder.
+        """
+        mtime = os.stat(self.folder).st_mtime_ns
+
+        with self._lock:
+            if mtime != self._mtime:
+                with os.scandir(self.folder) as entries:
+                    sizes = {e.name: e.stat().st_size for e in entries if e.is_file()}
+
+                self._files = tuple(sorted(sizes))
+                self._sizes = sizes
+                self._mtime = mtime
+
+            return self._files
+
+    def choice(self):
+        """ NAME = CATALOG.CHOICE()
+
+            Samples the NAME of a picture uniformly at random.
+        """
+        return random.choice(self.files())
+
+    def _load_ids(self):
+        # Must be called with the lock held
+        if self._ids is None:
+            try:
+                with open(self.file_ids, "r") as f:
+                    self._ids = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._ids = {}
+
+        return self._ids
+
+    def file_id(self, name):
+        """ FILE_ID = CATALOG.FILE_ID(NAME)
+
+            Returns the cached Telegram FILE_ID of the picture NAME (None if it must be uploaded).
+        """
+        with self._lock:
+            entry = self._load_ids().get(name)
+            if entry is None or entry.get('size') != self._sizes.get(name):
+                return None
+
+            return entry['file_id']
+
+    def remember(self, name, file_id):
+        """ CATALOG.REMEMBER(NAME, FILE_ID)
+
+            Stores the Telegram FILE_ID of the picture NAME (persisted right away).
+        """
+        with self._lock:
+            ids = self._load_ids()
+            ids[name] = {'file_id': file_id, 'size': self._sizes.get(name)}
+            data = json.dumps(ids, indent=1, sort_keys=True).encode("utf-8")
+
+        atomic_write(self.file_ids, data)
+
+    def forget(self, name):
+        """ CATALOG.FORGET(NAME)
+
+            Drops the cached file_id of the picture NAME (e.g. when Telegram refuses it).
+        """
+        with self._lock:
+            self._load_ids().pop(name, None)
+
+    def snapshot(self):
+        """ DATA = CATALOG.SNAPSHOT()
+
+            Returns the listing and the known file_ids, to warm up the catalog after a restart
+            (see RESTORE).
+        """
+        with self._lock:
+            return (self._mtime, self._files, dict(self._sizes), self._snapshot_cache())
+
+    def restore(self, data):
+        """ CATALOG.RESTORE(DATA)
+
+            Takes the listing and the file_ids of a SNAPSHOT, unless they were already read. The
+            listing is still scanned again if the folder changed, and the file_ids are only
+            taken if their file did not change since the snapshot.
+        """
+        mtime, files, sizes, ids = data
+        with self._lock:
+            if self._mtime is None:
+                self._mtime, self._files, self._sizes = mtime, files, sizes
+            if ids is not None:
+                self._restore_cache(ids)
+
+    def send(self, bot, chat_id):
+        """ MESSAGE = CATALOG.SEND(BOT, CHAT_ID)
+
+            Sends a random picture to the chat CHAT_ID, by file_id whenever possible.
+        """
+        name    = self.choice()
+        file_id = self.file_id(name)
+
+        if file_id is not None:
+            try:
+                return bot.send_photo(chat_id=chat_id, photo=file_id)
+            except BadRequest:  # The file_id is no longer valid, so it is uploaded again
+                self.forget(name)
+
+        with open(os.path.join(self.folder, name), 'rb') as photo:
+            message = bot.send_photo(chat_id=chat_id, photo=photo)
+
+        self.remember(name, message.photo[-1].file_id)
+
+        return message
+# --
+
+DOGS = PhotoCatalog()
+# --
+# ===================
@@ -0,0 +1,164 @@
+# ==== Libraries ====
+import multiprocessing
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from functools import wraps
+from time import monotonic
+
+from conf.settings import (HEAVY_WORKERS, HEAVY_QUEUE, HEAVY_TIMEOUT, LIGHT_WORKERS, LIGHT_QUEUE,
+                           LIGHT_TIMEOUT, RENDER_PROCESSES)
+from metrics import count
+from outbox import OUTBOX
+# ===================
+
+# ==== Global Variables ====
+BUSY_MESSAGE    = "I'm a bit busy right now, please try again in a moment :T"
+TIMEOUT_MESSAGE = "Sorry, that took too long :( Please try again later."
+
+_THREAD_POOLS = {}
+_PROCESS_POOL = None
+_POOLS_GUARD  = threading.Lock()
+# ==========================
+
+# ==== Functions ====
+def thread_pool(name, workers):
+    """ POOL = THREAD_POOL(NAME, WORKERS)
+
+        Returns the thread POOL called NAME, creating it with WORKERS threads if needed.
+    """
+    with _POOLS_GUARD:
+        pool = _THREAD_POOLS.get(name)
+        if pool is None:
+            pool = _THREAD_POOLS[name] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+
+    return pool
+# --
+
+def run_cpu(func, *args, timeout=HEAVY_TIMEOUT):
+    """ RESULT = RUN_CPU(FUNC, *ARGS; TIMEOUT)
+
+        Runs FUNC(*ARGS) in the render process pool and waits (up to TIMEOUT seconds) for its
+        RESULT, so CPU-bound work (pandas, matplotlib) does not hold the interpreter lock of the
+        bot process. FUNC and ARGS must be pickleable. On a timeout the workers of the pool are
+        killed and the next call starts a new pool, so a stuck render does not keep a process
+        busy. With RENDER_PROCESSES = 0 it simply calls FUNC in the current thread.
+    """
+    global _PROCESS_POOL
+
+    if RENDER_PROCESSES <= 0:
+        return func(*args)
+
+    with _POOLS_GUARD:
+        if _PROCESS_POOL is None:
+            # Forking a process full of threads can deadlock the child, so workers are spawned
+            _PROCESS_POOL = ProcessPoolExecutor(max_workers=RENDER_PROCESSES,
+                                                mp_context=multiprocessing.get_context("spawn"))
+        pool = _PROCESS_POOL
+
+    try:
+        return pool.submit(func, *args).result(timeout=timeout)
+
+    except BrokenProcessPool:   # A worker died; the next call starts a new pool
+        _discard_process_pool(pool)
+        raise
+
+    except FutureTimeout:       # The worker is stuck, so it is killed along with its pool
+        _discard_process_pool(pool)
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False)
+        raise
+# --
+
+def _discard_process_pool(pool):
+    # Makes the next RUN_CPU start a new process pool instead of using POOL
+    global _PROCESS_POOL
+
+    with _POOLS_GUARD:
+        if _PROCESS_POOL is pool:
+            _PROCESS_POOL = None
+# --
+
+def offload(handler, pool="light", workers=LIGHT_WORKERS, max_pending=LIGHT_QUEUE, timeout=LIGHT_TIMEOUT):
+    """ WRAPPED = OFFLOAD(HANDLER; POOL, WORKERS, MAX_PENDING, TIMEOUT)
+
+        Wraps a command HANDLER so it runs in the thread pool called POOL instead of in the
+        dispatcher thread, which is then free to handle the next update right away.
+        At most MAX_PENDING calls of this HANDLER may be queued or running; further calls are
+        answered with a "busy" message. A call that waited more than TIMEOUT seconds to start
+        is dropped, as is any heavy work of the HANDLER that exceeds TIMEOUT (see RUN_CPU).
+        If the HANDLER has an ADMIT(UPDATE, CONTEXT) attribute (see RESTRICTED), calls it
+        rejects are dropped right away, in the dispatcher thread, so they never take a pending
+        slot (ADMIT answers them itself, if needed).
+    """
+    slots = threading.BoundedSemaphore(max_pending)
+    admit = getattr(handler, 'admit', None)
+    name  = handler.__name__
+
+    def run(update, context, queued_at):
+        try:
+            if monotonic()-queued_at > timeout:
+                count(name, 'expired')
+                OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id, text=TIMEOUT_MESSAGE)
+                return
+
+            handler(update, context)
+
+        except (FutureTimeout, BrokenProcessPool):
+            OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id, text=TIMEOUT_MESSAGE)
+
+        except Exception:
+            traceback.print_exc()
+
+        finally:
+            slots.release()
+
+    @wraps(handler)
+    def wrapped(update, context):
+        if admit is not None and not admit(update, context):
+            return
+
+        if not slots.acquire(blocking=False):
+            count(name, 'busy')
+            OUTBOX.send_message(context.bot, chat_id=update.effective_chat.id, text=BUSY_MESSAGE)
+            return
+
+        thread_pool(pool, workers).submit(run, update, context, monotonic())
+
+    return wrapped
+# --
+
+def heavy(handler):
+    """ WRAPPED = HEAVY(HANDLER)
+
+        OFFLOAD with the settings of the 'heavy' pool (HEAVY_WORKERS, HEAVY_QUEUE, HEAVY_TIMEOUT).
+    """
+    return offload(handler, "heavy", HEAVY_WORKERS, HEAVY_QUEUE, HEAVY_TIMEOUT)
+# --
+
+def light(handler):
+    """ WRAPPED = LIGHT(HANDLER)
+
+        OFFLOAD with the settings of the 'light' pool (LIGHT_WORKERS, LIGHT_QUEUE, LIGHT_TIMEOUT).
+    """
+    return offload(handler, "light", LIGHT_WORKERS, LIGHT_QUEUE, LIGHT_TIMEOUT)
+# --
+
+def shutdown():
+    """ SHUTDOWN()
+
+        Waits for the running handlers and stops every pool.
+    """
+    global _PROCESS_POOL
+
+    with _POOLS_GUARD:
+        pools = list(_THREAD_POOLS.values()) + ([_PROCESS_POOL] if _PROCESS_POOL else [])
+        _THREAD_POOLS.clear()
+        _PROCESS_POOL = None
+
+    for pool in pools:
+        pool.shutdown(wait=True)
+# --
+# ===================
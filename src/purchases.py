@@ -0,0 +1,474 @@
+# ==== Libraries ====
+import csv
+import glob
+import json
+import math
+import os
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+
+import metrics
+from conf.settings import PURCHASE_BACKEND, PURCHASE_DB
+from fileio import WriteBehind, atomic_write, path_lock
+from ledger import DATA_DIR, append_purchases, ledger_path, totals_path
+# ===================
+
+# ==== Global Variables ====
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS compras (
+        id    INTEGER PRIMARY KEY,
+        name  TEXT NOT NULL,
+        cost  REAL NOT NULL,
+        type  TEXT NOT NULL,
+        date  TEXT NOT NULL             -- ISO format (YYYY-MM-DD), so it sorts and indexes
+    );
+    CREATE INDEX IF NOT EXISTS compras_date      ON compras (date);
+    CREATE INDEX IF NOT EXISTS compras_type_date ON compras (type, date);
+
+    CREATE TABLE IF NOT EXISTS imported (
+        filename TEXT PRIMARY KEY,
+        rows     INTEGER NOT NULL
+    );
+"""
+
+_STORES = {}    # Data folder ~> store
+_STORE_GUARD = threading.Lock()
+# ==========================
+
+# ==== Functions ====
+def month_of(date):
+    """ MONTH = MONTH_OF(DATE)
+
+        Returns the 'YYYY-MM' MONTH of a DATE in the DD/MM/YYYY format of the COMPRAS files.
+    """
+    return date[6:10]+"-"+date[3:5]
+# --
+
+def iso_date(date):
+    """ ISO = ISO_DATE(DATE)
+
+        Converts a DD/MM/YYYY DATE to the YYYY-MM-DD format (and back, since it is symmetric
+        on the separators used).
+    """
+    if "/" in date:
+        return date[6:10]+"-"+date[3:5]+"-"+date[0:2]
+    return date[8:10]+"/"+date[5:7]+"/"+date[0:4]
+# --
+
+def cents(cost):
+    """ CENTS = CENTS(COST)
+
+        Converts a COST (a number or a string like '4.50') to an integer number of CENTS, so
+        running totals never accumulate rounding errors.
+    """
+    return int(round(float(cost)*100))
+# --
+
+def valid_row(row):
+    """ OK = VALID_ROW(ROW)
+
+        Whether a ROW read from a COMPRAS file is a purchase: 4 fields, with a finite COST.
+    """
+    if len(row) != 4:
+        return False
+
+    try:
+        return math.isfinite(float(row[1]))
+    except ValueError:
+        return False
+# --
+
+def ledger_rows(path):
+    """ ROWS = LEDGER_ROWS(PATH)
+
+        Reads the ROWS (lists of fields) of the COMPRAS file in PATH, without its header and
+        blank lines. A torn last line (the bot stopped while appending it) is left out.
+        Raises FileNotFoundError if there is no such file.
+    """
+    with metrics.section('io'), open(path, "r", newline="") as f:
+        lines = f.readlines()
+
+    if lines and not lines[-1].endswith("\n"):
+        lines.pop()
+
+    return [row for row in csv.reader(lines[1:]) if row]
+# --
+
+def group_totals(rows):
+    """ TOTALS = GROUP_TOTALS(ROWS)
+
+        Sums the cost of purchase ROWS (tuples in the ledger COLUMNS order) by category,
+        returning a list of (TYPE, TOTAL) tuples sorted by category name.
+    """
+    totals = {}
+    for _, cost, type, _ in rows:
+        totals[type] = totals.get(type, 0.0) + float(cost)
+
+    return sorted(totals.items())
+# --
+# ===================
+
+# ==== Stores ====
+class CSVStore(WriteBehind):
+    """ STORE = CSVSTORE(FOLDER)
+
+        Purchases stored as one append-only COMPRAS data file per month inside FOLDER.
+        This is the default backend.
+
+        The totals of each month by category are kept up to date as purchases are added, and
+        saved next to the data file (DELAY seconds after they change, also when a month was only
+        read) together with the size of the file they account for. When the file grew beyond that size (e.g. the bot stopped before
+        saving the totals), only the rows after it are read.
+    """
+
+    def __init__(self, folder=DATA_DIR, delay=1.0):
+        WriteBehind.__init__(self, delay)
+        self.folder   = folder
+        self.location = folder
+
+        self._totals = {}   # Month ~> [size of the file counted, rows counted, {type: cents}]
+        self._dirty  = set()
+        self._lock   = threading.Lock()
+
+    def add(self, rows):
+        """ STORE.ADD(ROWS)
+
+            Appends purchase ROWS (NAME, COST, TYPE, DATE) to the file of their months, and
+            adds them to the totals of the months.
+        """
+        months = OrderedDict()
+        for row in rows:
+            months.setdefault(month_of(row[3]), []).append(row)
+
+        for month, month_rows in months.items():
+            path = ledger_path(month, self.folder)
+            with path_lock(path):
+                state = self._month_totals(month)
+                append_purchases(path, month_rows)
+
+                state[0]  = os.path.getsize(path)
+                state[1] += len(month_rows)
+                for _, cost, type, _ in month_rows:
+                    state[2][type] = state[2].get(type, 0) + cents(cost)
+
+            self._schedule_flush(month)
+
+    def month(self, month):
+        """ ROWS = STORE.MONTH(MONTH)
+
+            Returns the purchase ROWS of a 'YYYY-MM' MONTH, in the order they were added.
+        """
+        try:
+            rows = ledger_rows(ledger_path(month, self.folder))
+        except FileNotFoundError:
+            return []
+
+        # Rows that are not purchases (e.g. without their 4 fields, or a 'nan' cost) are left
+        #   out, as in the running totals
+        return [(name, float(cost), type, date) for name, cost, type, date in filter(valid_row, rows)]
+
+    def months(self):
+        """ MONTHS = STORE.MONTHS()
+
+            Returns the sorted 'YYYY-MM' MONTHS that have purchases.
+        """
+        return sorted(os.path.basename(path)[8:15] for path in glob.glob(ledger_path("*", self.folder)))
+
+    def totals(self, month):
+        """ TOTALS = STORE.TOTALS(MONTH)
+
+            Returns the (TYPE, TOTAL) expenses of a 'YYYY-MM' MONTH, sorted by category.
+        """
+        with path_lock(ledger_path(month, self.folder)):
+            state = self._month_totals(month)
+            return sorted((type, total/100) for type, total in state[2].items())
+
+    def count(self, month):
+        """ COUNT = STORE.COUNT(MONTH)
+
+            Returns the number of purchases of a 'YYYY-MM' MONTH (from its running totals).
+        """
+        with path_lock(ledger_path(month, self.folder)):
+            return self._month_totals(month)[1]
+
+    def _month_totals(self, month):
+        # Must be called holding the lock of the data file: the totals of MONTH, up to date
+        path  = ledger_path(month, self.folder)
+        state = self._totals.get(month) or self._load_totals(month)
+
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            size = 0
+
+        counted = state[0]
+        if size < state[0]:     # The file was replaced: everything is counted again
+            state = [0, 0, {}]
+        if size > state[0]:
+            self._count_tail(path, state)
+
+        self._totals[month] = state
+        if state[0] != counted:     # Saves what was read, so it is not read again (e.g. closed months)
+            self._schedule_flush(month)
+
+        return state
+
+    def _count_tail(self, path, state):
+        # Adds the whole rows of the file after the size already counted to the totals. The
+        #   file is streamed line by line, so memory does not grow with its size
+        with metrics.section('io'), open(path, "rb") as f:
+            f.seek(state[0])
+            if state[0] == 0:
+                state[0] += len(f.readline())   # Skips the header
+
+            for line in f:
+                if not line.endswith(b"\n"):    # A torn last line is left for later
+                    break
+
+                state[0] += len(line)
+                for name, cost, type, date in filter(valid_row, csv.reader([line.decode("utf-8")])):
+                    state[1] += 1
+                    state[2][type] = state[2].get(type, 0) + cents(cost)
+
+    def _load_totals(self, month):
+        try:
+            with open(totals_path(month, self.folder), "r") as f:
+                saved = json.load(f)
+            return [saved['size'], saved['count'], saved['totals']]
+
+        except (FileNotFoundError, ValueError, KeyError):
+            return [0, 0, {}]
+
+    def _schedule_flush(self, month):
+        # Only the totals of the months changed are saved
+        with self._lock:
+            self._dirty.add(month)
+        WriteBehind._schedule_flush(self)
+
+    def flush(self):
+        """ STORE.FLUSH()
+
+            Saves the totals changed since the last save right away.
+        """
+        self._flush_due()
+        with self._lock:
+            months, self._dirty = self._dirty, set()
+
+        for month in sorted(months):
+            with path_lock(ledger_path(month, self.folder)):
+                state = self._totals[month]
+                data  = {'size': state[0], 'count': state[1], 'totals': state[2]}
+                atomic_write(totals_path(month, self.folder), json.dumps(data, sort_keys=True).encode("utf-8"))
+
+    def snapshot(self):
+        """ DATA = STORE.SNAPSHOT()
+
+            Returns the running totals of the months read so far, to warm up the store after a
+            restart (see RESTORE).
+        """
+        data = {}
+        for month in list(self._totals):
+            with path_lock(ledger_path(month, self.folder)):
+                state = self._totals[month]
+                data[month] = [state[0], state[1], dict(state[2])]
+
+        return data
+
+    def restore(self, data):
+        """ STORE.RESTORE(DATA)
+
+            Takes the running totals of a SNAPSHOT for the months not read yet. They are checked
+            against the data files as usual, so rows added after the snapshot are still counted.
+        """
+        for month, state in data.items():
+            with path_lock(ledger_path(month, self.folder)):
+                self._totals.setdefault(month, state)
+
+    def version(self, month):
+        """ VERSION = STORE.VERSION(MONTH)
+
+            Returns a VERSION token of the content of a 'YYYY-MM' MONTH, which changes whenever
+            a purchase is added to it (None if there are no purchases yet).
+        """
+        try:
+            st = os.stat(ledger_path(month, self.folder))
+            return (st.st_mtime_ns, st.st_size)
+
+        except FileNotFoundError:
+            return None
+# --
+
+class SQLiteStore:
+    """ STORE = SQLITESTORE(PATH)
+
+        Purchases stored in a single SQLite database in PATH, indexed by date and by
+        category, so monthly totals and cross-month queries never scan the whole history.
+    """
+
+    def __init__(self, path=PURCHASE_DB):
+        self.path     = path
+        self.location = path
+        self._local   = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        # SQLite connections cannot be shared between threads, so each thread gets one
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+
+        return conn
+
+    def add(self, rows):
+        """ STORE.ADD(ROWS)
+
+            Inserts purchase ROWS (NAME, COST, TYPE, DATE) in one transaction.
+        """
+        with metrics.section('io'), self._conn() as conn:
+            conn.executemany("INSERT INTO compras (name, cost, type, date) VALUES (?, ?, ?, ?)",
+                             [(name, float(cost), type, iso_date(date)) for name, cost, type, date in rows])
+
+    def between(self, start, end, type=None):
+        """ ROWS = STORE.BETWEEN(START, END; TYPE)
+
+            Returns the purchase ROWS with START <= date < END (ISO dates), optionally only
+            those of the category TYPE.
+        """
+        query = "SELECT name, cost, type, date FROM compras WHERE date >= ? AND date < ?"
+        args  = [start, end]
+        if type is not None:
+            query += " AND type = ?"
+            args.append(type)
+
+        with metrics.section('io'):
+            return [(name, cost, type, iso_date(date))
+                    for name, cost, type, date in self._conn().execute(query+" ORDER BY date, id", args)]
+
+    def totals_between(self, start, end, type=None):
+        """ TOTALS = STORE.TOTALS_BETWEEN(START, END; TYPE)
+
+            Returns the (TYPE, TOTAL) expenses with START <= date < END (ISO dates).
+        """
+        query = "SELECT type, SUM(cost) FROM compras WHERE date >= ? AND date < ?"
+        args  = [start, end]
+        if type is not None:
+            query += " AND type = ?"
+            args.append(type)
+
+        with metrics.section('io'):
+            return self._conn().execute(query+" GROUP BY type ORDER BY type", args).fetchall()
+
+    def month(self, month):
+        return self.between(*_month_range(month))
+
+    def months(self):
+        with metrics.section('io'):
+            return [month for month, in self._conn().execute("SELECT DISTINCT substr(date, 1, 7) FROM compras ORDER BY 1")]
+
+    def totals(self, month):
+        return self.totals_between(*_month_range(month))
+
+    def count(self, month):
+        with metrics.section('io'):
+            return self._conn().execute("SELECT COUNT(*) FROM compras WHERE date >= ? AND date < ?",
+                                        _month_range(month)).fetchone()[0]
+
+    def version(self, month):
+        count, last = self._conn().execute("SELECT COUNT(*), MAX(id) FROM compras WHERE date >= ? AND date < ?",
+                                           _month_range(month)).fetchone()
+        return (count, last) if count else None
+
+    def flush(self):
+        pass    # Every change is commited right away
+
+    def snapshot(self):
+        return None     # The database keeps no state in memory
+
+    def restore(self, data):
+        pass
+
+    def import_csv(self, folder=DATA_DIR):
+        """ COUNT = STORE.IMPORT_CSV(FOLDER)
+
+            Ingests every COMPRAS data file inside FOLDER, returning the COUNT of imported rows.
+            The number of rows read from each file is recorded, so running it again only
+            imports the rows appended to the files since then. Rows that are not purchases
+            (see VALID_ROW) are skipped, and a torn last row is left for the next run.
+        """
+        count = 0
+        conn  = self._conn()
+
+        for filename in sorted(glob.glob(os.path.join(folder, "compras_*.csv"))):
+            key    = os.path.basename(filename)
+            record = conn.execute("SELECT rows FROM imported WHERE filename = ?", (key,)).fetchone()
+            done   = record[0] if record else 0
+            new    = ledger_rows(filename)[done:]
+            if not new:
+                continue
+
+            # The rows and the import record are commited together
+            rows = [row for row in new if valid_row(row)]
+            with conn:
+                conn.executemany("INSERT INTO compras (name, cost, type, date) VALUES (?, ?, ?, ?)",
+                                 [(name, float(cost), type, iso_date(date)) for name, cost, type, date in rows])
+                conn.execute("INSERT OR REPLACE INTO imported (filename, rows) VALUES (?, ?)",
+                             (key, done+len(new)))
+
+            count += len(rows)
+
+        return count
+# --
+
+def _month_range(month):
+    # Half-open ISO date range [first day of MONTH, first day of the next month)
+    year, mon = map(int, month.split("-"))
+    nxt = (year+1, 1) if mon == 12 else (year, mon+1)
+
+    return "{0:04d}-{1:02d}-01".format(year, mon), "{0:04d}-{1:02d}-01".format(*nxt)
+# --
+
+def db_path(folder=DATA_DIR):
+    """ PATH = DB_PATH(FOLDER)
+
+        Returns the PATH of the purchases database of a data FOLDER (PURCHASE_DB for the
+        main one).
+    """
+    return PURCHASE_DB if folder == DATA_DIR else os.path.join(folder, "compras.db")
+# --
+
+def get_store(folder=DATA_DIR):
+    """ STORE = GET_STORE(FOLDER)
+
+        Returns the purchase STORE of the data FOLDER (of a chat, see CHATS), of the kind
+        selected by the PURCHASE_BACKEND setting ('csv' or 'sqlite'). Each store is created
+        once and shared by every handler.
+    """
+    with _STORE_GUARD:
+        store = _STORES.get(folder)
+        if store is None:
+            if PURCHASE_BACKEND == "sqlite":
+                store = SQLiteStore(db_path(folder))
+            else:
+                store = CSVStore(folder)
+            _STORES[folder] = store
+
+    return store
+# --
+# ===================
+
+# ===================
+if __name__ == '__main__':
+    # Usage: python purchases.py import [FOLDER]   ~> Migrates every COMPRAS data file of a
+    #   data folder (the main one by default, or that of a chat) to its database
+    if sys.argv[1:2] != ["import"] or len(sys.argv) > 3:
+        print("usage: python purchases.py import [FOLDER]")
+        sys.exit(1)
+
+    folder = sys.argv[2] if len(sys.argv) > 2 else DATA_DIR
+    print("Imported {0} purchases into {1}.".format(SQLiteStore(db_path(folder)).import_csv(folder), db_path(folder)))
+# ===================
@@ -0,0 +1,68 @@
+# ==== Libraries ====
+import threading
+from time import monotonic
+# ===================
+
+# ==== Token Buckets ====
+class TokenBucket:
+    """ BUCKET = TOKENBUCKET(RATE; CAPACITY)
+
+        Rate limiter that refills RATE tokens per second, up to CAPACITY tokens (the largest
+        burst allowed, RATE by default, at least 1). A RATE <= 0 means no limit at all.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate     = float(rate)
+        self.capacity = float(max(1.0, capacity if capacity is not None else self.rate))
+        self.tokens   = self.capacity
+        self.updated  = monotonic()
+        self.lock     = threading.Lock()
+
+    def _refill(self, now):
+        # Must be called with the lock held
+        self.tokens  = min(self.capacity, self.tokens + (now-self.updated)*self.rate)
+        self.updated = now
+
+    def delay(self, n=1, now=None):
+        """ SECONDS = BUCKET.DELAY(N; NOW)
+
+            Returns how many SECONDS from NOW until N tokens are available (0 if they already
+            are), without taking them.
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        with self.lock:
+            now = monotonic() if now is None else now
+            self._refill(now)
+            return max(0.0, (n-self.tokens)/self.rate)
+
+    def take(self, n=1, now=None):
+        """ OK = BUCKET.TAKE(N; NOW)
+
+            Takes N tokens if they are available, returning whether they were taken.
+        """
+        if self.rate <= 0:
+            return True
+
+        with self.lock:
+            self._refill(monotonic() if now is None else now)
+            if self.tokens < n:
+                return False
+
+            self.tokens -= n
+            return True
+
+    def full(self, now=None):
+        """ FULL = BUCKET.FULL(NOW)
+
+            Whether the bucket is back to its CAPACITY (i.e. it was not used for a while).
+        """
+        if self.rate <= 0:
+            return True
+
+        with self.lock:
+            self._refill(monotonic() if now is None else now)
+            return self.tokens >= self.capacity
+# --
+# ===================
@@ -0,0 +1,302 @@
+# ==== Libraries ====
+import heapq
+import os
+import sqlite3
+import threading
+import traceback
+from datetime import datetime, timedelta
+from time import time
+
+import metrics
+from ledger import DATA_DIR
+from outbox import OUTBOX
+# ===================
+
+# ==== Global Variables ====
+REMINDERS_DB = os.path.join(DATA_DIR, "reminders.db")
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS reminders (
+        id      INTEGER PRIMARY KEY,
+        chat_id INTEGER NOT NULL,
+        text    TEXT NOT NULL,
+        cron    TEXT,                   -- NULL for one-shot reminders
+        next_at REAL NOT NULL           -- Unix timestamp of the next time it fires
+    );
+    CREATE INDEX IF NOT EXISTS reminders_chat ON reminders (chat_id);
+"""
+
+# Ranges of the five cron fields: minute, hour, day of month, month, day of week (0 = Sunday)
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+# ==========================
+
+# ==== Functions ====
+def parse_cron(spec):
+    """ FIELDS = PARSE_CRON(SPEC)
+
+        Parses a cron SPEC ('MINUTE HOUR DAY MONTH WEEKDAY', each one a '*', a number, a range
+        'A-B', a list 'A,B,...' or any of these with a step '/N') into a tuple of five sorted
+        tuples of allowed values. Raises ValueError if SPEC is not valid.
+    """
+    parts = spec.split()
+    if len(parts) != 5:
+        raise ValueError("a cron spec has five fields: {0!r}".format(spec))
+
+    fields = []
+    for part, (low, high) in zip(parts, CRON_FIELDS):
+        values = set()
+        for item in part.split(","):
+            item, _, step = item.partition("/")
+            if item == "*":
+                start, end = low, high
+            elif "-" in item:
+                start, end = map(int, item.split("-"))
+            else:
+                start = end = int(item)
+                if step:        # 'A/N' is 'A-(last)/N'
+                    end = high
+
+            if not (low <= start <= end <= high) or (step and int(step) < 1):
+                raise ValueError("invalid cron field: {0!r}".format(part))
+            values.update(range(start, end+1, int(step) if step else 1))
+
+        fields.append(tuple(sorted(values)))
+
+    # Sunday is both 0 and 7
+    if 7 in fields[4]:
+        fields[4] = tuple(sorted(set(fields[4]) - {7} | {0}))
+
+    return tuple(fields)
+# --
+
+def next_cron(spec, after):
+    """ WHEN = NEXT_CRON(SPEC, AFTER)
+
+        Returns the first datetime WHEN (in whole minutes) strictly after the datetime AFTER
+        that matches the cron SPEC. As in cron, when both the day of month and the day of
+        week are restricted, a day matching either of them is enough.
+    """
+    minutes, hours, days, months, weekdays = parse_cron(spec)
+    any_day, any_weekday = spec.split()[2] == "*", spec.split()[4] == "*"
+
+    start = (after + timedelta(minutes=1)).replace(second=0, microsecond=0)
+    day   = start.replace(hour=0, minute=0)
+
+    for _ in range(5*366):  # Enough for any valid spec (e.g. the 29th of February)
+        by_day, by_weekday = day.day in days, (day.weekday()+1) % 7 in weekdays
+        if day.month in months and (by_day and by_weekday if any_day or any_weekday else by_day or by_weekday):
+            for hour in hours:
+                for minute in minutes:
+                    when = day.replace(hour=hour, minute=minute)
+                    if when >= start:
+                        return when
+        day += timedelta(days=1)
+
+    raise ValueError("the cron spec never matches: {0!r}".format(spec))
+# --
+
+def parse_reminder(args, now):
+    """ WHEN, CRON, TEXT = PARSE_REMINDER(ARGS, NOW)
+
+        Parses the arguments of the /lembrete command, in one of the forms
+            [HH:MM] [TEXT]                      ~> Once, at the next HH:MM after NOW
+            [DD/MM(/YYYY)] [HH:MM] [TEXT]       ~> Once, on that day
+            daily [HH:MM] [TEXT]                ~> Every day
+            cron [MIN] [HOUR] [DAY] [MONTH] [WEEKDAY] [TEXT]
+        returning the datetime WHEN it fires first, its CRON spec (None if it fires once) and
+        its TEXT. Raises ValueError if ARGS are not valid.
+    """
+    args = list(args)
+    cron = None
+
+    if args and args[0].lower() in ("daily", "diario", "diário"):
+        hour, minute = map(int, args[1].split(":"))
+        cron = "{0} {1} * * *".format(minute, hour)
+        args = args[2:]
+
+    elif args and args[0].lower() == "cron":
+        cron = " ".join(args[1:6])
+        args = args[6:]
+
+    elif args and "/" in args[0]:
+        day = args[0].split("/")
+        if len(day) == 2:
+            day.append(str(now.year))
+        when = datetime.strptime("/".join(day)+" "+args[1], "%d/%m/%Y %H:%M")
+        args = args[2:]
+
+    else:
+        when = datetime.strptime(now.strftime("%d/%m/%Y ")+args[0], "%d/%m/%Y %H:%M")
+        if when <= now:
+            when += timedelta(days=1)
+        args = args[1:]
+
+    if cron is not None:
+        when = next_cron(cron, now)
+
+    if not args:
+        raise ValueError("missing the text of the reminder")
+    if when <= now:
+        raise ValueError("the reminder would be in the past")
+
+    return when, cron, " ".join(args)
+# --
+# ===================
+
+# ==== Reminders ====
+class Reminders:
+    """ REMINDERS = REMINDERS(PATH)
+
+        The reminders of every chat, stored in the SQLite database in PATH. They are kept in
+        memory in a heap ordered by their next fire time, and a single job of the JobQueue is
+        armed for the earliest of them, however many there are. Reminders that should have
+        fired while the bot was down are sent as soon as it starts (recurring ones only once,
+        then they continue from their next time).
+    """
+
+    def __init__(self, path=REMINDERS_DB):
+        self.path = path
+
+        self._entries = {}      # Id ~> (chat_id, text, cron, next_at)
+        self._heap    = []      # (next_at, id); entries removed or rescheduled are skipped
+        self._job     = None    # The armed job, and when it fires
+        self._armed   = None
+        self._jq      = None
+        self._conn    = None
+        self._lock    = threading.RLock()
+
+        self._fire = metrics.instrument(self._fire, "reminders_job")
+
+    def start(self, jq):
+        """ REMINDERS.START(JQ)
+
+            Loads the reminders and arms the JobQueue JQ for the first one that is due.
+        """
+        with self._lock:
+            self._jq   = jq
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.executescript(SCHEMA)
+
+            for id, chat_id, text, cron, next_at in self._conn.execute("SELECT id, chat_id, text, cron, next_at FROM reminders"):
+                self._entries[id] = (chat_id, text, cron, next_at)
+                self._heap.append((next_at, id))
+            heapq.heapify(self._heap)
+
+            self._arm()
+
+    def add(self, chat_id, text, when, cron=None):
+        """ ID = REMINDERS.ADD(CHAT_ID, TEXT, WHEN; CRON)
+
+            Schedules the message TEXT to the chat CHAT_ID at the datetime WHEN, repeating
+            it at every time matching the CRON spec, if given. Returns the ID of the reminder.
+        """
+        next_at = when.timestamp()
+        with self._lock, metrics.section('io'), self._conn:
+            id = self._conn.execute("INSERT INTO reminders (chat_id, text, cron, next_at) VALUES (?, ?, ?, ?)",
+                                    (chat_id, text, cron, next_at)).lastrowid
+
+            self._entries[id] = (chat_id, text, cron, next_at)
+            heapq.heappush(self._heap, (next_at, id))
+            self._arm()
+
+        return id
+
+    def remove(self, chat_id, id):
+        """ OK = REMINDERS.REMOVE(CHAT_ID, ID)
+
+            Removes the reminder ID of the chat CHAT_ID, returning whether it existed.
+        """
+        with self._lock:
+            entry = self._entries.get(id)
+            if entry is None or entry[0] != chat_id:
+                return False
+
+            with metrics.section('io'), self._conn:
+                self._conn.execute("DELETE FROM reminders WHERE id = ?", (id,))
+            del self._entries[id]
+
+        return True
+
+    def of_chat(self, chat_id):
+        """ LIST = REMINDERS.OF_CHAT(CHAT_ID)
+
+            Returns the (ID, TEXT, CRON, WHEN) reminders of the chat CHAT_ID, the next first.
+        """
+        with self._lock:
+            entries = [(id, text, cron, datetime.fromtimestamp(next_at))
+                       for id, (chat, text, cron, next_at) in self._entries.items() if chat == chat_id]
+
+        return sorted(entries, key=lambda entry: entry[3])
+
+    def _arm(self):
+        # Must be called with the lock held: (re)arms the job for the earliest reminder
+        while self._heap and self._entries.get(self._heap[0][1], (None,)*4)[3] != self._heap[0][0]:
+            heapq.heappop(self._heap)   # Removed, or rescheduled to another time
+
+        if not self._heap or self._jq is None:
+            return
+
+        next_at = self._heap[0][0]
+        if self._job is not None:
+            if self._armed <= next_at:
+                return
+            self._job.schedule_removal()
+
+        self._armed = next_at
+        self._job   = self._jq.run_once(self._fire, max(0.0, next_at-time()), name="reminders_job")
+
+    def _fire(self, context):
+        # Sends every due reminder, then re-arms the job for the next one
+        now, due = time(), []
+
+        with self._lock:
+            self._job = self._armed = None
+
+            while self._heap and self._heap[0][0] <= now:
+                next_at, id = heapq.heappop(self._heap)
+                entry = self._entries.get(id)
+                if entry is not None and entry[3] == next_at:
+                    due.append((id,)+entry)
+
+            updates, deletes = [], []
+            for id, chat_id, text, cron, _ in due:
+                if cron is None:
+                    deletes.append((id,))
+                    del self._entries[id]
+                    continue
+
+                try:
+                    next_at = next_cron(cron, datetime.fromtimestamp(now)).timestamp()
+                except ValueError:
+                    traceback.print_exc()
+                    continue
+
+                updates.append((next_at, id))
+                self._entries[id] = (chat_id, text, cron, next_at)
+                heapq.heappush(self._heap, (next_at, id))
+
+            # Every change of this pass is written in one transaction
+            if due:
+                with metrics.section('io'), self._conn:
+                    self._conn.executemany("DELETE FROM reminders WHERE id = ?", deletes)
+                    self._conn.executemany("UPDATE reminders SET next_at = ? WHERE id = ?", updates)
+
+            self._arm()
+
+        for id, chat_id, text, _, _ in due:
+            OUTBOX.send_message(context.bot, chat_id=chat_id, text="⏰ "+text)
+
+    def close(self):
+        """ REMINDERS.CLOSE()
+
+            Closes the database (the reminders are always saved as soon as they change).
+        """
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+# --
+
+REMINDERS = Reminders()
+# --
+# ===================
@@ -0,0 +1,306 @@
+# ==== Libraries ====
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import six
+
+from conf.settings import TABLE_PAGE_ROWS
+from lazy import lazy_import
+from metrics import section
+from ledger import COLUMNS
+from pools import run_cpu
+# ===================
+
+# ==== Lazy Libraries ====
+def _use_agg():
+    # The bot is headless; also avoids GUI backends keeping figures alive
+    import matplotlib
+    matplotlib.use("Agg")
+# --
+
+# The heavy libraries are only imported when the first table is rendered
+np  = lazy_import("numpy")
+pd  = lazy_import("pandas")
+plt = lazy_import("matplotlib.pyplot", before=_use_agg)
+# ===================
+
+# ==== Global Variables ====
+TMP_DIR = "tmp"
+
+NAME_WIDTH = 16     # Characters of a purchase name shown in a text table
+# ==========================
+
+# ==== Functions ====
+def render_table(data, col_width=3.0, row_height=0.625, font_size=14, header_color='#40466e', row_colors=['#f1f1f2', 'w'],
+                    edge_color='w', bbox=[0, 0, 1, 1], header_columns=0, ax=None, **kwargs):
+    """ AX = RENDER_TABLE(DATA; *args, **kwargs)
+
+        Plots a Pandas DataFrame in a Matplotlib figure using the table annotations.
+    """
+
+    # Resizes the table to fill the entire space and remove the figure axis (if None)
+    if ax is None:
+        size = (np.array(data.shape[::-1]) + np.array([0, 1])) * np.array([col_width, row_height])
+        fig, ax = plt.subplots(figsize=size)
+        ax.axis('off')
+
+    # Annotates the table inside the plot
+    mpl_table = ax.table(cellText=data.values, bbox=bbox, colLabels=list(map(lambda x : x.capitalize(), data.columns)), **kwargs)
+
+    # Customize fonts
+    mpl_table.auto_set_font_size(False)
+    mpl_table.set_fontsize(font_size)
+
+    # Customize the cells face and edge colors
+    for k, cell in  six.iteritems(mpl_table._cells):
+        cell.set_edgecolor(edge_color)
+        if k[0] == 0 or k[1] < header_columns:
+            cell.set_text_props(weight='bold', color='w')
+            cell.set_facecolor(header_color)
+        else:
+            cell.set_facecolor(row_colors[k[0]%len(row_colors) ])
+
+    return ax
+# --
+
+def save_table_png(rows, path):
+    """ SAVE_TABLE_PNG(ROWS, PATH)
+
+        Renders the purchase ROWS (tuples in the ledger COLUMNS order) as a table image saved
+        in PATH. The figure is closed afterwards, so no memory is kept between renders.
+    """
+    with section('pandas'):     # Only timed when rendering in the handler (RENDER_PROCESSES = 0)
+        data = pd.DataFrame(rows, columns=COLUMNS)
+
+    ax = render_table(data)
+
+    try:
+        ax.figure.savefig(path, format='png', transparent=True, bbox_inches='tight')
+    finally:
+        plt.close(ax.figure)
+# --
+
+def text_table(rows, page=0, page_rows=TABLE_PAGE_ROWS):
+    """ TEXT, PAGES = TEXT_TABLE(ROWS; PAGE, PAGE_ROWS)
+
+        Renders a PAGE (counted from 0) of the purchase ROWS (tuples in the ledger COLUMNS
+        order) as a monospace table inside a MarkdownV2 code block, PAGE_ROWS rows per page.
+        Returns its TEXT and the number of PAGES. Only the rows of that page are formatted,
+        and no figure is drawn, so a page takes the same (little) time for any month.
+    """
+    pages = max(1, -(-len(rows)//page_rows))
+    page  = min(max(page, 0), pages-1)
+
+    cells = [[column.capitalize() for column in COLUMNS]]
+    for name, cost, type, date in rows[page*page_rows:(page+1)*page_rows]:
+        name = name if len(name) <= NAME_WIDTH else name[:NAME_WIDTH-1]+"…"
+        cells.append([name, "{0:.2f}".format(cost), type, date[:5]])
+
+    widths = [max(len(row[idx]) for row in cells) for idx in range(len(COLUMNS))]
+    lines  = [" ".join([row[0].ljust(widths[0]), row[1].rjust(widths[1]), row[2].ljust(widths[2]), row[3]]).rstrip()
+              for row in cells]
+    lines.insert(1, "-"*max(map(len, lines)))
+
+    # Inside a code block only the backslash and the backtick must be escaped
+    text = "\n".join(lines).replace("\\", "\\\\").replace("`", "\\`")
+    return "```\n"+text+"\n```", pages
+# --
+
+def save_report_png(months, categories, matrix, path):
+    """ SAVE_REPORT_PNG(MONTHS, CATEGORIES, MATRIX, PATH)
+
+        Renders the monthly expenses of a report as stacked bars (one per month, split by
+        category) saved in PATH. MATRIX is a list with the totals of each one of the
+        CATEGORIES (columns) in each one of the MONTHS (rows).
+    """
+    fig, ax = plt.subplots(figsize=(max(6.0, 0.6*len(months)), 4.0))
+
+    try:
+        x, bottom = np.arange(len(months)), np.zeros(len(months))
+        for idx, category in enumerate(categories):
+            values = np.array([row[idx] for row in matrix])
+            ax.bar(x, values, bottom=bottom, label=category)
+            bottom += values
+
+        ax.set_xticks(x)
+        ax.set_xticklabels([month[5:7]+"/"+month[2:4] for month in months], rotation=45)
+        ax.set_ylabel("R$")
+        ax.spines['top'].set_visible(False)
+        ax.spines['right'].set_visible(False)
+        if categories:
+            ax.legend(fontsize='small', frameon=False)
+
+        fig.savefig(path, format='png', bbox_inches='tight')
+    finally:
+        plt.close(fig)
+# --
+# ===================
+
+# ==== Render Cache ====
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+# --
+
+class RenderCache:
+    """ CACHE = RENDERCACHE(FOLDER; MAX_ENTRIES)
+
+        Keeps the images rendered for the last MAX_ENTRIES keys inside FOLDER. A key must hold
+        the version of the data it depicts, so a cached image is only reused while the data is
+        unchanged. Concurrent requests for the same key render the image only once.
+    """
+
+    def __init__(self, folder=TMP_DIR, max_entries=16):
+        self.folder      = folder
+        self.max_entries = max_entries
+        self._entries    = OrderedDict()    # Key ~> path, in least recently used order
+        self._locks      = {}
+        self._rendering  = set()            # Temporary paths of the renders in progress
+        self._attempts   = 0
+        self._guard      = threading.Lock()
+
+    def _lookup(self, key):
+        # Must be called with the guard held
+        path = self._entries.get(key)
+        if path is not None and os.path.exists(path):
+            self._entries.move_to_end(key)
+            return path
+        return None
+
+    def get(self, key, render):
+        """ PATH = CACHE.GET(KEY, RENDER)
+
+            Returns the PATH of the image for KEY, calling RENDER(PATH) to create it when it
+            is not cached. Images are written to a temporary file and then renamed, so a PATH
+            returned to a handler is always complete.
+        """
+        with self._guard:
+            path = self._lookup(key)
+            if path is not None:
+                return path
+            lock = self._locks.setdefault(key, threading.Lock())
+
+        try:
+            with lock:
+                with self._guard:   # Another thread may have rendered it meanwhile
+                    path = self._lookup(key)
+                    if path is not None:
+                        return path
+
+                os.makedirs(self.folder, exist_ok=True)
+                self.sweep()
+
+                digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:16]
+                path   = os.path.join(self.folder, "render_"+digest+".png")
+
+                # Each attempt has its own name, so a killed render writing late cannot
+                # clobber the next one (its file is left to SWEEP)
+                with self._guard:
+                    self._attempts += 1
+                    tmp_path = os.path.join(self.folder, "tmp_{0}_{1}.png".format(digest, self._attempts))
+                    self._rendering.add(tmp_path)
+                try:
+                    render(tmp_path)
+                    os.replace(tmp_path, path)
+                finally:
+                    with self._guard:
+                        self._rendering.discard(tmp_path)
+                    _remove(tmp_path)
+
+                with self._guard:
+                    self._entries[key] = path
+                    self._evict()
+
+        finally:
+            with self._guard:
+                self._locks.pop(key, None)
+
+        return path
+
+    def sweep(self):
+        """ CACHE.SWEEP()
+
+            Removes the temporary files of FOLDER left behind by renders that failed or timed
+            out (their workers may still write them after the handler gave up).
+        """
+        try:
+            names = os.listdir(self.folder)
+        except FileNotFoundError:
+            return
+
+        with self._guard:
+            rendering = set(self._rendering)
+
+        for name in names:
+            path = os.path.join(self.folder, name)
+            if name.startswith("tmp") and name.endswith(".png") and path not in rendering:
+                _remove(path)
+
+    def _evict(self):
+        # Must be called with the guard held
+        while len(self._entries) > self.max_entries:
+            _, old_path = self._entries.popitem(last=False)
+            _remove(old_path)
+
+    def snapshot(self):
+        """ DATA = CACHE.SNAPSHOT()
+
+            Returns the cached (KEY, PATH) entries, to warm up the cache after a restart.
+        """
+        with self._guard:
+            return list(self._entries.items())
+
+    def restore(self, data):
+        """ CACHE.RESTORE(DATA)
+
+            Takes the entries of a SNAPSHOT whose images still exist (their keys hold the
+            version of the data, so they are only reused while it is unchanged), and sweeps
+            the temporary files left by the previous run.
+        """
+        with self._guard:
+            for key, path in reversed(data):    # Older than the entries already there
+                if key not in self._entries and os.path.exists(path):
+                    self._entries[key] = path
+                    self._entries.move_to_end(key, last=False)
+            self._evict()
+
+        self.sweep()
+# --
+
+RENDERS = RenderCache()
+# --
+
+def compras_png(store, month):
+    """ PATH = COMPRAS_PNG(STORE, MONTH)
+
+        Returns the PATH of the table image with the purchases of a 'YYYY-MM' MONTH in STORE.
+        The image is only rendered again after new purchases are added to the month, and
+        the rendering itself runs in the render process pool (see RUN_CPU).
+    """
+    def render(path):
+        rows = store.month(month)
+        with section('matplotlib'):
+            run_cpu(save_table_png, rows, path)
+
+    return RENDERS.get(('compras', store.location, month, store.version(month)), render)
+# --
+
+def report_png(months, categories, matrix):
+    """ PATH = REPORT_PNG(MONTHS, CATEGORIES, MATRIX)
+
+        Returns the PATH of the chart of a report (see SAVE_REPORT_PNG), rendered in the
+        render process pool only when a report with other numbers is asked.
+    """
+    matrix = [tuple(round(value, 2) for value in row) for row in matrix.tolist()]
+
+    def render(path):
+        with section('matplotlib'):
+            run_cpu(save_report_png, months, categories, matrix, path)
+
+    return RENDERS.get(('relatorio', tuple(months), tuple(categories), tuple(matrix)), render)
+# --
+# ===================
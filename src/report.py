@@ -0,0 +1,110 @@
+# ==== Libraries ====
+from datetime import datetime
+
+from lazy import lazy_import
+from metrics import section
+
+np = lazy_import("numpy")
+# ===================
+
+# ==== Global Variables ====
+MAX_MONTHS = 120    # Longest period of a report
+# ==========================
+
+# ==== Functions ====
+def parse_month(text):
+    """ MONTH = PARSE_MONTH(TEXT)
+
+        Converts a month TEXT in the MM/YYYY (or YYYY-MM) format to a 'YYYY-MM' MONTH.
+        Raises ValueError if TEXT is not a month.
+    """
+    for fmt in ("%m/%Y", "%Y-%m"):
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m")
+        except ValueError:
+            pass
+
+    raise ValueError("not a month: {0!r}".format(text))
+# --
+
+def month_span(first, last):
+    """ MONTHS = MONTH_SPAN(FIRST, LAST)
+
+        Returns every 'YYYY-MM' month from FIRST to LAST (both included).
+    """
+    year, month = map(int, first.split("-"))
+    months = []
+    while "{0:04d}-{1:02d}".format(year, month) <= last:
+        months.append("{0:04d}-{1:02d}".format(year, month))
+        year, month = (year+1, 1) if month == 12 else (year, month+1)
+
+    return months
+# --
+
+def parse_period(args, today):
+    """ MONTHS, TYPE = PARSE_PERIOD(ARGS, TODAY)
+
+        Parses the arguments of the /relatorio command, [from] [to] [category], all of them
+        optional: the period goes from January of the year of TODAY to the month of TODAY by
+        default. Returns the list of MONTHS and the category TYPE (None for all of them).
+        Raises ValueError if the period is not valid.
+    """
+    dates, words = [], []
+    for arg in args:
+        try:
+            dates.append(parse_month(arg))
+        except ValueError:
+            words.append(arg)
+
+    if len(dates) > 2 or len(words) > 1:
+        raise ValueError("too many arguments")
+
+    first  = dates[0] if dates else today.strftime("%Y-01")
+    last   = dates[1] if len(dates) > 1 else today.strftime("%Y-%m")
+    months = month_span(first, last)
+    if not months or len(months) > MAX_MONTHS:
+        raise ValueError("invalid period: {0} to {1}".format(first, last))
+
+    return months, (words[0].capitalize() if words else None)
+# --
+
+def monthly_totals(store, months, type=None):
+    """ CATEGORIES, MATRIX = MONTHLY_TOTALS(STORE, MONTHS; TYPE)
+
+        Returns the spent CATEGORIES (only TYPE, if given) and a MATRIX (numpy array) with
+        the total of each one (columns) in each of the MONTHS (rows). The totals of a month
+        come from the running totals of the STORE, so the purchases of a month are only read
+        again when it changed.
+    """
+    totals = [dict(store.totals(month)) for month in months]
+
+    categories = sorted(set().union(*totals)) if type is None else [type]
+    with section('numpy'):
+        matrix = np.array([[month.get(category, 0.0) for category in categories] for month in totals],
+                          dtype=float).reshape(len(months), len(categories))
+
+    return categories, matrix
+# --
+
+def trends(matrix):
+    """ TRENDS = TRENDS(MATRIX)
+
+        Computes from a MONTHLY_TOTALS MATRIX a dict of TRENDS: the 'total' spent, the
+        'mean' per month, the 'last' month and its 'change' from the one before (a fraction,
+        None without a previous month or if it had no expenses), the 'slope' of the linear
+        trend (per month) and the total 'by_category'.
+    """
+    with section('numpy'):
+        per_month = matrix.sum(axis=1)
+        previous  = per_month[-2] if len(per_month) > 1 else 0.0
+
+        return {
+            'total':       float(per_month.sum()),
+            'mean':        float(per_month.mean()),
+            'last':        float(per_month[-1]),
+            'change':      float(per_month[-1]/previous-1) if previous else None,
+            'slope':       float(np.polyfit(np.arange(len(per_month)), per_month, 1)[0]) if len(per_month) > 1 else 0.0,
+            'by_category': matrix.sum(axis=0).tolist(),
+        }
+# --
+# ===================
@@ -0,0 +1,260 @@
+# ==== Libraries ====
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import OrderedDict
+
+import metrics
+from fileio import WriteBehind, atomic_write, durable_append
+from purchases import iso_date, month_of
+# ===================
+
+# ==== Global Variables ====
+INDEX_VERSION = 1
+# ==========================
+
+# ==== Functions ====
+def tokenize(text):
+    """ TERMS = TOKENIZE(TEXT)
+
+        Splits TEXT into its search TERMS: lowercase words, without accents.
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    return re.findall(r"\w+", "".join(ch for ch in text if not unicodedata.combining(ch)))
+# --
+
+def as_doc(row):
+    """ DOC = AS_DOC(ROW)
+
+        Returns the purchase ROW (NAME, COST, TYPE, DATE) as an index DOC, with COST as a float
+        (the rows just added to a store carry it as text).
+    """
+    name, cost, type, date = row
+    return (name, float(cost), type, date)
+# --
+
+def _encode(record):
+    # One JSON record per line, so a torn last line (crash mid-append) is detected and dropped
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+# --
+
+def _read_records(path):
+    # Decodes the records of a journal up to the first incomplete or corrupted line (the
+    #   records after it could not be replayed in order anyway)
+    with metrics.section('io'), open(path, "rb") as f:
+        for line in f:
+            try:
+                yield json.loads(line.decode("utf-8"))
+            except ValueError:
+                return
+# --
+# ===================
+
+# ==== Search Index ====
+class SearchIndex(WriteBehind):
+    """ INDEX = SEARCHINDEX(PATH; DELAY)
+
+        Inverted index of the purchases of a chat (their names and categories), saved as JSON
+        in PATH so it is never built again from scratch. It records how many purchases of each
+        month it holds: purchases added through INDEX.ADD are indexed right away, and any other
+        ones found in the store (e.g. the bot stopped before saving the index) are read from
+        there before a query.
+
+        Each save (DELAY seconds after the index changes) appends only the new purchases to a
+        JOURNAL next to PATH; the journal is folded into PATH (written atomically) once it holds
+        more purchases than PATH itself. As in the JobStore, both files carry a generation, and
+        a journal left over from an interrupted compaction is ignored.
+    """
+
+    def __init__(self, path, delay=1.0, journal=None, min_compact=256):
+        WriteBehind.__init__(self, delay)
+        self.path        = path
+        self.journal     = journal or os.path.splitext(path)[0]+".journal"
+        self.min_compact = min_compact
+
+        self._docs       = None     # Purchases (NAME, COST, TYPE, DATE); the id is the position
+        self._postings   = None     # Term ~> sorted list of purchase ids
+        self._indexed    = None     # Month ~> purchases of the month in the index
+        self._terms      = None     # Sorted terms, for the prefix searches (None if outdated)
+        self._saved      = None     # Purchases saved in the files (None: they must be rewritten)
+        self._journaled  = 0        # Purchases in the current journal
+        self._generation = 0
+        self._lock       = threading.RLock()
+
+    def _load(self):
+        # Must be called with the lock held
+        if self._docs is not None:
+            return
+
+        try:
+            with metrics.section('io'), open(self.path, "r") as f:
+                saved = json.load(f)
+            assert saved['version'] == INDEX_VERSION
+            self._docs, self._postings, self._indexed = [as_doc(doc) for doc in saved['docs']], saved['postings'], saved['indexed']
+            self._generation = saved.get('generation', 0)
+
+        except (FileNotFoundError, ValueError, KeyError, AssertionError):
+            self._docs, self._postings, self._indexed = [], {}, {}
+            return
+
+        # Replays the purchases journaled after the index was saved
+        try:
+            records = _read_records(self.journal)
+            if next(records, None) == {'generation': self._generation}:
+                for record in records:
+                    self._index(record['docs'])
+                    self._indexed.update(record['indexed'])
+                    self._journaled += len(record['docs'])
+
+        except FileNotFoundError:
+            pass
+
+        self._saved = len(self._docs)
+
+    def _index(self, rows):
+        # Must be called with the lock held: adds ROWS to the index
+        for row in rows:
+            id = len(self._docs)
+            self._docs.append(as_doc(row))
+            for term in set(tokenize(row[0]) + tokenize(row[2])):
+                self._postings.setdefault(term, []).append(id)
+
+        self._terms = None
+
+    def _catch_up(self, store, month):
+        # Must be called with the lock held: indexes the purchases of MONTH not indexed yet
+        count = store.count(month)
+        if count == self._indexed.get(month, 0):
+            return False
+
+        if count < self._indexed.get(month, 0):     # The month was replaced: everything is indexed again
+            self._docs, self._postings, self._indexed, self._saved = [], {}, {}, None
+            for known in store.months():
+                self._catch_up(store, known)
+            return True
+
+        self._index(store.month(month)[self._indexed.get(month, 0):])
+        self._indexed[month] = count
+        return True
+
+    def add(self, store, rows):
+        """ INDEX.ADD(STORE, ROWS)
+
+            Indexes purchase ROWS (NAME, COST, TYPE, DATE) just added to STORE.
+        """
+        months = OrderedDict()
+        for row in rows:
+            months.setdefault(month_of(row[3]), []).append(row)
+
+        with self._lock:
+            self._load()
+            for month, month_rows in months.items():
+                if self._indexed.get(month, 0) + len(month_rows) == store.count(month):
+                    self._index(month_rows)
+                    self._indexed[month] = self._indexed.get(month, 0) + len(month_rows)
+                else:   # Some other purchases are missing (or these were already indexed)
+                    self._catch_up(store, month)
+
+            self._schedule_flush()
+
+    def query(self, store, text, limit=10):
+        """ MATCHES = INDEX.QUERY(STORE, TEXT; LIMIT)
+
+            Returns the (up to LIMIT) purchases (NAME, COST, TYPE, DATE) of STORE matching the
+            terms of TEXT, the best first. A purchase matches a term if it has a word starting
+            with it; it scores the sum of the weights (IDF) of the terms it matches, and ties
+            are broken by the most recent purchase.
+        """
+        terms = tokenize(text)
+        if not terms:
+            return []
+
+        with self._lock:
+            self._load()
+            if any([self._catch_up(store, month) for month in store.months()]):
+                self._schedule_flush()
+
+            if self._terms is None:
+                self._terms = sorted(self._postings)
+
+            scores = {}
+            for term in set(terms):
+                # Every word starting with the term (the words are sorted, so they are in a row)
+                ids = set()
+                for idx in range(bisect_left(self._terms, term), len(self._terms)):
+                    if not self._terms[idx].startswith(term):
+                        break
+                    ids.update(self._postings[self._terms[idx]])
+
+                weight = math.log(1 + len(self._docs)/len(ids)) if ids else 0.0
+                for id in ids:
+                    scores[id] = scores.get(id, 0.0) + weight
+
+            best = heapq.nlargest(limit, scores, key=lambda id: (scores[id], iso_date(self._docs[id][3]), id))
+            return [self._docs[id] for id in best]
+
+    def snapshot(self):
+        """ DATA = INDEX.SNAPSHOT()
+
+            Returns the DATA to warm up the index after a restart (see RESTORE), or None if it
+            was never loaded.
+        """
+        with self._lock:
+            if self._docs is None:
+                return None
+            return (list(self._docs), {term: list(ids) for term, ids in self._postings.items()}, dict(self._indexed))
+
+    def restore(self, data):
+        """ INDEX.RESTORE(DATA)
+
+            Takes the index of a SNAPSHOT instead of reading its file (if it was not loaded yet).
+            The purchases missing from it are still read from the store before a query.
+        """
+        with self._lock:
+            if self._docs is None:
+                docs, self._postings, self._indexed = data
+                self._docs, self._saved = [as_doc(doc) for doc in docs], None    # Unknown to the files
+
+    def flush(self):
+        """ INDEX.FLUSH()
+
+            Saves the index right away, if it changed since the last save.
+        """
+        with self._lock:
+            if not self._flush_due():
+                return
+
+            if self._saved is None:
+                self._compact()
+                return
+
+            new = self._docs[self._saved:]
+            durable_append(self.journal, _encode({'indexed': self._indexed, 'docs': new}),
+                           header=_encode({'generation': self._generation}))
+            self._saved      = len(self._docs)
+            self._journaled += len(new)
+
+            if self._journaled > max(self.min_compact, self._saved-self._journaled):
+                self._compact()
+
+    def _compact(self):
+        # Must be called with the lock held: writes the whole index as a new generation, then
+        #   starts a new journal
+        generation = self._generation+1
+        data = {'version': INDEX_VERSION, 'generation': generation, 'indexed': self._indexed,
+                'docs': self._docs, 'postings': self._postings}
+
+        with metrics.section('io'):
+            atomic_write(self.path, json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+            atomic_write(self.journal, _encode({'generation': generation}))
+
+        self._generation = generation
+        self._saved      = len(self._docs)
+        self._journaled  = 0
+# --
+# ===================
@@ -0,0 +1,72 @@
+# ==== Libraries ====
+from queue import Full, Queue
+
+from telegram.ext import Dispatcher, JobQueue, Updater
+from tornado.web import HTTPError
+
+from conf.settings import (SERVE_MODE, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL,
+                           UPDATE_QUEUE_SIZE)
+from metrics import count
+# ===================
+
+# ==== Update Queue ====
+class BoundedUpdateQueue(Queue):
+    """ QUEUE = BOUNDEDUPDATEQUEUE(MAXSIZE)
+
+        Update queue holding at most MAXSIZE updates. A PUT never waits: it runs inside the
+        webhook request handler, so waiting would freeze the IOLoop of the web server. When
+        the queue is full the request fails right away with a 503 status (counted as a
+        'queue_full' event of the 'webhook' metrics) and Telegram delivers that update again
+        later, instead of the bot piling up an unbounded backlog.
+    """
+
+    def put(self, item, block=True, timeout=None):
+        try:
+            super().put(item, block=False)
+        except Full:
+            count('webhook', 'queue_full')
+            raise HTTPError(503, "update queue is full")
+# --
+# ===================
+
+# ==== Functions ====
+def build_updater(bot):
+    """ UPDATER = BUILD_UPDATER(BOT)
+
+        Creates the UPDATER for the SERVE_MODE setting. In 'webhook' mode its dispatcher reads
+        from a BOUNDEDUPDATEQUEUE (WEBHOOK_URL must be set, or ValueError is raised); in
+        'polling' mode the polling thread itself waits for the
+        dispatcher, so the default queue is kept.
+    """
+    if SERVE_MODE != 'webhook':
+        return Updater(bot=bot, use_context=True)
+
+    # Telegram could never deliver the updates, so the bot would silently receive nothing
+    if not WEBHOOK_URL:
+        raise ValueError("SERVE_MODE=webhook needs the public WEBHOOK_URL of the bot")
+
+    job_queue  = JobQueue()
+    dispatcher = Dispatcher(bot, BoundedUpdateQueue(UPDATE_QUEUE_SIZE),
+                            job_queue=job_queue, use_context=True)
+    job_queue.set_dispatcher(dispatcher)
+
+    return Updater(dispatcher=dispatcher, workers=None, use_context=True)
+# --
+
+def start_updater(updater):
+    """ START_UPDATER(UPDATER)
+
+        Starts receiving updates. In 'webhook' mode a plain HTTP server listens on
+        WEBHOOK_LISTEN:WEBHOOK_PORT/WEBHOOK_PATH (TLS is terminated by a reverse proxy in front
+        of it) and Telegram is told to deliver the updates to WEBHOOK_URL.
+    """
+    if SERVE_MODE != 'webhook':
+        updater.start_polling()
+        return
+
+    updater.start_webhook(listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT, url_path=WEBHOOK_PATH)
+
+    # Without a certificate the library does not register the webhook by itself
+    updater.bot.set_webhook(url=WEBHOOK_URL)
+# --
+# ===================
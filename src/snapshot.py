@@ -0,0 +1,63 @@
+# ==== Libraries ====
+import pickle
+import traceback
+from time import time
+
+import metrics
+from chats import CHATS
+from fileio import atomic_write
+from photos import DOGS
+from render import RENDERS
+# ===================
+
+# ==== Global Variables ====
+SNAPSHOT_FILE    = "tmp/warm.snapshot"
+SNAPSHOT_VERSION = 1    # Snapshots of another version are ignored
+# ==========================
+
+# ==== Functions ====
+def save_snapshot(path=SNAPSHOT_FILE):
+    """ SAVE_SNAPSHOT(PATH)
+
+        Writes (atomically, as a single file in PATH) a snapshot of the in-memory state of the
+        bot: the data of every chat (state, budgets, missing itens, running totals and search
+        index), the listing of the pictures and the render cache. The pending changes of the
+        chats are written first, so the snapshot never holds anything their files do not.
+        The jobs are not included, since the JobStore already keeps them.
+    """
+    CHATS.flush()
+
+    data = {'version': SNAPSHOT_VERSION, 'time': time(),
+            'chats': CHATS.snapshot(), 'dogs': DOGS.snapshot(), 'renders': RENDERS.snapshot()}
+
+    with metrics.section('io'):
+        atomic_write(path, pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+# --
+
+def load_snapshot(path=SNAPSHOT_FILE):
+    """ OK = LOAD_SNAPSHOT(PATH)
+
+        Warms up the in-memory state of the bot with the snapshot in PATH, read at once. Each
+        part is only taken if its source did not change since the snapshot; the others (or all
+        of them, without a valid snapshot) are read from their files when first used, as usual.
+        Returns whether the snapshot was loaded.
+    """
+    try:
+        with metrics.section('io'), open(path, 'rb') as f:
+            data = pickle.loads(f.read())
+        assert data['version'] == SNAPSHOT_VERSION
+
+    except (FileNotFoundError, AssertionError):
+        return False
+
+    except Exception:   # Broken, or written by another version of the code
+        traceback.print_exc()
+        return False
+
+    CHATS.restore(data['chats'])
+    DOGS.restore(data['dogs'])
+    RENDERS.restore(data['renders'])
+
+    return True
+# --
+# ===================
@@ -0,0 +1,61 @@
+# ==== Libraries ====
+import json
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import perf_counter, time
+
+from fileio import durable_append
+# ===================
+
+# ==== Global Variables ====
+STARTUP_LOG = "tmp/startup.log"
+# ==========================
+
+# ==== Startup Timer ====
+class StartupTimer:
+    """ TIMER = STARTUPTIMER()
+
+        Measures how long each phase of the bot startup takes (config, imports, handler
+        registration, ...), counting from the creation of the TIMER.
+    """
+
+    def __init__(self):
+        self.t0     = perf_counter()
+        self.phases = OrderedDict()
+
+    @contextmanager
+    def phase(self, name):
+        """ with TIMER.PHASE(NAME): ...
+
+            Adds the time spent inside the block to the phase NAME.
+        """
+        t = perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + perf_counter()-t
+
+    def report(self, path=STARTUP_LOG):
+        """ TEXT = TIMER.REPORT(PATH)
+
+            Returns a one-line TEXT with the duration of every phase, and appends the same data
+            (as a JSON line) to the file in PATH, so restart latency can be tracked over time.
+        """
+        total = perf_counter()-self.t0
+        text  = "Startup took {0:.3f}s (".format(total) + ", ".join(
+                    "{0}: {1:.3f}s".format(name, secs) for name, secs in self.phases.items()) + ")"
+
+        record = OrderedDict(time=time(), total=total, **self.phases)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            durable_append(path, (json.dumps(record)+"\n").encode("utf-8"))
+        except OSError:
+            pass    # The report is informative, it never stops the bot
+
+        return text
+# --
+
+STARTUP = StartupTimer()
+# --
+# ===================
@@ -0,0 +1,62 @@
+# ==== Libraries ====
+import json
+import threading
+
+import metrics
+from fileio import FileCache, atomic_write
+# ===================
+
+# ==== State Store ====
+class StateStore(FileCache):
+    """ STATE = STATESTORE(PATH; DEFAULTS)
+
+        The small key-value state of a chat (e.g. its AGUA status and price), saved as JSON
+        in PATH. It is read once and kept in memory, and every change is written through
+        (atomically) right away, so reading a key never touches the disk. Keys never set
+        take their value from the DEFAULTS dict.
+    """
+
+    _CACHE = '_values'
+
+    def __init__(self, path, defaults=None):
+        self.path     = path
+        self.defaults = dict(defaults or {})
+
+        self._values = None
+        self._lock   = threading.Lock()
+
+    def _load(self):
+        # Must be called with the lock held
+        if self._values is None:
+            try:
+                with metrics.section('io'), open(self.path, "r") as f:
+                    self._values = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._values = {}
+
+        return self._values
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._load()
+
+    def get(self, key):
+        """ VALUE = STATE.GET(KEY)
+
+            Returns the VALUE of KEY (its default, if it was never set).
+        """
+        with self._lock:
+            return self._load().get(key, self.defaults.get(key))
+
+    def set(self, **values):
+        """ STATE.SET(**VALUES)
+
+            Changes (and saves, in a single write) the VALUES of one or more keys.
+        """
+        with self._lock:
+            changed = dict(self._load(), **values)
+            with metrics.section('io'):
+                atomic_write(self.path, json.dumps(changed, indent=1, sort_keys=True).encode("utf-8"))
+            self._values = changed
+# --
+# ===================